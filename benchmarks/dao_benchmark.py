@@ -0,0 +1,271 @@
+"""
+DAO 和表格渲染的性能基准测试,使用临时目录中的 sqlite 数据库代替 MySQL。
+
+按给定数量写入零件和操作日志后,对每项操作重复计时,结果写入 JSON 文件,
+并与保存的基线比较: 中位数比基线慢超过阈值的项目视为性能回退,退出码为 1。
+
+用法: python benchmarks/dao_benchmark.py [--parts 20000] [--logs 100000] [--repeat 5]
+                                         [--output result.json] [--baseline benchmarks/baseline.json]
+                                         [--threshold 0.25] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+NAME_CHARS = '轴承齿轮螺栓垫片法兰套筒弹簧支架壳体端盖连杆销键衬板密封圈导轨滑块电机阀座'
+OPERATION_TYPES = ['入库', '出库', '修改']
+
+
+def prepare_database(directory):
+    """
+    在临时目录中写入使用 sqlite 数据库的 config.ini 并切换工作目录,慢语句日志也写在临时目录中
+    :return: 配置文件路径
+    """
+    path = os.path.join(directory, 'bench.db')
+    config_path = os.path.join(directory, 'config.ini')
+    with open(config_path, 'w', encoding='utf-8') as file:
+        file.write(f'[Database]\ndb_url = sqlite:///{path}\n')
+    os.chdir(directory)
+    return config_path
+
+
+def create_tables(engine):
+    # 与程序启动时相同,由数据库升级创建全部表和索引
+    import migrations
+    migrations.upgrade(engine)
+
+
+def seed(engine, part_count, log_count, rng):
+    import search_index
+    from sqlalchemy.orm import Session
+    from data_model import Part, OperationLog
+    today = date.today()
+    drawing_numbers = [f'{rng.choice("ABCDEFGH")}{rng.randint(100, 999)}-{i:06d}' for i in range(part_count)]
+    parts = [{
+        Part.no.name: i,
+        Part.product_drawing_number.name: drawing_number,
+        Part.name.name: ''.join(rng.choice(NAME_CHARS) for _ in range(rng.randint(2, 6))),
+        Part.inventory_quantity.name: rng.randint(0, 500),
+        Part.a_group_total.name: 0,
+        Part.b_group_total.name: 0,
+        Part.quantity_per_carton.name: rng.choice([10, 20, 50]),
+        Part.update_time.name: today - timedelta(days=rng.randint(0, 365)),
+        Part.id.name: f'{i:035d}',
+    } for i, drawing_number in enumerate(drawing_numbers)]
+    logs = [{
+        OperationLog.time.name: today - timedelta(days=rng.randint(0, 365)),
+        OperationLog.product_drawing_number.name: rng.choice(drawing_numbers),
+        OperationLog.operator_type.name: rng.choice(OPERATION_TYPES),
+        OperationLog.operator_fields.name: Part.inventory_quantity.name,
+        OperationLog.value_before_change.name: str(rng.randint(0, 500)),
+        OperationLog.changed_value.name: str(rng.randint(0, 500)),
+    } for _ in range(log_count)]
+    with Session(engine) as session:
+        session.execute(Part.__table__.insert(), parts)
+        session.execute(OperationLog.__table__.insert(), logs)
+        search_index.rebuild(session)
+        session.commit()
+    return drawing_numbers
+
+
+def timed(fn, repeat, setup=None):
+    """
+    :param setup: 每次计时前执行,不计入耗时
+    :return: 每次耗时(秒)列表
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(args, config_path):
+    import data_dao
+    from data_dao import PartDAO, OperationLogDAO
+    data_dao.init(config_path)
+    rng = random.Random(args.seed)
+
+    create_tables(data_dao.engine)
+    start = time.perf_counter()
+    drawing_numbers = seed(data_dao.engine, args.parts, args.logs, rng)
+    print(f'写入 {args.parts} 个零件、{args.logs} 条操作日志: {time.perf_counter() - start:.2f}s')
+
+    part_dao = PartDAO()
+    log_dao = OperationLogDAO()
+    results = {}
+
+    def record(name, timings):
+        results[name] = {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'max': max(timings),
+            'repeat': len(timings),
+        }
+        print(f'{name:<40}{results[name]["median"] * 1000:>12.2f} ms')
+
+    lookups = rng.sample(drawing_numbers, min(args.batch, len(drawing_numbers)))
+    batch = rng.sample(drawing_numbers, min(args.batch, len(drawing_numbers)))
+
+    record('query_all_data', timed(part_dao.query_all_data, args.repeat))
+    record('query_data_by_condition.name', timed(lambda: part_dao.query_data_by_condition(name='轴承'), args.repeat))
+    record('query_data_by_condition.drawing_number',
+           timed(lambda: part_dao.query_data_by_condition(drawing_number='C45'), args.repeat))
+    record('query_after.first_page', timed(lambda: part_dao.query_after(None), args.repeat))
+    record('point_lookup.cold', timed(lambda: [part_dao.get_part_by_drawing_number(dn) for dn in lookups],
+                                      args.repeat, setup=data_dao.part_cache.clear))
+    record('point_lookup.warm', timed(lambda: [part_dao.get_part_by_drawing_number(dn) for dn in lookups],
+                                      args.repeat))
+    record('query_logs.first_page', timed(lambda: log_dao.query_logs(rng.choice(drawing_numbers)), args.repeat))
+    record('batch_in', timed(lambda: part_dao.adjust_quantities({dn: 5 for dn in batch}), args.repeat))
+    record('batch_out', timed(lambda: part_dao.adjust_quantities({dn: -5 for dn in batch}), args.repeat))
+
+    # 批量删除后把零件重新写回,下一次计时删除同样数量的零件
+    saved = [part_dao.get_part_by_drawing_number(dn) for dn in batch]
+    import part_export
+    restore_rows = [{column: getattr(part, key) for column, key in part_export.PART_COLUMNS} for part in saved]
+    update_columns = [column for column, _ in part_export.PART_COLUMNS]
+    record('batch_delete', timed(lambda: part_dao.batch_delete(batch, None), args.repeat,
+                                 setup=lambda: part_dao.upsert_parts(restore_rows, update_columns)))
+    part_dao.upsert_parts(restore_rows, update_columns)
+    data_dao.audit_writer.flush(30)
+
+    render(args, part_dao, log_dao, drawing_numbers, rng, record)
+    data_dao.shutdown()
+    return results
+
+
+def render(args, part_dao, log_dao, drawing_numbers, rng, record):
+    """
+    在 offscreen 平台下计时表格渲染: 填充模型并处理完绘制事件
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    from widgets.window import Widget
+    from ui_controller import UIController
+
+    app = QApplication.instance() or QApplication([])
+    widget = Widget()
+    controller = UIController(widget)
+    widget.resize(1280, 800)
+    widget.show()
+    app.processEvents()
+
+    parts = part_dao.query_all_data()
+    logs = log_dao.query_logs(limit=args.logs)
+
+    def render_parts():
+        controller.render_table(parts)
+        widget.tableView.viewport().repaint()
+        app.processEvents()
+
+    def render_logs():
+        controller.render_log_table(logs)
+        widget.tableView.viewport().repaint()
+        app.processEvents()
+
+    record('render_table', timed(render_parts, args.repeat))
+    record('render_log_table', timed(render_logs, args.repeat))
+
+    # 全部零件已取回时按库存数量排序: 第一次需要计算排序键,之后使用缓存的排序键
+    from PySide6.QtCore import Qt
+    model = controller.part_model
+    quantity_column = model.FIELDS.index('inventory_quantity')
+    record('sort_table.cold', timed(lambda: model.sort(quantity_column, Qt.DescendingOrder), args.repeat,
+                                    setup=lambda: controller.render_table(parts)))
+    record('sort_table.warm', timed(lambda: model.sort(quantity_column, Qt.DescendingOrder), args.repeat))
+    record('query_after.sorted_page',
+           timed(lambda: part_dao.query_after(None, sort='inventory_quantity', descending=True), args.repeat))
+    widget.close()
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: 回退的项目 [(名称, 基线中位数, 本次中位数)]
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        ratio = result['median'] / expected['median'] if expected['median'] else 1.0
+        flag = '回退' if ratio > 1 + threshold else ''
+        print(f'{name:<40}{expected["median"] * 1000:>12.2f}{result["median"] * 1000:>12.2f}{ratio:>9.2f}x {flag}')
+        if flag:
+            regressions.append((name, expected['median'], result['median']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--parts', type=int, default=20000)
+    parser.add_argument('--logs', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=200, help='点查询、批量出入库和批量删除的零件数')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='结果 JSON 文件,默认不写入')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线 JSON 文件')
+    parser.add_argument('--threshold', type=float, default=0.25, help='中位数超过基线的比例,超过视为回退')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(args, prepare_database(directory))
+
+    document = {
+        'meta': {
+            'parts': args.parts,
+            'logs': args.logs,
+            'batch': args.batch,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(document, file, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as file:
+            json.dump(document, file, ensure_ascii=False, indent=2)
+        print(f'已保存基线 {baseline_path}')
+        return 0
+    if not os.path.exists(baseline_path):
+        print('没有基线文件,跳过比较')
+        return 0
+
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    scale = {key: baseline['meta'].get(key) for key in ('parts', 'logs', 'batch')}
+    if scale != {key: document['meta'][key] for key in scale}:
+        print(f'基线的数据规模 {scale} 与本次不同,跳过比较')
+        return 0
+    print(f'\n{"项目":<38}{"基线(ms)":>12}{"本次(ms)":>12}{"比例":>10}')
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+        print(f'\n{len(regressions)} 项比基线慢超过 {args.threshold:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+搜索索引与 LIKE '%关键字%' 全表扫描的对比测试,使用本地 sqlite 数据库。
+
+用法: python benchmarks/search_benchmark.py [--parts 80000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import search_index  # noqa: E402
+from data_model import Part, PartSearchGram  # noqa: E402
+
+NAME_CHARS = '轴承齿轮螺栓垫片法兰套筒弹簧支架壳体端盖连杆销键衬板密封圈导轨滑块电机阀座'
+
+
+def seed(session, count, rng):
+    parts = []
+    for i in range(count):
+        drawing_number = f'{rng.choice("ABCDEFGH")}{rng.randint(100, 999)}-{i:06d}'
+        name = ''.join(rng.choice(NAME_CHARS) for _ in range(rng.randint(2, 6)))
+        parts.append({
+            Part.product_drawing_number.name: drawing_number,
+            Part.name.name: name,
+            Part.no.name: i,
+            Part.inventory_quantity.name: rng.randint(0, 500),
+            Part.update_time.name: date.today(),
+        })
+    session.execute(Part.__table__.insert(), parts)
+    search_index.rebuild(session)
+    session.commit()
+
+
+def like_query(session, field, term):
+    column = getattr(Part, search_index.FIELD_ATTRIBUTES[field])
+    return session.query(Part.product_drawing_number).filter(column.like(f'%{term}%')).all()
+
+
+def index_query(session, field, term):
+    return session.query(Part.product_drawing_number).filter(search_index.substring_filter(field, term)).all()
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--parts', type=int, default=80000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "bench.db")}')
+        Part.__table__.create(engine)
+        PartSearchGram.__table__.create(engine)
+        with Session(engine) as session:
+            start = time.perf_counter()
+            seed(session, args.parts, rng)
+            print(f'写入 {args.parts} 个零件并建立索引: {time.perf_counter() - start:.2f}s')
+
+            cases = [('d', '-0012'), ('d', 'C45'), ('d', '7'), ('n', '轴承'), ('n', '齿轮螺栓'), ('n', '阀')]
+            print(f'{"字段":<4}{"关键字":<10}{"命中":>8}{"LIKE(ms)":>12}{"索引(ms)":>12}{"加速":>8}')
+            for field, term in cases:
+                like_time, like_rows = timed(lambda: like_query(session, field, term), args.repeat)
+                index_time, index_rows = timed(lambda: index_query(session, field, term), args.repeat)
+                assert sorted(like_rows) == sorted(index_rows), (field, term)
+                print(f'{field:<6}{term:<12}{len(index_rows):>8}{like_time * 1000:>12.2f}{index_time * 1000:>12.2f}'
+                      f'{like_time / index_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+库存服务的吞吐量和延迟测试: 在临时目录中准备 sqlite 数据库,另起进程运行 inventory_service,
+多个线程同时通过 remote_dao 调用服务,与同样数量的线程在本进程中直接调用 PartDAO 比较。
+
+为了让点查询真正访问数据库(体现合并查询的效果),测试时关闭零件缓存。
+
+用法: python benchmarks/service_benchmark.py [--parts 20000] [--clients 8] [--requests 200] [--batch 20]
+"""
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from dao_benchmark import SRC, create_tables, seed
+
+# 等待服务启动的最长秒数
+STARTUP_TIMEOUT = 30
+
+
+def prepare_database(directory):
+    path = os.path.join(directory, 'bench.db')
+    config_path = os.path.join(directory, 'config.ini')
+    with open(config_path, 'w', encoding='utf-8') as file:
+        file.write(f'[Database]\ndb_url = sqlite:///{path}\n\n[Cache]\ncache_size = 0\n')
+    os.chdir(directory)
+    return config_path
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_service(config_path, port):
+    from remote_dao import ServiceClient, ServiceUnavailableError
+    process = subprocess.Popen([sys.executable, os.path.join(SRC, 'inventory_service.py'), '--config', config_path,
+                                '--port', str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = ServiceClient(f'http://127.0.0.1:{port}')
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        try:
+            client.health()
+            return process, client
+        except ServiceUnavailableError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError('库存服务没有启动')
+            time.sleep(0.1)
+
+
+def measure(operation, clients, requests):
+    """
+    clients 个线程各执行 requests 次 operation(线程序号, 随机数生成器)
+    :return: (每秒完成次数, 每次耗时秒数列表)
+    """
+    latencies = [[] for _ in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(index):
+        rng = random.Random(index)
+        barrier.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            operation(index, rng)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings = [latency for items in latencies for latency in items]
+    return len(timings) / elapsed, timings
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def workloads(part_dao, drawing_numbers, batch, client=None):
+    """
+    :return: [(名称, 操作)],操作的参数为 (线程序号, 随机数生成器)
+    """
+    def lookup(index, rng):
+        part_dao.get_part_by_drawing_number(rng.choice(drawing_numbers))
+
+    def page(index, rng):
+        part_dao.query_after(None, 200, name=rng.choice('轴承齿轮螺栓垫片'))
+
+    def move(index, rng):
+        part_dao.move_stock(rng.choice(drawing_numbers), 1)
+
+    def adjust(index, rng):
+        part_dao.adjust_quantities({drawing_number: 1 for drawing_number in rng.sample(drawing_numbers, batch)})
+
+    items = [('点查询', lookup), ('分页查询', page), ('单件出入库', move), (f'批量出入库({batch}个)', adjust)]
+    if client is None:
+        def lookups(index, rng):
+            for drawing_number in rng.sample(drawing_numbers, batch):
+                part_dao.get_part_by_drawing_number(drawing_number)
+    else:
+        def lookups(index, rng):
+            client.batch([('parts', 'get_part_by_drawing_number', [drawing_number], {})
+                          for drawing_number in rng.sample(drawing_numbers, batch)])
+    items.append((f'{batch}个点查询合并为一次请求' if client is not None else f'{batch}个点查询', lookups))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--parts', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=8, help='同时调用的线程数')
+    parser.add_argument('--requests', type=int, default=200, help='每个线程每项调用的次数')
+    parser.add_argument('--batch', type=int, default=20, help='批量出入库和合并请求的零件数')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = prepare_database(directory)
+        import data_dao
+        from data_dao import PartDAO
+        from remote_dao import RemotePartDAO
+        data_dao.init(config_path)
+        create_tables(data_dao.engine)
+        drawing_numbers = seed(data_dao.engine, args.parts, 0, random.Random(args.seed))
+        print(f'写入 {args.parts} 个零件,{args.clients} 个线程,每项每线程 {args.requests} 次')
+
+        process, client = start_service(config_path, free_port())
+        try:
+            modes = [('直接连接', workloads(PartDAO(), drawing_numbers, args.batch)),
+                     ('库存服务', workloads(RemotePartDAO(client), drawing_numbers, args.batch, client))]
+            print(f'\n{"项目":<28}{"方式":<8}{"次/秒":>10}{"p50(ms)":>10}{"p95(ms)":>10}{"p99(ms)":>10}')
+            for mode, items in modes:
+                for name, operation in items:
+                    throughput, timings = measure(operation, args.clients, args.requests)
+                    print(f'{name:<28}{mode:<8}{throughput:>10.0f}{statistics.median(timings) * 1000:>10.2f}'
+                          f'{percentile(timings, 0.95) * 1000:>10.2f}{percentile(timings, 0.99) * 1000:>10.2f}')
+            health = client.health()
+            print(f'\n服务: {health["calls"]} 次调用,点查询 {health["batched_lookups"]} 次合并为 '
+                  f'{health["lookup_queries"]} 条查询,数据库连接 {health["pool"]["connects"]} 个')
+        finally:
+            process.terminate()
+            process.wait()
+            data_dao.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
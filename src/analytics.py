@@ -0,0 +1,282 @@
+"""
+库存变动统计: 库存变化趋势、每日出入库、周转率、1组/2组占比。
+
+操作日志先按天、按零件汇总到 daily_movement 表,已处理到的日志序号记录在 analytics_watermark 表中,
+再次汇总时只读取序号更大的新日志; 多个终端的日志写入线程并发提交,较小的序号可能晚于较大的序号出现,
+汇总时跳过的序号记入 analytics_gap 表,之后的汇总继续读取,超过 GAP_TIMEOUT 秒仍未出现的不再等待。
+汇总表和水位行由数据库升级(migrations.py 的 7、10、11)创建,报表不执行 DDL,升级尚未执行时直接报错。
+报表查询只读汇总表和库存表,计算全部用 pandas 按列向量化完成。
+库存变化趋势用当前库存减去之后每天的净变化倒推,早于操作日志启用时间的变化无法还原。
+
+用法: python analytics.py --refresh    汇总新的操作日志
+"""
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, delete, func
+
+import audit_log
+from data_model import Part, OperationLog, DailyMovement, AnalyticsWatermark, AnalyticsGap
+
+# 每次汇总读取的日志条数,控制内存占用
+REFRESH_CHUNK_SIZE = 50000
+# 跳过的日志序号最多等待的秒数,在此之后的第一次汇总仍会再读取一次
+GAP_TIMEOUT = 600
+WATERMARK_NAME = DailyMovement.__tablename__
+# 汇总依赖的数据库升级版本: 汇总表和水位表、日志空缺表、水位行
+REQUIRED_MIGRATIONS = {7, 10, 11}
+
+_QUANTITY_FIELD = Part.inventory_quantity.name
+# DataFrame 列名使用数据库列名
+DAY = DailyMovement.day.name
+DRAWING_NUMBER = DailyMovement.product_drawing_number.name
+INBOUND = DailyMovement.inbound.name
+OUTBOUND = DailyMovement.outbound.name
+NET_CHANGE = DailyMovement.net_change.name
+OPERATIONS = DailyMovement.operations.name
+NAME = Part.name.name
+QUANTITY = Part.inventory_quantity.name
+A_GROUP = Part.a_group_total.name
+B_GROUP = Part.b_group_total.name
+_SUMMARY_COLUMNS = [INBOUND, OUTBOUND, NET_CHANGE, OPERATIONS]
+
+_refresh_lock = threading.Lock()
+_schema_ready = False
+
+
+def _session_scope():
+    # 延迟导入,避免仅计算报表时在导入阶段连接数据库
+    from data_dao import session_scope
+    return session_scope()
+
+
+def check_schema():
+    """
+    检查汇总需要的数据库升级是否都已执行,每个进程只检查一次
+    :raises RuntimeError: 升级尚未执行
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    import migrations
+    missing = [f'{version} {description}' for version, description in migrations.pending()
+               if version in REQUIRED_MIGRATIONS]
+    if missing:
+        raise RuntimeError(f"库存变动汇总需要的数据库升级尚未执行({', '.join(missing)}),"
+                           f"请先在 src 目录下执行 python migrations.py")
+    _schema_ready = True
+
+
+def movement_frame(logs):
+    """
+    把操作日志转换为按 (日期, 图号) 汇总的库存变动
+    :param logs: 操作日志 DataFrame,列为数据库列名
+    """
+    quantity_change = logs[OperationLog.operator_fields.name] == _QUANTITY_FIELD
+    before = pd.to_numeric(logs[OperationLog.value_before_change.name], errors='coerce')
+    after = pd.to_numeric(logs[OperationLog.changed_value.name], errors='coerce')
+    # 新增没有更改前值、删除没有更改后值,按 0 计算
+    delta = (after.fillna(0) - before.fillna(0)).where(quantity_change & (before.notna() | after.notna()), 0)
+    operator_type = logs[OperationLog.operator_type.name]
+    frame = pd.DataFrame({
+        DAY: logs[OperationLog.time.name],
+        DRAWING_NUMBER: logs[OperationLog.product_drawing_number.name],
+        INBOUND: delta.clip(lower=0).where(operator_type == audit_log.OPERATION_IN_STOCK, 0),
+        OUTBOUND: (-delta).clip(lower=0).where(operator_type == audit_log.OPERATION_OUT_STOCK, 0),
+        NET_CHANGE: delta,
+        OPERATIONS: 1,
+    })
+    frame = frame.dropna(subset=[DAY])
+    return frame.groupby([DAY, DRAWING_NUMBER], as_index=False)[_SUMMARY_COLUMNS].sum()
+
+
+def _records(frame):
+    # 转为 Python 原生类型,部分数据库驱动不接受 numpy 整数
+    frame = frame.astype({column: 'int64' for column in _SUMMARY_COLUMNS}).astype(object)
+    return frame.to_dict('records')
+
+
+def _refresh_chunk(session, chunk_size):
+    """
+    汇总一批新日志,返回处理的日志条数
+    """
+    # 水位行由升级步骤 11 创建,锁住这一行让多个终端的汇总依次进行
+    watermark = session.get(AnalyticsWatermark, WATERMARK_NAME, with_for_update=True)
+    if watermark is None:
+        raise RuntimeError(f'analytics_watermark 中没有 {WATERMARK_NAME} 的水位,'
+                           f'请先在 src 目录下执行 python migrations.py')
+    gaps = dict(session.execute(select(AnalyticsGap.log_id, AnalyticsGap.found_time)
+                                .where(AnalyticsGap.name == WATERMARK_NAME)).all())
+    condition = OperationLog.id > watermark.last_log_id
+    if gaps:
+        condition = condition | OperationLog.id.in_(list(gaps))
+    logs = pd.read_sql(select(OperationLog.__table__)
+                       .where(condition)
+                       .order_by(OperationLog.id)
+                       .limit(chunk_size), session.connection())
+    _update_gaps(session, watermark.last_log_id, gaps, set(logs[OperationLog.id.name].astype(int)), chunk_size)
+    if logs.empty:
+        return 0
+    movements = movement_frame(logs)
+    if not movements.empty:
+        # 与汇总表中受影响日期之后的已有数据合并后整体重写
+        first_day = movements[DAY].min()
+        table = DailyMovement.__table__
+        existing = pd.read_sql(select(table).where(DailyMovement.day >= first_day), session.connection())
+        merged = (pd.concat([existing, movements], ignore_index=True)
+                  .groupby([DAY, DRAWING_NUMBER], as_index=False)[_SUMMARY_COLUMNS].sum())
+        session.execute(delete(table).where(DailyMovement.day >= first_day))
+        session.execute(insert(table), _records(merged))
+    watermark.last_log_id = max(watermark.last_log_id, int(logs[OperationLog.id.name].max()))
+    return len(logs)
+
+
+def _update_gaps(session, watermark, gaps, seen, chunk_size):
+    """
+    删除已读到或等待超时的空缺,记录水位与本批最大序号之间新跳过的序号。
+    跳过的序号多于一批日志时(多半是删除了一段日志)不再记录
+    """
+    now = datetime.now()
+    expired = now - timedelta(seconds=GAP_TIMEOUT)
+    closed = [log_id for log_id, found_time in gaps.items() if log_id in seen or found_time < expired]
+    if closed:
+        session.execute(delete(AnalyticsGap.__table__).where(AnalyticsGap.name == WATERMARK_NAME,
+                                                             AnalyticsGap.log_id.in_(closed)))
+    newer = [log_id for log_id in seen if log_id > watermark]
+    if not newer:
+        return
+    missing = [log_id for log_id in range(watermark + 1, max(newer)) if log_id not in seen]
+    if missing and len(missing) <= chunk_size:
+        session.execute(insert(AnalyticsGap.__table__), [
+            {AnalyticsGap.name.name: WATERMARK_NAME, AnalyticsGap.log_id.name: log_id,
+             AnalyticsGap.found_time.name: now} for log_id in missing])
+
+
+def refresh(chunk_size=REFRESH_CHUNK_SIZE):
+    """
+    把上次汇总之后的新操作日志汇总到 daily_movement,返回本次处理的日志条数。
+    每批日志和水位在同一事务中提交,中途失败不会重复计算
+    """
+    check_schema()
+    total = 0
+    with _refresh_lock:
+        while True:
+            with _session_scope() as session:
+                count = _refresh_chunk(session, chunk_size)
+            total += count
+            if count < chunk_size:
+                return total
+
+
+def _daily_totals(session, start, end, drawing_number=None):
+    """
+    按天汇总 [start, end] 内的变动,在数据库中完成分组,没有变动的日期补 0
+    """
+    query = (select(DailyMovement.day, *[func.sum(getattr(DailyMovement, attribute)).label(column)
+                                         for attribute, column in (('inbound', INBOUND), ('outbound', OUTBOUND),
+                                                                   ('net_change', NET_CHANGE),
+                                                                   ('operations', OPERATIONS))])
+             .where(DailyMovement.day >= start, DailyMovement.day <= end)
+             .group_by(DailyMovement.day))
+    if drawing_number:
+        query = query.where(DailyMovement.product_drawing_number == drawing_number)
+    frame = pd.read_sql(query, session.connection(), index_col=DAY)
+    frame.index = pd.to_datetime(frame.index)
+    return frame.reindex(pd.date_range(start, end, name=DAY), fill_value=0).astype('int64')
+
+
+def daily_movements(start, end, drawing_number=None):
+    """
+    每日入库、出库和净变化
+    :param drawing_number: 为空时统计全部零件
+    """
+    with _session_scope() as session:
+        return _daily_totals(session, start, end, drawing_number)
+
+
+def stock_over_time(start, end, drawing_number=None):
+    """
+    每天结束时的库存数量: 当前库存减去该日之后(直到今天)的净变化之和
+    """
+    today = max(date.today(), end)
+    with _session_scope() as session:
+        current = select(func.coalesce(func.sum(Part.inventory_quantity), 0))
+        if drawing_number:
+            current = current.where(Part.product_drawing_number == drawing_number)
+        current = session.execute(current).scalar()
+        net = _daily_totals(session, start, today, drawing_number)[NET_CHANGE]
+    # 每天之后的净变化之和 = 倒序累加后错开一天
+    later_changes = net[::-1].cumsum()[::-1].shift(-1, fill_value=0)
+    period = slice(pd.Timestamp(start), pd.Timestamp(end))
+    return pd.DataFrame({QUANTITY: (current - later_changes).loc[period], NET_CHANGE: net.loc[period]})
+
+
+def turnover(start, end):
+    """
+    每个零件在 [start, end] 内的出库量、平均库存、周转率(出库量 / 平均库存)和周转天数。
+    第 d 天结束时库存 = 当前库存 - d 之后的净变化,求平均时某天的净变化对其之前每一天都生效,
+    因此按每条汇总记录在区间内生效的天数加权求和即可,不需要展开成 零件 x 天 的矩阵
+    """
+    days = (end - start).days + 1
+    with _session_scope() as session:
+        parts = pd.read_sql(select(Part.product_drawing_number, Part.name, Part.inventory_quantity),
+                            session.connection())
+        movements = pd.read_sql(select(DailyMovement.day, DailyMovement.product_drawing_number,
+                                       DailyMovement.outbound, DailyMovement.net_change)
+                                .where(DailyMovement.day >= start), session.connection())
+    offsets = (pd.to_datetime(movements[DAY]) - pd.Timestamp(start)).dt.days.to_numpy()
+    weights = np.clip(offsets, 0, days)
+    in_range = offsets <= days - 1
+    movements = movements.assign(
+        weighted_change=movements[NET_CHANGE].to_numpy() * weights,
+        period_outbound=np.where(in_range, movements[OUTBOUND].to_numpy(), 0),
+    )
+    per_part = movements.groupby(DRAWING_NUMBER)[['weighted_change', 'period_outbound']].sum()
+
+    report = parts.set_index(DRAWING_NUMBER).join(per_part).fillna({'weighted_change': 0, 'period_outbound': 0})
+    average = report[QUANTITY].fillna(0) - report['weighted_change'] / days
+    rate = report['period_outbound'] / average.where(average > 0)
+    report = pd.DataFrame({
+        NAME: report[NAME],
+        QUANTITY: report[QUANTITY],
+        OUTBOUND: report['period_outbound'].astype('int64'),
+        '平均库存': average.round(2),
+        '周转率': rate.round(4),
+        '周转天数': (days / rate.where(rate > 0)).round(1),
+    })
+    return report.sort_values('周转率', ascending=False, na_position='last')
+
+
+def group_split():
+    """
+    每个零件 1组/2组 数量及占比,第一行为全部零件合计
+    """
+    with _session_scope() as session:
+        parts = pd.read_sql(select(Part.product_drawing_number, Part.name, Part.inventory_quantity,
+                                   Part.a_group_total, Part.b_group_total), session.connection(),
+                            index_col=DRAWING_NUMBER)
+    numbers = parts[[QUANTITY, A_GROUP, B_GROUP]].fillna(0).astype('int64')
+    totals = numbers.sum().to_frame('合计').T
+    numbers = pd.concat([totals, numbers])
+    grouped = numbers[A_GROUP] + numbers[B_GROUP]
+    report = numbers.assign(**{
+        '未分组': numbers[QUANTITY] - grouped,
+        '1组占比': (numbers[A_GROUP] / grouped.where(grouped > 0)).round(4),
+        '2组占比': (numbers[B_GROUP] / grouped.where(grouped > 0)).round(4),
+    })
+    report.insert(0, NAME, parts[NAME].reindex(report.index))
+    report.index.name = DRAWING_NUMBER
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='库存变动统计')
+    parser.add_argument('--refresh', action='store_true', help='汇总新的操作日志')
+    args = parser.parse_args()
+    if args.refresh:
+        print(f'已汇总 {refresh()} 条操作日志')
+    else:
+        parser.print_help()
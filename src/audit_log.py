@@ -0,0 +1,201 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import date
+
+from sqlalchemy import insert
+
+from data_model import OperationLog
+
+logger = logging.getLogger(__name__)
+
+# 操作类型
+OPERATION_ADD = '新增'
+OPERATION_DELETE = '删除'
+OPERATION_UPDATE = '修改'
+OPERATION_IN_STOCK = '入库'
+OPERATION_OUT_STOCK = '出库'
+
+_table = OperationLog.__table__
+_COLUMNS = {
+    'time': OperationLog.time.name,
+    'product_drawing_number': OperationLog.product_drawing_number.name,
+    'operator_type': OperationLog.operator_type.name,
+    'operator_fields': OperationLog.operator_fields.name,
+    'value_before_change': OperationLog.value_before_change.name,
+    'changed_value': OperationLog.changed_value.name,
+}
+# 更改前值/更改后值列的长度
+_VALUE_LENGTH = OperationLog.value_before_change.type.length
+
+
+def _value(value):
+    return None if value is None else str(value)[:_VALUE_LENGTH]
+
+
+class AuditLogWriter:
+    """
+    操作日志后台写入器: 调用方把日志放入有界队列后立即返回,后台线程攒够 batch_size 条
+    或距第一条等待超过 flush_interval 秒时一次性批量插入。
+    队列满时一次 record_many 最多共阻塞 put_timeout 秒等待写入线程消化(调用方通常是界面线程),
+    超时后剩余的日志丢弃并计数。
+    程序退出时写完队列中剩余的日志
+    """
+
+    def __init__(self, session_factory, batch_size=200, flush_interval=0.5, max_queue=10000, put_timeout=1.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def record(self, drawing_number, operator_type, operator_fields, before, after):
+        """
+        记录一条操作日志
+        """
+        self.record_many([(drawing_number, operator_type, operator_fields, before, after)])
+
+    def record_many(self, entries):
+        """
+        :param entries: [(图号, 操作类型, 操作字段, 更改前值, 更改后值)]
+        """
+        if self._thread is None:
+            self.start()
+        today = date.today()
+        deadline = time.monotonic() + self.put_timeout
+        dropped = 0
+        for drawing_number, operator_type, operator_fields, before, after in entries:
+            row = {
+                _COLUMNS['time']: today,
+                _COLUMNS['product_drawing_number']: drawing_number,
+                _COLUMNS['operator_type']: operator_type,
+                _COLUMNS['operator_fields']: operator_fields,
+                _COLUMNS['value_before_change']: _value(before),
+                _COLUMNS['changed_value']: _value(after),
+            }
+            # 整批共用一个等待期限,期限过后不再阻塞
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    self._queue.put(row, timeout=remaining)
+                else:
+                    self._queue.put_nowait(row)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            self.dropped += dropped
+            logger.warning('操作日志队列已满,丢弃 %d 条日志', dropped)
+
+    def flush(self, timeout=None):
+        """
+        等待队列中已有的日志全部写入
+        """
+        if self._thread is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+
+    def close(self, timeout=10.0):
+        """
+        写完剩余日志并停止后台线程
+        """
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        atexit.unregister(self.close)
+
+    def statistics(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failures': self.failures,
+        }
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            elif self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _next_batch(self):
+        """
+        阻塞等待第一条日志,然后在 flush_interval 内尽量凑满一批
+        """
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if self._stopping.is_set():
+                remaining = 0
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        for attempt in range(2):
+            error = self._insert(batch)
+            if error is None:
+                self.written += len(batch)
+                self.batches += 1
+                return
+            if attempt == 0:
+                time.sleep(0.5)
+        logger.error('批量写入 %d 条操作日志失败,改为逐条写入: %s', len(batch), error)
+        # 个别出错的日志不影响同一批中的其他日志
+        for row in batch:
+            error = self._insert([row])
+            if error is None:
+                self.written += 1
+            else:
+                self.failures += 1
+                logger.error('写入操作日志失败: %s, %s', row, error)
+        self.batches += 1
+
+    def _insert(self, rows):
+        """
+        :return: 写入失败时的异常,成功时为 None
+        """
+        session = self.session_factory()
+        try:
+            session.execute(insert(_table), rows)
+            session.commit()
+            return None
+        except Exception as e:
+            session.rollback()
+            return e
+        finally:
+            session.close()
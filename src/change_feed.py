@@ -0,0 +1,84 @@
+"""
+按变更记录轮询其他终端对零件的修改。
+
+每个终端记住已处理到的变更序号(水位),轮询时只读取序号更大的记录,再按图号读取变化的零件,
+一次轮询的开销与期间的修改数量有关,与零件总数无关。
+自增序号在插入时分配、在提交时才可见,较小的序号可能晚于较大的序号提交: 轮询时跳过的序号记为空缺,
+之后的轮询继续读取这些序号,超过 gap_timeout 秒仍未出现的空缺(回滚的事务)不再等待。
+"""
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import audit_log
+from data_dao import PartDAO, ChangeFeedDAO, FEED_BATCH_SIZE, part_cache
+
+# parts: 新增或修改后的零件; deleted: 被删除的图号; reload: 变更记录不连续(清理过或空缺太多),需要重新查询
+Changes = namedtuple('Changes', ['parts', 'deleted', 'reload'])
+NO_CHANGES = Changes([], [], False)
+
+
+class ChangePoller:
+    """
+    :param gap_timeout: 空缺序号最多等待的秒数
+    :param limit: 每次轮询最多读取的变更记录条数,更多的记录留给下一次轮询
+    """
+
+    def __init__(self, feed_dao=None, part_dao=None, gap_timeout=60.0, limit=FEED_BATCH_SIZE):
+        self.feed_dao = feed_dao or ChangeFeedDAO()
+        self.part_dao = part_dao or PartDAO()
+        self.gap_timeout = gap_timeout
+        self.limit = limit
+        self.watermark = None  # 已处理的最大序号,尚未读取时为 None
+        self._gaps = {}  # 空缺的序号 -> 发现的时间
+
+    def reset(self, retention_days=None):
+        """
+        从当前最新的变更开始轮询,retention_days 不为空时先清理更早的变更记录
+        """
+        if retention_days:
+            self.feed_dao.prune(datetime.now() - timedelta(days=retention_days))
+        self.watermark = self.feed_dao.latest_seq()
+        self._gaps.clear()
+
+    def poll(self):
+        """
+        读取水位之后的变更,每个图号只取最后一次操作,返回变化的零件;在后台线程调用
+        :return: Changes
+        """
+        if self.watermark is None:
+            self.reset()
+            return NO_CHANGES
+        now = time.monotonic()
+        self._gaps = {seq: found for seq, found in self._gaps.items() if now - found < self.gap_timeout}
+        entries = self.feed_dao.changes_after(self.watermark, self._gaps, self.limit)
+        if not entries:
+            return NO_CHANGES
+        seen = set()
+        latest = {}
+        for seq, drawing_number, operation in entries:
+            seen.add(seq)
+            self._gaps.pop(seq, None)
+            latest[drawing_number] = operation
+        top = max(seen)
+        reload = False
+        if top > self.watermark:
+            missing = top - self.watermark - 1 - sum(1 for seq in seen if seq > self.watermark and seq != top)
+            if missing > self.limit:
+                # 变更记录已被清理或跳过太多,逐个等待空缺没有意义,由调用方重新查询
+                reload = True
+                self._gaps.clear()
+            else:
+                self._gaps.update((seq, now) for seq in range(self.watermark + 1, top) if seq not in seen)
+            self.watermark = top
+        # 其他终端修改过的零件缓存可能已过时
+        part_cache.invalidate(latest)
+        deleted = [drawing_number for drawing_number, operation in latest.items()
+                   if operation == audit_log.OPERATION_DELETE]
+        changed = [drawing_number for drawing_number, operation in latest.items()
+                   if operation != audit_log.OPERATION_DELETE]
+        parts = self.part_dao.get_parts_by_drawing_numbers(changed) if changed else []
+        # 读取之前又被删除的零件,删除记录在之后的轮询中出现,这里先按删除处理
+        found = {part.product_drawing_number for part in parts}
+        deleted.extend(drawing_number for drawing_number in changed if drawing_number not in found)
+        return Changes(parts, deleted, reload)
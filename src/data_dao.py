@@ -1,115 +1,888 @@
+from contextlib import contextmanager
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from data_model import Part, OperationLog
-from datetime import datetime
+from sqlalchemy import create_engine, event, update, insert, delete, bindparam, and_, or_, text, func
+from sqlalchemy.engine import make_url
+from data_model import Part, OperationLog, ChangeFeed
+import search_index
+import audit_log
+from audit_log import AuditLogWriter
+from part_cache import PartCache
+from query_profiler import QueryProfiler
+from datetime import date, datetime
 import configparser
+import itertools
+import os
+import random
+import threading
+import time
 
-# 创建一个ConfigParser对象
+# 默认配置文件与本模块在同一目录,不依赖启动时的工作目录;可用环境变量 INVENTORY_CONFIG 指定其他路径
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+
+# 配置在 init() 时读取,导入本模块不读文件、不连接数据库
 config = configparser.ConfigParser()
 
-# 读取配置文件
-config.read('config.ini')
 
-# 获取配置文件中的值
-db_host = config.get('Database', 'db_host')
-db_port = config.getint('Database', 'db_port')  # 如果值是整数，可以使用getint()
-db_name = config.get('Database', 'db_name')
-db_user = config.get('Database', 'db_user')
-db_password = config.get('Database', 'db_password')
-engine = create_engine(F'mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}')
-Session = sessionmaker(bind=engine)
+class PoolStatistics:
+    """
+    连接池统计: 新建连接数、签出/归还次数,以及会话等待连接签出的累计和最长耗时
+    """
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
 
-class PartDAO:
-    def add_part(self, part):
-        session = Session(bind=engine)
-        session.add(part)
+    def attach(self, engine):
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def snapshot(self, engine):
+        pool = engine.pool
+        with self._lock:
+            stats = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait,
+                'avg_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+            }
+        # QueuePool 才有容量和溢出信息
+        for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        stats['status'] = pool.status()
+        return stats
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+
+def build_engine(config):
+    """
+    根据配置文件创建数据库引擎,连接池参数可在 [Database] 中配置:
+    pool_size、max_overflow、pool_recycle(秒)、pool_timeout(秒)、pool_pre_ping;
+    配置 db_url 时直接使用该连接串(例如测试时使用 sqlite)
+    """
+    section = config['Database']
+    url = section.get('db_url')
+    if not url:
+        url = (f"mysql+pymysql://{section.get('db_user')}:{section.get('db_password')}"
+               f"@{section.get('db_host')}:{section.getint('db_port')}/{section.get('db_name')}")
+    options = {
+        'pool_pre_ping': section.getboolean('pool_pre_ping', fallback=True),
+        'pool_recycle': section.getint('pool_recycle', fallback=3600),
+    }
+    parsed_url = make_url(url)
+    file_database = parsed_url.database not in (None, '', ':memory:')
+    # sqlite 内存库使用单连接池,不支持容量相关参数
+    if file_database:
+        options.update(
+            pool_size=section.getint('pool_size', fallback=5),
+            max_overflow=section.getint('max_overflow', fallback=10),
+            pool_timeout=section.getint('pool_timeout', fallback=30),
+        )
+    new_engine = create_engine(url, **options)
+    if parsed_url.get_backend_name() == 'sqlite' and file_database:
+        # WAL 模式下流式导出等长时间读取不会阻塞其他连接提交
+        @event.listens_for(new_engine, 'connect')
+        def _enable_wal(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.close()
+    pool_statistics.attach(new_engine)
+    return new_engine
+
+
+pool_statistics = PoolStatistics()
+# 以下对象在 init() 中按配置创建或调整
+engine = None
+# 提交后不让对象过期,会话关闭后界面仍可读取零件属性
+Session = sessionmaker(expire_on_commit=False)
+# SQL 语句统计和慢语句日志,参数可在 [Profiling] 中配置
+query_profiler = QueryProfiler()
+# 按图号缓存零件,大小和过期秒数可在 [Cache] 中配置
+part_cache = PartCache()
+# 操作日志后台批量写入,参数可在 [Audit] 中配置
+audit_writer = None
+
+_init_lock = threading.Lock()
+_config_lock = threading.Lock()
+# 已读取的配置文件路径
+_config_path = None
+# 当前线程正在进行的工作单元会话
+_local = threading.local()
+
+
+def load_config(config_path=None):
+    """
+    读取配置文件,重复调用直接返回。通过库存服务(remote_dao)访问数据的终端只读取配置,不创建数据库引擎
+    :param config_path: 配置文件路径,默认依次取环境变量 INVENTORY_CONFIG、本模块目录下的 config.ini
+    """
+    global _config_path
+    with _config_lock:
+        if _config_path is None:
+            path = config_path or os.environ.get('INVENTORY_CONFIG') or DEFAULT_CONFIG_PATH
+            if not config.read(path, encoding='utf-8'):
+                raise FileNotFoundError(f'找不到配置文件 {path}')
+            _config_path = path
+    return config
+
+
+def init(config_path=None):
+    """
+    读取配置并创建数据库引擎,重复调用直接返回。
+    只创建引擎不建立连接,第一次查询或 warm_up() 时才连接数据库;未显式调用时在第一次打开会话时自动执行
+    :param config_path: 配置文件路径,默认依次取环境变量 INVENTORY_CONFIG、本模块目录下的 config.ini
+    :return: 数据库引擎
+    """
+    global engine, audit_writer
+    if engine is not None:
+        return engine
+    with _init_lock:
+        if engine is not None:
+            return engine
+        load_config(config_path)
+        new_engine = build_engine(config)
+
+        query_profiler.slow_threshold = config.getint('Profiling', 'slow_query_ms', fallback=200) / 1000
+        query_profiler.n_plus_one_threshold = config.getint('Profiling', 'n_plus_one', fallback=10)
+        if config.getboolean('Profiling', 'enabled', fallback=True):
+            query_profiler.attach(new_engine)
+            query_profiler.log_to_file(config.get('Profiling', 'log_file', fallback='slow_query.log'),
+                                       config.getint('Profiling', 'log_max_bytes', fallback=1024 * 1024),
+                                       config.getint('Profiling', 'log_backup_count', fallback=5))
+        part_cache.max_size = config.getint('Cache', 'cache_size', fallback=5000)
+        part_cache.ttl = config.getfloat('Cache', 'cache_ttl', fallback=30.0)
+        Session.configure(bind=new_engine)
+        audit_writer = AuditLogWriter(Session,
+                                      batch_size=config.getint('Audit', 'batch_size', fallback=200),
+                                      flush_interval=config.getint('Audit', 'flush_interval_ms', fallback=500) / 1000,
+                                      max_queue=config.getint('Audit', 'queue_size', fallback=10000))
+        engine = new_engine
+        return engine
+
+
+def get_engine():
+    return init()
+
+
+def warm_up():
+    """
+    预先建立一个数据库连接并执行一次简单查询,连接归还连接池后供后续查询复用。
+    启动时在后台线程调用,界面显示后的第一次查询不再等待建立连接
+    :return: 耗时秒数
+    """
+    start = time.perf_counter()
+    with init().connect() as connection:
+        connection.execute(text('SELECT 1'))
+    return time.perf_counter() - start
+
+
+def shutdown():
+    """
+    写完尚未写入的操作日志,未初始化时什么都不做
+    """
+    if audit_writer is not None:
+        audit_writer.close()
+
+
+# 修改零件时记录操作日志的字段
+_AUDITED_ATTRIBUTES = ['no', 'name', 'inventory_quantity', 'quantity_per_carton']
+_QUANTITY_FIELD = Part.inventory_quantity.name
+_FEED_DRAWING_NUMBER = ChangeFeed.product_drawing_number.name
+_FEED_OPERATION = ChangeFeed.operation.name
+_FEED_TIME = ChangeFeed.time.name
+
+# 单件出入库遇到并发修改时的最大尝试次数
+MAX_MOVE_ATTEMPTS = 5
+# 分页查询默认每页条数
+PAGE_SIZE = 200
+# 流式查询每批条数
+STREAM_CHUNK_SIZE = 1000
+# 每次最多读取的变更记录条数
+FEED_BATCH_SIZE = 1000
+# 可以由数据库排序的零件字段,排序列相同的零件再按图号排序
+SORT_FIELDS = ('no', 'product_drawing_number', 'name', 'inventory_quantity', 'quantity_per_carton', 'update_time')
+
+
+class StockError(Exception):
+    """
+    库存操作失败
+    """
+
+
+class PartNotFoundError(StockError):
+    def __init__(self, drawing_number):
+        super().__init__(f'零件 {drawing_number} 不存在')
+        self.drawing_number = drawing_number
+
+
+class InsufficientStockError(StockError):
+    def __init__(self, drawing_number, quantity, delta):
+        super().__init__(f'零件 {drawing_number} 库存不足: 当前库存 {quantity},需要出库 {-delta}')
+        self.drawing_number = drawing_number
+        self.quantity = quantity
+        self.delta = delta
+
+
+class ConcurrentUpdateError(StockError):
+    def __init__(self, drawing_number, attempts):
+        super().__init__(f'零件 {drawing_number} 正在被其他终端修改,重试 {attempts} 次后仍未成功,请稍后再试')
+        self.drawing_number = drawing_number
+        self.attempts = attempts
+
+
+class VersionConflictError(StockError):
+    def __init__(self, drawing_number, expected, actual):
+        state = '已被删除' if actual is None else f'版本号为 {actual}'
+        super().__init__(f'零件 {drawing_number} 已被其他终端修改: 修改基于版本 {expected},当前{state}')
+        self.drawing_number = drawing_number
+        self.expected = expected
+        self.actual = actual
+
+
+def get_pool_statistics():
+    return pool_statistics.snapshot(init())
+
+
+def get_cache_statistics():
+    return part_cache.statistics()
+
+
+def _cache_parts(session, parts):
+    """
+    事务提交后把查询到的零件写入缓存,未提交的数据不会进入缓存
+    """
+    session.info.setdefault('cache_parts', []).extend(parts)
+
+
+def _invalidate_parts(session, drawing_numbers):
+    """
+    零件被修改时立即从缓存移除,事务提交后再移除一次,防止其他线程在提交前读到旧值并写回缓存
+    """
+    drawing_numbers = list(drawing_numbers)
+    part_cache.invalidate(drawing_numbers)
+    session.info.setdefault('cache_invalidated', set()).update(drawing_numbers)
+
+
+def _write_through(session, parts):
+    """
+    写入的零件对象就是修改后的完整数据,提交后直接更新缓存
+    """
+    _invalidate_parts(session, [part.product_drawing_number for part in parts])
+    session.info.setdefault('cache_written', []).extend(parts)
+
+
+def _audit(session, entries):
+    """
+    事务提交后把操作日志交给后台写入器,回滚的修改不记录
+    :param entries: [(图号, 操作类型, 操作字段, 更改前值, 更改后值)]
+    """
+    session.info.setdefault('audit', []).extend(entries)
+
+
+def _feed(session, entries):
+    """
+    在修改零件的同一事务中写入变更记录,随修改一起提交或回滚
+    :param entries: [(图号, 操作类型)],操作类型为新增、修改、删除
+    """
+    if entries:
+        now = datetime.now()
+        session.execute(insert(ChangeFeed.__table__), [
+            {_FEED_DRAWING_NUMBER: drawing_number, _FEED_OPERATION: operation, _FEED_TIME: now}
+            for drawing_number, operation in entries])
+
+
+def _movement(drawing_number, before, after):
+    operator_type = audit_log.OPERATION_IN_STOCK if after >= before else audit_log.OPERATION_OUT_STOCK
+    return drawing_number, operator_type, _QUANTITY_FIELD, before, after
+
+
+def _after_commit(session):
+    entries = session.info.pop('audit', [])
+    if entries:
+        audit_writer.record_many(entries)
+    invalidated = session.info.pop('cache_invalidated', set())
+    parts = session.info.pop('cache_parts', [])
+    written = session.info.pop('cache_written', [])
+    part_cache.invalidate(invalidated)
+    # 同一事务中先读后写的零件,读到的是修改前的值,不写入缓存
+    part_cache.put_many([part for part in parts if part.product_drawing_number not in invalidated])
+    part_cache.put_many(written)
+
+
+def _after_rollback(session):
+    session.info.pop('audit', None)
+    session.info.pop('cache_parts', None)
+    session.info.pop('cache_invalidated', None)
+    session.info.pop('cache_written', None)
+
+
+def _open_session():
+    init()
+    session = Session()
+    # 立即签出连接,记录等待连接池的时间
+    start = time.perf_counter()
+    session.connection()
+    pool_statistics.record_wait(time.perf_counter() - start)
+    return session
+
+
+@contextmanager
+def unit_of_work():
+    """
+    工作单元: 一次用户操作内的多个 DAO 调用共用同一个会话和事务,全部成功后统一提交,出错时整体回滚。
+    嵌套使用时加入外层工作单元
+    """
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        yield session
+        return
+    session = _open_session()
+    _local.session = session
+    try:
+        yield session
         session.commit()
+        _after_commit(session)
+    except Exception:
+        session.rollback()
+        _after_rollback(session)
+        raise
+    finally:
+        _local.session = None
         session.close()
 
-    def get_part_by_drawing_number(self, drawing_number):
-        session = Session()
-        part = session.query(Part).filter_by(product_drawing_number=drawing_number).first()
+
+@contextmanager
+def session_scope():
+    """
+    DAO 方法使用的会话: 处于工作单元中时复用工作单元的会话(由工作单元负责提交),否则单独开启会话并在结束时提交
+    """
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        yield session
+        session.flush()
+        return
+    session = _open_session()
+    try:
+        yield session
+        session.commit()
+        _after_commit(session)
+    except Exception:
+        session.rollback()
+        _after_rollback(session)
+        raise
+    finally:
         session.close()
+
+
+class PartDAO:
+    def _read_scope(self):
+        """
+        查询零件使用的会话,本地副本(replica.ReplicaPartDAO)改为查询本地数据库
+        """
+        return session_scope()
+
+    def add_part(self, part):
+        with session_scope() as session:
+            session.add(part)
+            search_index.index_parts(session, [part])
+            _write_through(session, [part])
+            _audit(session, [(part.product_drawing_number, audit_log.OPERATION_ADD, _QUANTITY_FIELD, None,
+                              part.inventory_quantity)])
+            _feed(session, [(part.product_drawing_number, audit_log.OPERATION_ADD)])
         return part
 
-    # 根据图号,产品名称,更改时间范围查找
-    def query_data_by_condition(self, drawing_number=None, name=None, start_time=None, end_time=None,
-                                log_callback=None):
-        session = Session()
+    def get_parts_by_drawing_numbers(self, drawing_numbers):
+        """
+        按图号批量读取零件,不存在的图号忽略
+        """
+        with session_scope() as session:
+            parts = session.query(Part).filter(Part.product_drawing_number.in_(list(drawing_numbers))).all()
+            _cache_parts(session, parts)
+            return parts
+
+    def iter_versions(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        按图号顺序分批产出全部零件的 [(图号, 版本号)],每批一个短查询,用于与本地副本核对
+        """
+        after = None
+        while True:
+            with session_scope() as session:
+                query = session.query(Part.product_drawing_number, Part.version)
+                if after is not None:
+                    query = query.filter(Part.product_drawing_number > after)
+                rows = [tuple(row) for row in query.order_by(Part.product_drawing_number).limit(chunk_size)]
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def get_part_by_drawing_number(self, drawing_number):
+        # 表格中刚显示过的零件直接从缓存返回
+        part = part_cache.get(drawing_number)
+        if part is not None:
+            return part
+        with session_scope() as session:
+            part = session.query(Part).filter_by(product_drawing_number=drawing_number).first()
+            if part is not None:
+                _cache_parts(session, [part])
+            return part
+
+    def _condition_query(self, session, drawing_number=None, name=None, start_time=None, end_time=None):
         query = session.query(Part)
+        # 图号和名称的子串匹配通过搜索索引定位,不做全表 LIKE 扫描
         if drawing_number:
-            query = query.filter(Part.product_drawing_number.like(f'%{drawing_number}%'))
+            query = query.filter(search_index.substring_filter('d', drawing_number))
         if name:
-            query = query.filter(Part.name.like(f'%{drawing_number}%'))
+            query = query.filter(search_index.substring_filter('n', name))
         if start_time:
             query = query.filter(Part.update_time >= start_time)
         if end_time:
             query = query.filter(Part.update_time <= end_time)
-        query = query.filter(Part.update_time <= end_time)
-        # if log_callback:
-        #     log_callback(f'Executing query: {query}\n Query values:{drawing_number},{name},{start_time},{end_time}')
-        parts = query.all()
-        session.close()
-        return parts
+        return query
+
+    def _sorted_query(self, query, sort=None, descending=False, after=None):
+        """
+        按 (sort, 图号) 排序,after 为上一页最后一个零件的键时只返回排在它之后的零件。
+        按图号排序时 after 为图号,否则为 (排序列的值, 图号)。
+        sort 列的值为 NULL 的零件在升序时排在最前,降序时排在最后,与 MySQL 和 sqlite 的默认顺序一致
+        """
+        key = Part.product_drawing_number
+        if sort in (None, 'product_drawing_number'):
+            if after is not None:
+                query = query.filter(key < after if descending else key > after)
+            return query.order_by(key.desc() if descending else key)
+        if sort not in SORT_FIELDS:
+            raise ValueError(f'不能按 {sort} 排序')
+        column = getattr(Part, sort)
+        if after is not None:
+            value, drawing_number = after
+            if value is None:
+                condition = and_(column.is_(None), key < drawing_number if descending else key > drawing_number)
+                if not descending:
+                    condition = or_(condition, column.isnot(None))
+            elif descending:
+                condition = or_(column < value, and_(column == value, key < drawing_number), column.is_(None))
+            else:
+                condition = or_(column > value, and_(column == value, key > drawing_number))
+            query = query.filter(condition)
+        if descending:
+            return query.order_by(column.desc(), key.desc())
+        return query.order_by(column, key)
+
+    # 根据图号,产品名称,更改时间范围查找
+    def query_data_by_condition(self, drawing_number=None, name=None, start_time=None, end_time=None,
+                                log_callback=None):
+        with self._read_scope() as session:
+            query = self._condition_query(session, drawing_number, name, start_time, end_time)
+            # if log_callback:
+            #     log_callback(f'Executing query: {query}\n Query values:{drawing_number},{name},{start_time},{end_time}')
+            parts = query.all()
+            _cache_parts(session, parts)
+            return parts
+
+    def search(self, term, field='d', prefix=False, limit=PAGE_SIZE):
+        """
+        按图号(field='d')或产品名称(field='n')搜索零件
+        :param prefix: True 时按前缀匹配,否则按子串匹配
+        """
+        condition = search_index.prefix_filter(field, term) if prefix else search_index.substring_filter(field, term)
+        with self._read_scope() as session:
+            parts = session.query(Part).filter(condition).order_by(Part.product_drawing_number).limit(limit).all()
+            _cache_parts(session, parts)
+            return parts
+
+    def query_page(self, page, page_size=PAGE_SIZE, drawing_number=None, name=None, start_time=None,
+                   end_time=None, sort=None, descending=False):
+        """
+        按页码分页查询,默认按图号排序,page 从 0 开始
+        """
+        with self._read_scope() as session:
+            query = self._condition_query(session, drawing_number, name, start_time, end_time)
+            parts = self._sorted_query(query, sort, descending).offset(page * page_size).limit(page_size).all()
+            _cache_parts(session, parts)
+            return parts
+
+    def query_after(self, after=None, limit=PAGE_SIZE, drawing_number=None, name=None, start_time=None,
+                    end_time=None, sort=None, descending=False):
+        """
+        键集分页查询: 按 (sort, 图号) 排序,返回排在 after 之后的前 limit 条零件,
+        翻页时把上一页最后一个零件的键作为 after 传入(见 _sorted_query),走索引,不随页数增加而变慢
+        :param sort: 排序字段(SORT_FIELDS 之一),默认按图号
+        """
+        with self._read_scope() as session:
+            query = self._condition_query(session, drawing_number, name, start_time, end_time)
+            parts = self._sorted_query(query, sort, descending, after).limit(limit).all()
+            _cache_parts(session, parts)
+            return parts
+
+    def iter_parts(self, chunk_size=STREAM_CHUNK_SIZE, drawing_number=None, name=None, start_time=None,
+                   end_time=None, sort=None, descending=False):
+        """
+        流式查询,每次产出一批(最多 chunk_size 个)零件。
+        使用服务端游标(stream_results)逐批读取,内存占用与结果总数无关;遍历结束或生成器关闭前会话保持打开
+        """
+        with self._read_scope() as session:
+            query = self._condition_query(session, drawing_number, name, start_time, end_time)
+            rows = iter(self._sorted_query(query, sort, descending)
+                        .execution_options(stream_results=True)
+                        .yield_per(chunk_size))
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    return
+                yield chunk
 
     def update_part_quantity(self, drawing_number, new_quantity):
-        session = Session()
-        part = session.query(Part).filter_by(product_drawing_number=drawing_number).first()
-        if part:
-            # 更改时间为当前时间
-            part.update_time = datetime.now().strftime('%Y-%m-%d')
-            part.inventory_quantity = new_quantity
-            session.commit()
-        session.close()
+        """
+        :return: 修改后的零件,图号不存在时返回 None
+        """
+        with session_scope() as session:
+            part = session.query(Part).filter_by(product_drawing_number=drawing_number).first()
+            if part:
+                _audit(session, [(drawing_number, audit_log.OPERATION_UPDATE, _QUANTITY_FIELD,
+                                  part.inventory_quantity, new_quantity)])
+                # 更改时间为当前时间
+                part.update_time = date.today()
+                part.inventory_quantity = new_quantity
+                part.version = (part.version or 0) + 1
+                _write_through(session, [part])
+                _feed(session, [(drawing_number, audit_log.OPERATION_UPDATE)])
+            return part
 
-    def delete_part_by_drawing_number(self, drawing_number):
-        session = Session()
-        part = session.query(Part).filter_by(product_drawing_number=drawing_number).first()
-        if part:
-            session.delete(part)
-            session.commit()
-        session.close()
+    def move_stock(self, drawing_number, delta, max_attempts=MAX_MOVE_ATTEMPTS):
+        """
+        单件出入库: 读取当前库存和版本号,再以 WHERE 版本 = 读取到的版本 条件更新(比较并交换),
+        期间不持有行锁; 版本号已被其他终端修改时重新读取并重试。
+        在工作单元中调用时事务快照不会刷新,冲突后不再重试而是直接抛出 ConcurrentUpdateError
+        :param delta: 增减数量,出库为负数
+        :return: (调整前库存, 调整后库存)
+        """
+        table = Part.__table__
+        drawing_number_column = table.c[Part.product_drawing_number.name]
+        version_column = table.c[Part.version.name]
+        in_unit_of_work = getattr(_local, 'session', None) is not None
+        attempts = 1 if in_unit_of_work else max_attempts
+        for attempt in range(attempts):
+            with session_scope() as session:
+                row = session.query(Part.inventory_quantity, Part.version).filter(
+                    Part.product_drawing_number == drawing_number).first()
+                if row is None:
+                    raise PartNotFoundError(drawing_number)
+                quantity, version = row.inventory_quantity or 0, row.version or 0
+                new_quantity = quantity + delta
+                if new_quantity < 0:
+                    raise InsufficientStockError(drawing_number, quantity, delta)
+                result = session.execute(
+                    update(table)
+                    .where(drawing_number_column == drawing_number)
+                    .where(version_column == row.version)
+                    .values({table.c[Part.inventory_quantity.name]: new_quantity,
+                             table.c[Part.update_time.name]: date.today(),
+                             version_column: version + 1})
+                )
+                if result.rowcount == 1:
+                    _invalidate_parts(session, [drawing_number])
+                    _audit(session, [_movement(drawing_number, quantity, new_quantity)])
+                    _feed(session, [(drawing_number, audit_log.OPERATION_UPDATE)])
+                    return quantity, new_quantity
+            # 随机退避,避免多个终端同时重试再次冲突
+            time.sleep(random.uniform(0.005, 0.02) * (attempt + 1))
+        raise ConcurrentUpdateError(drawing_number, attempts)
+
+    def adjust_quantities(self, deltas):
+        """
+        批量调整库存数量,所有零件在同一个事务中以 库存数量 = 库存数量 + 增量 的方式更新,
+        任一零件调整后库存为负数时整体回滚并抛出 InsufficientStockError,
+        任一零件不存在(例如已被其他终端删除)时整体回滚并抛出 PartNotFoundError
+        :param deltas: {图号: 增减数量},出库为负数
+        :return: {图号: 调整后的库存数量}
+        """
+        if not deltas:
+            return {}
+        table = Part.__table__
+        quantity = table.c[Part.inventory_quantity.name]
+        version = table.c[Part.version.name]
+        statement = (
+            update(table)
+            .where(table.c[Part.product_drawing_number.name] == bindparam('b_drawing_number'))
+            .values({quantity: quantity + bindparam('b_delta'),
+                     table.c[Part.update_time.name]: bindparam('b_update_time'),
+                     version: version + 1})
+        )
+        today = date.today()
+        params = [{'b_drawing_number': drawing_number, 'b_delta': delta, 'b_update_time': today}
+                  for drawing_number, delta in deltas.items()]
+        with session_scope() as session:
+            session.execute(statement, params)
+            _invalidate_parts(session, deltas)
+            rows = session.query(Part.product_drawing_number, Part.inventory_quantity).filter(
+                Part.product_drawing_number.in_(list(deltas))).all()
+            # 更新语句持有这些行的锁直到提交,此时检查结果不会被其他终端干扰
+            found = {drawing_number for drawing_number, _ in rows}
+            for drawing_number in deltas:
+                if drawing_number not in found:
+                    raise PartNotFoundError(drawing_number)
+            for drawing_number, new_quantity in rows:
+                if new_quantity is not None and new_quantity < 0:
+                    delta = deltas[drawing_number]
+                    raise InsufficientStockError(drawing_number, new_quantity - delta, delta)
+            _audit(session, [_movement(drawing_number, (new_quantity or 0) - deltas[drawing_number], new_quantity)
+                             for drawing_number, new_quantity in rows])
+            _feed(session, [(drawing_number, audit_log.OPERATION_UPDATE) for drawing_number, _ in rows])
+        return {drawing_number: new_quantity for drawing_number, new_quantity in rows}
+
+    def upsert_parts(self, rows, update_columns):
+        """
+        在一个事务中批量插入或更新零件: MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE,
+        sqlite 使用 INSERT ... ON CONFLICT DO UPDATE。同一条语句以 executemany 执行,
+        由驱动或 SQLAlchemy 合并为多行 VALUES 写入整批数据,语句编译结果可以缓存。
+        图号已存在时只更新 update_columns 中的列,上次更改日期和版本号总是更新
+        :param rows: [{列名: 值}],每行的列相同,且包含新零件需要的全部列,图号不重复
+        :param update_columns: 已有零件需要更新的列名
+        :return: (新增数, 更新数)
+        """
+        if not rows:
+            return 0, 0
+        table = Part.__table__
+        drawing_number_key = Part.product_drawing_number.name
+        update_time_key = Part.update_time.name
+        version = table.c[Part.version.name]
+        drawing_numbers = [row[drawing_number_key] for row in rows]
+        with session_scope() as session:
+            existing = dict(session.query(Part.product_drawing_number, Part.inventory_quantity).filter(
+                Part.product_drawing_number.in_(drawing_numbers)).all())
+            dialect = session.get_bind().dialect.name
+            if dialect == 'mysql':
+                from sqlalchemy.dialects.mysql import insert as mysql_insert
+                statement = mysql_insert(table)
+                new_values = statement.inserted
+            elif dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+                statement = sqlite_insert(table)
+                new_values = statement.excluded
+            else:
+                raise NotImplementedError(f'不支持的数据库: {dialect}')
+            assignments = {column: new_values[column] for column in update_columns}
+            assignments[update_time_key] = new_values[update_time_key]
+            assignments[version.name] = version + 1
+            if dialect == 'mysql':
+                statement = statement.on_duplicate_key_update(assignments)
+            else:
+                statement = statement.on_conflict_do_update(index_elements=[drawing_number_key], set_=assignments)
+            session.execute(statement, rows)
+
+            # 新零件写入搜索索引,改了名称的已有零件重建索引
+            name_key = Part.name.name
+            search_index.index_parts(session, [Part(product_drawing_number=row[drawing_number_key], name=row[name_key])
+                                               for row in rows if row[drawing_number_key] not in existing],
+                                     replace=False)
+            if name_key in update_columns:
+                search_index.index_parts(session, [Part(product_drawing_number=row[drawing_number_key],
+                                                        name=row[name_key])
+                                                   for row in rows if row[drawing_number_key] in existing])
+            _invalidate_parts(session, drawing_numbers)
+            quantity_key = Part.inventory_quantity.name
+            entries = []
+            for row in rows:
+                drawing_number = row[drawing_number_key]
+                if drawing_number not in existing:
+                    entries.append((drawing_number, audit_log.OPERATION_ADD, _QUANTITY_FIELD, None, row[quantity_key]))
+                elif quantity_key in update_columns and existing[drawing_number] != row[quantity_key]:
+                    entries.append((drawing_number, audit_log.OPERATION_UPDATE, _QUANTITY_FIELD,
+                                    existing[drawing_number], row[quantity_key]))
+            _audit(session, entries)
+            _feed(session, [(drawing_number, audit_log.OPERATION_UPDATE if drawing_number in existing
+                             else audit_log.OPERATION_ADD) for drawing_number in drawing_numbers])
+        return len(rows) - len(existing), len(existing)
+
+    def delete_part_by_drawing_number(self, drawing_number, expected_version=None):
+        """
+        :param expected_version: 不为空时零件的版本号必须等于该值,否则抛出 VersionConflictError
+        """
+        with session_scope() as session:
+            query = session.query(Part).filter_by(product_drawing_number=drawing_number)
+            if expected_version is not None:
+                query = query.with_for_update()
+            part = query.first()
+            if part and expected_version is not None and (part.version or 0) != expected_version:
+                raise VersionConflictError(drawing_number, expected_version, part.version)
+            if part:
+                # 不通过 ORM 删除,保留该零件的历史操作日志
+                session.execute(delete(Part).where(Part.product_drawing_number == drawing_number))
+                search_index.remove_parts(session, [drawing_number])
+                _invalidate_parts(session, [drawing_number])
+                _audit(session, [(drawing_number, audit_log.OPERATION_DELETE, _QUANTITY_FIELD,
+                                  part.inventory_quantity, None)])
+                _feed(session, [(drawing_number, audit_log.OPERATION_DELETE)])
 
     # 查找所有数据
     def query_all_data(self):
-        session = Session()
-        parts = session.query(Part).all()
-        session.close()
-        return parts
+        with self._read_scope() as session:
+            parts = session.query(Part).all()
+            _cache_parts(session, parts)
+            return parts
 
     def batch_delete(self, drawing_numbers, log_callback):
-        session = Session()
-        session.query(Part).filter(Part.product_drawing_number.in_(drawing_numbers)).delete(synchronize_session=False)
-        if log_callback:
-            log_callback(f'Deleting parts with drawing numbers: {drawing_numbers}')
-        session.commit()
-        session.close()
+        with session_scope() as session:
+            # 删除前取出库存数量用于操作日志
+            deleted = session.query(Part.product_drawing_number, Part.inventory_quantity).filter(
+                Part.product_drawing_number.in_(drawing_numbers)).all()
+            session.query(Part).filter(Part.product_drawing_number.in_(drawing_numbers)).delete(
+                synchronize_session=False)
+            _audit(session, [(drawing_number, audit_log.OPERATION_DELETE, _QUANTITY_FIELD, quantity, None)
+                             for drawing_number, quantity in deleted])
+            _feed(session, [(drawing_number, audit_log.OPERATION_DELETE) for drawing_number, _ in deleted])
+            search_index.remove_parts(session, drawing_numbers)
+            _invalidate_parts(session, drawing_numbers)
+            if log_callback:
+                log_callback(f'Deleting parts with drawing numbers: {drawing_numbers}')
 
-    def update_part(self, part):
-        session = Session()
-        # 更改时间为当前时间
-        part.update_time = datetime.now().strftime('%Y-%m-%d')
-        session.merge(part)
-        session.commit()
-        session.close()
+    def update_part(self, part, expected_version=None):
+        """
+        :param expected_version: 不为空时数据库中零件的版本号必须等于该值(零件必须存在),
+            否则抛出 VersionConflictError,用于检查修改期间零件是否被其他终端改过
+        :return: 合并到数据库后的完整零件
+        """
+        with session_scope() as session:
+            existing = session.get(Part, part.product_drawing_number, with_for_update=expected_version is not None)
+            if expected_version is not None and (existing is None or (existing.version or 0) != expected_version):
+                raise VersionConflictError(part.product_drawing_number, expected_version,
+                                           existing.version if existing else None)
+            before = {name: getattr(existing, name) for name in _AUDITED_ATTRIBUTES} if existing else {}
+            # 更改时间为当前时间
+            part.update_time = date.today()
+            merged = session.merge(part)
+            merged.version = (merged.version or 0) + 1
+            _audit(session, [(merged.product_drawing_number, audit_log.OPERATION_UPDATE,
+                              getattr(Part, name).name, before.get(name), getattr(merged, name))
+                             for name in _AUDITED_ATTRIBUTES
+                             if str(before.get(name)) != str(getattr(merged, name))])
+            search_index.index_parts(session, [merged])
+            _write_through(session, [merged])
+            _feed(session, [(merged.product_drawing_number,
+                             audit_log.OPERATION_UPDATE if existing else audit_log.OPERATION_ADD)])
+        return merged
 
 
 class OperationLogDAO:
     def add_operation_log(self, log):
-        session = Session()
-        session.add(log)
-        session.commit()
-        session.close()
+        with session_scope() as session:
+            session.add(log)
 
-    def get_logs_by_drawing_number(self, drawing_number):
-        session = Session()
-        logs = session.query(OperationLog).filter_by(product_drawing_number=drawing_number).all()
-        session.close()
-        return logs
+    def _log_query(self, session, drawing_number=None, start_time=None, end_time=None, operator_types=None):
+        """
+        按图号、时间范围和操作类型过滤,按时间、序号倒序(最新的在前),
+        图号加时间范围的条件和排序都由 (产品图号, 时间) 组合索引覆盖
+        """
+        query = session.query(OperationLog)
+        if drawing_number:
+            query = query.filter(OperationLog.product_drawing_number == drawing_number)
+        if start_time:
+            query = query.filter(OperationLog.time >= start_time)
+        if end_time:
+            query = query.filter(OperationLog.time <= end_time)
+        if operator_types:
+            query = query.filter(OperationLog.operator_type.in_(operator_types))
+        return query.order_by(OperationLog.time.desc(), OperationLog.id.desc())
+
+    def query_logs(self, drawing_number=None, start_time=None, end_time=None, operator_types=None, after=None,
+                   limit=PAGE_SIZE):
+        """
+        按 (时间, 序号) 键集倒序分页查询操作日志
+        :param after: 上一页最后一条日志的 (时间, 序号),为空时查询第一页
+        :param operator_types: 操作类型列表,为空时不限
+        """
+        with session_scope() as session:
+            query = self._log_query(session, drawing_number, start_time, end_time, operator_types)
+            if after is not None:
+                time_value, log_id = after
+                query = query.filter(or_(OperationLog.time < time_value,
+                                         and_(OperationLog.time == time_value, OperationLog.id < log_id)))
+            return query.limit(limit).all()
+
+    def iter_logs(self, chunk_size=STREAM_CHUNK_SIZE, drawing_number=None, start_time=None, end_time=None,
+                  operator_types=None):
+        """
+        流式倒序查询操作日志,每次产出一批(最多 chunk_size 条)
+        """
+        with session_scope() as session:
+            query = self._log_query(session, drawing_number, start_time, end_time, operator_types)
+            rows = iter(query.execution_options(stream_results=True).yield_per(chunk_size))
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    return
+                yield chunk
+
+    def get_logs_by_drawing_number(self, drawing_number, limit=PAGE_SIZE):
+        """
+        返回该零件最新的 limit 条操作日志,更早的日志用 query_logs 继续翻页
+        """
+        return self.query_logs(drawing_number, limit=limit)
 
     def delete_logs_by_drawing_number(self, drawing_number):
-        session = Session()
-        session.query(OperationLog).filter_by(product_drawing_number=drawing_number).delete()
-        session.commit()
-        session.close()
+        with session_scope() as session:
+            session.query(OperationLog).filter_by(product_drawing_number=drawing_number).delete()
+
+
+class ChangeFeedDAO:
+    def latest_seq(self):
+        """
+        :return: 最新的变更序号,没有变更记录时为 0
+        """
+        with session_scope() as session:
+            return session.query(func.max(ChangeFeed.seq)).scalar() or 0
+
+    def changes_after(self, after, gaps=(), limit=FEED_BATCH_SIZE):
+        """
+        按序号顺序返回序号大于 after 的变更记录,以及 gaps 中的序号(之前读取时尚未提交的事务)对应的记录,
+        只走主键范围查询,耗时与变更数量有关,与零件总数无关
+        :return: [(序号, 图号, 操作类型)]
+        """
+        condition = ChangeFeed.seq > after
+        if gaps:
+            condition = or_(condition, ChangeFeed.seq.in_(list(gaps)))
+        with session_scope() as session:
+            rows = session.query(ChangeFeed.seq, ChangeFeed.product_drawing_number, ChangeFeed.operation).filter(
+                condition).order_by(ChangeFeed.seq).limit(limit).all()
+            return [tuple(row) for row in rows]
+
+    def prune(self, before):
+        """
+        删除早于 before 的变更记录,保留最新一条,数据库重启后自增序号不会从更小的值重新开始
+        :return: 删除的记录数
+        """
+        with session_scope() as session:
+            latest = session.query(func.max(ChangeFeed.seq)).scalar()
+            if latest is None:
+                return 0
+            return session.query(ChangeFeed).filter(ChangeFeed.time < before, ChangeFeed.seq < latest).delete(
+                synchronize_session=False)
+
+
+# DAO 的每个公开方法作为一次操作统计语句数量和耗时
+query_profiler.instrument(PartDAO)
+query_profiler.instrument(OperationLogDAO)
+query_profiler.instrument(ChangeFeedDAO)
@@ -1,4 +1,5 @@
-from sqlalchemy import String, Integer, Column, Date, ForeignKey
+from sqlalchemy import String, Integer, Column, Date, DateTime, Index, Text
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -21,9 +22,19 @@ class Part(Base):
     quantity_per_carton = Column('每箱数量', Integer())  # 每箱数量
     update_time = Column('上次更改日期', Date)  # 更新时间
     id = Column('id', String(99))  # id
+    version = Column('版本', Integer(), nullable=False, default=0, server_default='0')  # 版本号,每次修改库存加1
 
-    # 定义与 OperationLog 模型的关系
-    operation_logs = relationship("OperationLog", back_populates="part")
+    # 表格按这些列排序时由数据库按索引排序分页
+    __table_args__ = (
+        Index('ix_inventory_name', '产品名称'),
+        Index('ix_inventory_quantity', '库存数量'),
+        Index('ix_inventory_update_time', '上次更改日期'),
+    )
+
+    # 定义与 OperationLog 模型的关系。操作日志在零件删除后仍然保留,关系只用于查询,
+    # 删除零件时不会修改日志的图号
+    operation_logs = relationship("OperationLog", viewonly=True,
+                                  primaryjoin="Part.product_drawing_number == foreign(OperationLog.product_drawing_number)")
 
 
 class OperationLog(Base):
@@ -31,12 +42,124 @@ class OperationLog(Base):
 
     id = Column('序号', Integer(), primary_key=True, autoincrement=True)  # 序号
     time = Column('时间', Date)  # 时间
-    product_drawing_number = Column('产品图号', String(20), ForeignKey('inventoryInfo.产品图号'),
-                                    primary_key=True)  # 产品图号
+    # 产品图号,不设外键: 删除零件后"删除"日志和历史日志仍然引用原来的图号
+    product_drawing_number = Column('产品图号', String(20))
     operator_type = Column('操作类型', String(6))  # 操作类型
     operator_fields = Column('操作字段', String(10))  # 操作字段
     value_before_change = Column('更改前值', String(20))  # 更改前值
     changed_value = Column('更改后值', String(20))  # 更改后值
 
-    # 定义与 Part 模型的关系
-    part = relationship("Part", back_populates="operation_logs")
+    # 定义与 Part 模型的关系,零件已删除时为 None
+    part = relationship("Part", viewonly=True,
+                        primaryjoin="foreign(OperationLog.product_drawing_number) == Part.product_drawing_number")
+
+    # 按零件查询某段时间内的日志,并按时间倒序分页;按图号查询、删除日志也使用该索引
+    __table_args__ = (Index('ix_operation_log_drawing_number_time', '产品图号', '时间'),)
+
+
+class PartSearchGram(Base):
+    """
+    零件搜索索引: 图号和产品名称从每个字符开始截取的3字片段(末尾不足3字的保留短片段),
+    子串查询先用片段在索引中定位候选零件,避免 LIKE '%关键字%' 全表扫描
+    """
+    __tablename__ = 'part_search_gram'
+
+    field = Column('字段', String(1), primary_key=True)  # 字段: d 图号, n 产品名称
+    # 片段按二进制比较: MySQL 默认的排序规则不区分大小写、重音并忽略末尾空格,不同的片段会被当成重复主键
+    gram = Column('片段', String(3).with_variant(mysql.VARCHAR(3, charset='utf8mb4', collation='utf8mb4_bin'), 'mysql'),
+                  primary_key=True)  # 片段
+    product_drawing_number = Column('产品图号', String(20), primary_key=True)  # 产品图号
+
+    # 按零件删除或重建片段时使用,主键以字段、片段开头,不能按图号定位
+    __table_args__ = (Index('ix_part_search_gram_drawing_number', '产品图号'),)
+
+
+class DailyMovement(Base):
+    """
+    按天、按零件汇总的库存变动,由 analytics 模块根据操作日志增量维护
+    """
+    __tablename__ = 'daily_movement'
+
+    day = Column('日期', Date, primary_key=True)  # 日期
+    product_drawing_number = Column('产品图号', String(20), primary_key=True)  # 产品图号
+    inbound = Column('入库数量', Integer(), nullable=False, default=0)  # 当天入库数量
+    outbound = Column('出库数量', Integer(), nullable=False, default=0)  # 当天出库数量
+    net_change = Column('净变化', Integer(), nullable=False, default=0)  # 当天库存净变化,含新增、修改、删除
+    operations = Column('操作次数', Integer(), nullable=False, default=0)  # 当天操作次数
+
+
+class AnalyticsWatermark(Base):
+    """
+    汇总表已处理到的操作日志序号,再次汇总时只处理之后的新日志
+    """
+    __tablename__ = 'analytics_watermark'
+
+    name = Column('名称', String(50), primary_key=True)  # 汇总表名称
+    last_log_id = Column('序号', Integer(), nullable=False, default=0)  # 已处理的最大日志序号
+
+
+class AnalyticsGap(Base):
+    """
+    汇总时跳过的日志序号: 序号在插入时分配、提交时才可见,较小的序号可能晚于已汇总的较大序号提交,
+    之后的汇总继续读取这些序号,超过一定时间仍未出现的(回滚或已删除的日志)不再等待
+    """
+    __tablename__ = 'analytics_gap'
+
+    name = Column('名称', String(50), primary_key=True)  # 汇总表名称
+    log_id = Column('序号', Integer(), primary_key=True, autoincrement=False)  # 尚未出现的日志序号
+    found_time = Column('发现时间', DateTime, nullable=False)  # 第一次发现空缺的时间
+
+
+class ChangeFeed(Base):
+    """
+    零件变更记录: PartDAO 修改零件时在同一事务中写入一条,其他终端按序号水位轮询,只重新读取变化的零件
+    """
+    __tablename__ = 'change_feed'
+
+    seq = Column('序号', Integer(), primary_key=True, autoincrement=True)  # 序号,只增不减
+    product_drawing_number = Column('产品图号', String(20), nullable=False)  # 产品图号
+    operation = Column('操作类型', String(6), nullable=False)  # 新增、修改、删除
+    time = Column('时间', DateTime)  # 修改时间,用于清理过期记录
+
+    # sqlite 默认会复用被删除的最大序号,AUTOINCREMENT 保证序号只增不减
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+class SchemaVersion(Base):
+    """
+    已执行的数据库升级步骤,由 migrations 模块维护
+    """
+    __tablename__ = 'schema_version'
+
+    version = Column('版本', Integer(), primary_key=True, autoincrement=False)  # 升级步骤版本号
+    description = Column('说明', String(100))  # 升级内容
+    applied_time = Column('执行时间', DateTime)  # 执行时间
+
+
+class ReplicaOutbox(Base):
+    """
+    本地副本中等待同步到主库的写操作,只存在于本地副本数据库
+    """
+    __tablename__ = 'replica_outbox'
+
+    id = Column('序号', Integer(), primary_key=True, autoincrement=True)  # 序号,按序号顺序同步
+    product_drawing_number = Column('产品图号', String(20), nullable=False)  # 产品图号
+    operation = Column('操作', String(6), nullable=False)  # 新增、修改、出入库、删除
+    payload = Column('内容', Text)  # 新增、修改时为零件各列的值,出入库时为增减数量,JSON
+    base_version = Column('基准版本', Integer())  # 本地修改前零件的版本号,主库版本号不同时为冲突
+    state = Column('状态', String(6), nullable=False)  # 待同步、冲突
+    error = Column('错误', String(200))  # 冲突原因
+    created_time = Column('创建时间', DateTime)  # 创建时间
+
+    __table_args__ = (Index('ix_replica_outbox_state', '状态', '序号'),)
+
+
+class ReplicaWatermark(Base):
+    """
+    本地副本已从主库拉取到的位置,只存在于本地副本数据库
+    """
+    __tablename__ = 'replica_watermark'
+
+    name = Column('名称', String(50), primary_key=True)  # 副本表名称
+    last_update_time = Column('上次更改日期', Date)  # 已拉取零件的最大上次更改日期
+    reconciled_time = Column('核对时间', DateTime)  # 上次与主库全量核对图号和版本号的时间
@@ -0,0 +1,296 @@
+"""
+库存服务: 在一个进程中持有唯一的数据库连接池,通过本机 HTTP/JSON 接口(见 service_protocol)提供
+PartDAO、OperationLogDAO 和变更记录的操作。各终端配置 [Service] url 后通过 remote_dao 访问服务,
+不再各自连接数据库,数据库账号只保存在服务端的配置文件中,连接数不随终端数量增加。
+
+- 每个 HTTP 连接由一个线程处理,所有线程共用 data_dao 的连接池([Database] pool_size 等配置);
+- /batch 在一次往返中执行多个调用,其中连续的单个零件查询合并为一条 IN 查询;
+- 同时到达的单个零件查询合并为一条 IN 查询(LookupBatcher),窗口为 [Service] batch_window_ms 毫秒。
+
+启动时执行尚未执行的数据库升级,并清理 [ChangeFeed] retention_days 天之前的变更记录;
+操作日志仍由服务进程的后台线程批量写入,退出时写完。
+
+用法: python inventory_service.py [--host 127.0.0.1] [--port 8765]
+"""
+import argparse
+import hmac
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import data_dao
+import migrations
+import service_protocol
+from data_dao import PartDAO, OperationLogDAO, ChangeFeedDAO, StockError, part_cache
+from service_protocol import METHODS, TOKEN_HEADER, DEFAULT_PORT
+
+logger = logging.getLogger(__name__)
+
+# 请求体的最大字节数
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# 保持连接的空闲秒数,超过后服务端关闭连接,客户端下次请求时重新连接
+IDLE_TIMEOUT = 60
+
+
+class LookupBatcher:
+    """
+    合并同时到达的单个零件查询: 第一个请求等待 window 秒收集其他请求,再用一条 IN 查询读取全部零件。
+    缓存中已有的零件直接返回,不等待
+    """
+
+    def __init__(self, part_dao, window=0.002):
+        self.part_dao = part_dao
+        self.window = window
+        self.queries = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self._pending = None  # 当前批次: {图号: [Future]}
+
+    def get(self, drawing_number):
+        part = part_cache.get(drawing_number)
+        if part is not None or self.window <= 0:
+            return part if part is not None else self.part_dao.get_part_by_drawing_number(drawing_number)
+        future = Future()
+        with self._lock:
+            leader = self._pending is None
+            if leader:
+                self._pending = {}
+            self._pending.setdefault(drawing_number, []).append(future)
+        if leader:
+            time.sleep(self.window)
+            self._flush()
+        return future.result()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, None
+            self.queries += 1
+            self.lookups += sum(len(futures) for futures in batch.values())
+        try:
+            parts = {part.product_drawing_number: part
+                     for part in self.part_dao.get_parts_by_drawing_numbers(list(batch))}
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for drawing_number, futures in batch.items():
+            for future in futures:
+                future.set_result(parts.get(drawing_number))
+
+
+class InventoryService:
+    """
+    :param token: 不为空时请求必须带相同的 X-Inventory-Token 请求头
+    :param batch_window: 合并单个零件查询的等待秒数,0 为不合并
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, token=None, batch_window=0.002):
+        self.token = token or None
+        self.daos = {'parts': PartDAO(), 'logs': OperationLogDAO(), 'feed': ChangeFeedDAO()}
+        self.lookups = LookupBatcher(self.daos['parts'], batch_window)
+        self.started = time.time()
+        self.requests = 0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        """
+        在后台线程中处理请求,用于测试和基准测试
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name='inventory-service', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def execute(self, call):
+        """
+        执行一个调用
+        :return: {'result': 返回值} 或 {'error': 异常}
+        """
+        with self._lock:
+            self.calls += 1
+        dao_name, method = (call.get('dao'), call.get('method')) if isinstance(call, dict) else (None, None)
+        try:
+            return {'result': self._dispatch(dao_name, method, call)}
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            if not isinstance(e, (StockError, ValueError)):
+                logger.exception('执行 %s.%s 失败', dao_name, method)
+            return {'error': service_protocol.error_to_json(e)}
+
+    def execute_batch(self, calls):
+        """
+        按顺序执行多个调用,连续的单个零件查询合并为一条 IN 查询
+        :return: 与 calls 一一对应的结果
+        """
+        results = []
+        lookups = []
+        for call in list(calls) + [None]:
+            if call is not None and _is_lookup(call):
+                lookups.append(call['args'][0])
+                continue
+            if lookups:
+                results.extend(self._lookup_all(lookups))
+                lookups = []
+            if call is not None:
+                results.append(self.execute(call))
+        return results
+
+    def _lookup_all(self, drawing_numbers):
+        with self._lock:
+            self.calls += len(drawing_numbers)
+        try:
+            parts = {part.product_drawing_number: part
+                     for part in self.daos['parts'].get_parts_by_drawing_numbers(drawing_numbers)}
+        except Exception as e:
+            with self._lock:
+                self.errors += len(drawing_numbers)
+            logger.exception('批量读取零件失败')
+            return [{'error': service_protocol.error_to_json(e)}] * len(drawing_numbers)
+        return [{'result': parts.get(drawing_number)} for drawing_number in drawing_numbers]
+
+    def _dispatch(self, dao_name, method, call):
+        if method not in METHODS.get(dao_name, ()):
+            raise ValueError(f'不支持的调用 {dao_name}.{method}')
+        args, kwargs = call.get('args') or [], call.get('kwargs') or {}
+        if dao_name == 'parts' and method == 'get_part_by_drawing_number':
+            return self.lookups.get(*args, **kwargs)
+        if method == 'batch_delete':
+            # 日志回调在客户端执行
+            kwargs['log_callback'] = None
+        return getattr(self.daos[dao_name], method)(*args, **kwargs)
+
+    def health(self):
+        with self._lock:
+            statistics = {'uptime': time.time() - self.started, 'requests': self.requests, 'calls': self.calls,
+                          'errors': self.errors}
+        statistics.update(lookup_queries=self.lookups.queries, batched_lookups=self.lookups.lookups,
+                          pool=data_dao.get_pool_statistics())
+        return statistics
+
+
+def _is_lookup(call):
+    return isinstance(call, dict) and call.get('dao') == 'parts' and \
+        call.get('method') == 'get_part_by_drawing_number' and len(call.get('args') or []) == 1 and \
+        not call.get('kwargs')
+
+
+def _handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 保持连接,客户端在同一个连接上连续发送请求
+        protocol_version = 'HTTP/1.1'
+        server_version = 'InventoryService'
+        timeout = IDLE_TIMEOUT
+        # 响应头和响应体分两次写出,不关闭 Nagle 算法时会与客户端的延迟确认叠加,每个请求多等约 40ms
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            if self.path == '/health':
+                self._respond(200, service.health())
+            else:
+                self._respond(404, {'message': f'未知的路径 {self.path}'})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            with service._lock:
+                service.requests += 1
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_REQUEST_BYTES:
+                self._respond(413, {'message': '请求过大'})
+                self.close_connection = True
+                return
+            try:
+                body = service_protocol.loads(self.rfile.read(length))
+            except (ValueError, TypeError) as e:
+                self._respond(400, {'message': f'请求不是有效的 JSON: {e}'})
+                return
+            if not isinstance(body, dict):
+                self._respond(400, {'message': '请求应为 JSON 对象'})
+                return
+            if self.path == '/call':
+                self._respond(200, service.execute(body))
+            elif self.path == '/batch':
+                self._respond(200, {'results': service.execute_batch(body.get('calls') or [])})
+            else:
+                self._respond(404, {'message': f'未知的路径 {self.path}'})
+
+        def _authorized(self):
+            if service.token is None or hmac.compare_digest(self.headers.get(TOKEN_HEADER, '').encode('utf-8'),
+                                                            service.token.encode('utf-8')):
+                return True
+            # 没有读取请求体,不能继续在这个连接上处理请求
+            self.close_connection = True
+            self._respond(401, {'message': '令牌错误'})
+            return False
+
+        def _respond(self, status, body):
+            data = service_protocol.dumps(body)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug('%s %s', self.address_string(), format % args)
+
+    return Handler
+
+
+def from_config(config, host=None, port=None):
+    """
+    按 [Service] 配置创建服务,host/port 不为空时代替配置中的值
+    """
+    return InventoryService(host or config.get('Service', 'host', fallback='127.0.0.1'),
+                            port or config.getint('Service', 'port', fallback=DEFAULT_PORT),
+                            token=config.get('Service', 'token', fallback=None),
+                            batch_window=config.getfloat('Service', 'batch_window_ms', fallback=2.0) / 1000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='库存服务')
+    parser.add_argument('--host', help='监听地址,默认取 [Service] host (127.0.0.1)')
+    parser.add_argument('--port', type=int, help=f'监听端口,默认取 [Service] port ({DEFAULT_PORT})')
+    parser.add_argument('--config', help='配置文件路径')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    data_dao.init(args.config)
+    for version, description in migrations.upgrade():
+        logger.info('已执行数据库升级 %s: %s', version, description)
+    retention_days = data_dao.config.getint('ChangeFeed', 'retention_days', fallback=7)
+    if retention_days:
+        ChangeFeedDAO().prune(datetime.now() - timedelta(days=retention_days))
+    service = from_config(data_dao.config, args.host, args.port)
+    logger.info('库存服务已启动: %s', service.address)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server.server_close()
+        data_dao.shutdown()
@@ -1,11 +1,60 @@
+import time
+
+# 启动计时从导入其他模块之前开始
+_started = time.perf_counter()
+
+import argparse
 import sys
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication
 from widgets.window import Widget
 from ui_controller import UIController
+from startup import StartupTimer, FirstPaintWatcher, DEFAULT_BUDGET_MS, FIRST_PAGE
+import data_dao
+
+# --startup-report 模式下等待第一页数据的最长时间(毫秒)
+STARTUP_REPORT_TIMEOUT_MS = 60000
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description='库存管理')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='显示第一页数据后打印启动耗时并退出,窗口首次绘制超出预算时退出码为 1,'
+                             '没有显示出数据时为 2')
+    args, qt_args = parser.parse_known_args()
+    timer = StartupTimer(_started)
+    timer.mark('导入模块')
+    app = QApplication(sys.argv[:1] + qt_args)
+    # 退出前写完尚未写入的操作日志
+    app.aboutToQuit.connect(data_dao.shutdown)
     widget = Widget()
+    # 退出前显示并写入尚未追加的日志
+    app.aboutToQuit.connect(widget.log_panel.flush)
     ui_controller = UIController(widget)
+    timer.mark('创建窗口')
+    exit_code = []
+
+    def on_ready():
+        budget_ms = data_dao.config.getint('Startup', 'budget_ms', fallback=DEFAULT_BUDGET_MS)
+        report = timer.report(budget_ms)
+        ui_controller.add_log(report)
+        if args.startup_report:
+            print(report)
+            # 没有显示出第一页数据(连接或查询失败)时退出码为 2
+            if timer.elapsed(FIRST_PAGE) is None:
+                exit_code.append(2)
+            else:
+                exit_code.append(1 if timer.over_budget(budget_ms) else 0)
+            app.quit()
+
+    # 窗口绘制出来之后才在后台读取配置、连接数据库
+    FirstPaintWatcher(widget, timer, lambda: QTimer.singleShot(0, lambda: ui_controller.start(timer, on_ready)))
     widget.show()
-    sys.exit(app.exec())
+    if args.startup_report:
+        def on_timeout():
+            print(timer.report())
+            print('等待第一页数据超时')
+            exit_code.append(2)
+            app.quit()
+        QTimer.singleShot(STARTUP_REPORT_TIMEOUT_MS, on_timeout)
+    result = app.exec()
+    sys.exit(exit_code[0] if exit_code else result)
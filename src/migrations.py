@@ -0,0 +1,354 @@
+"""
+数据库升级: 按版本号顺序执行尚未执行过的升级步骤,已执行的版本记录在 schema_version 表中。
+
+每个步骤执行前先检查数据库中的实际结构(表、列、索引、主键),已经手工执行过对应 DDL 的数据库
+也可以安全升级; MySQL 的 DDL 不能回滚,步骤中途失败后再次执行会从失败的地方继续。
+MySQL 上升级期间持有数据库级的命名锁(GET_LOCK),多个终端或服务同时升级时依次执行,后执行的只看到已完成的版本。
+一般在命令行或库存服务启动时执行,也可以配置 [Database] auto_migrate = true 在界面启动时执行。
+
+用法: python migrations.py             执行升级,显示升级前后的执行计划
+      python migrations.py --status    显示各版本是否已执行
+      python migrations.py --explain   只显示当前的执行计划
+"""
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import inspect, select, insert, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import data_dao
+import search_index
+from data_model import (Part, OperationLog, PartSearchGram, DailyMovement, AnalyticsWatermark, AnalyticsGap,
+                        ChangeFeed, SchemaVersion)
+
+_version_table = SchemaVersion.__table__
+_upgrade_lock = threading.Lock()
+# MySQL 命名锁的名称和等待秒数
+UPGRADE_LOCK_NAME = 'inventory_schema_upgrade'
+UPGRADE_LOCK_TIMEOUT = 300
+
+
+def _has_column(connection, table, column):
+    return any(item['name'] == column for item in inspect(connection).get_columns(table.name))
+
+
+def _create_tables(connection, *tables):
+    """
+    创建不存在的表(连同表上声明的索引),返回新建的表
+    """
+    created = []
+    for table in tables:
+        if not inspect(connection).has_table(table.name):
+            table.create(connection)
+            created.append(table)
+    return created
+
+
+def _create_indexes(connection, table):
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def create_base_tables(connection):
+    _create_tables(connection, Part.__table__, OperationLog.__table__)
+
+
+def add_version_column(connection):
+    if _has_column(connection, Part.__table__, Part.version.name):
+        return
+    preparer = connection.dialect.identifier_preparer
+    connection.execute(text(f'ALTER TABLE {preparer.format_table(Part.__table__)} '
+                            f'ADD COLUMN {preparer.quote(Part.version.name)} INTEGER NOT NULL DEFAULT 0'))
+
+
+def create_part_indexes(connection):
+    _create_indexes(connection, Part.__table__)
+
+
+def create_log_index(connection):
+    _create_indexes(connection, OperationLog.__table__)
+
+
+def _rebuild_sqlite_table(connection, table):
+    """
+    sqlite 不能修改主键和外键: 按模型重建表并按原来的插入顺序复制数据
+    """
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    old_name = f'{table.name}_old'
+    connection.execute(text(f'ALTER TABLE {name} RENAME TO {preparer.quote(old_name)}'))
+    # 索引名在 sqlite 中全库唯一,随旧表改名后要先删除才能在新表上重建
+    for index in inspect(connection).get_indexes(old_name):
+        connection.execute(text(f'DROP INDEX {preparer.quote(index["name"])}'))
+    table.create(connection)
+    columns = ', '.join(preparer.quote(column.name) for column in table.columns)
+    connection.execute(text(f'INSERT INTO {name} ({columns}) SELECT {columns} '
+                            f'FROM {preparer.quote(old_name)} ORDER BY rowid'))
+    connection.execute(text(f'DROP TABLE {preparer.quote(old_name)}'))
+
+
+def fix_log_primary_key(connection):
+    """
+    操作日志原来以 (序号, 产品图号) 为复合主键,改为只以自增的序号为主键。
+    sqlite 重建表,序号为空的旧日志按原来的插入顺序重新编号
+    """
+    table = OperationLog.__table__
+    key = [OperationLog.id.name]
+    primary_key = inspect(connection).get_pk_constraint(table.name)
+    if primary_key['constrained_columns'] == key:
+        return
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        _rebuild_sqlite_table(connection, table)
+    elif dialect == 'mysql':
+        # 自增列必须始终在某个键中,删除和新增主键放在同一条语句里
+        connection.execute(text(f'ALTER TABLE {name} DROP PRIMARY KEY, '
+                                f'ADD PRIMARY KEY ({preparer.quote(OperationLog.id.name)})'))
+    else:
+        connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT {preparer.quote(primary_key["name"])}'))
+        connection.execute(text(f'ALTER TABLE {name} ADD PRIMARY KEY ({preparer.quote(OperationLog.id.name)})'))
+
+
+def create_search_index(connection):
+    # 新建的索引表根据已有零件填充,否则子串查询查不到任何零件
+    if _create_tables(connection, PartSearchGram.__table__):
+        with Session(bind=connection) as session:
+            search_index.rebuild(session)
+    _create_indexes(connection, PartSearchGram.__table__)
+
+
+def create_analytics_tables(connection):
+    _create_tables(connection, DailyMovement.__table__, AnalyticsWatermark.__table__)
+
+
+def create_change_feed(connection):
+    _create_tables(connection, ChangeFeed.__table__)
+
+
+def drop_log_foreign_key(connection):
+    """
+    操作日志的图号原来是库存表的外键: 零件删除后写入的"删除"日志违反外键,删除零件也会清空历史日志的图号。
+    去掉外键,日志在零件删除后仍保留原来的图号
+    """
+    table = OperationLog.__table__
+    foreign_keys = inspect(connection).get_foreign_keys(table.name)
+    if not foreign_keys:
+        return
+    if connection.dialect.name == 'sqlite':
+        _rebuild_sqlite_table(connection, table)
+        return
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    drop = 'DROP FOREIGN KEY' if connection.dialect.name == 'mysql' else 'DROP CONSTRAINT'
+    for foreign_key in foreign_keys:
+        connection.execute(text(f'ALTER TABLE {name} {drop} {preparer.quote(foreign_key["name"])}'))
+
+
+def create_analytics_gap_table(connection):
+    _create_tables(connection, AnalyticsGap.__table__)
+
+
+def create_analytics_watermark(connection):
+    """
+    库存变动汇总的水位行: 汇总时以 SELECT ... FOR UPDATE 锁住这一行,
+    由升级预先创建,多个终端第一次汇总时不会同时插入
+    """
+    # 水位名称与 analytics.WATERMARK_NAME 相同,升级不导入 pandas
+    name = DailyMovement.__tablename__
+    exists = connection.execute(select(AnalyticsWatermark.name).where(AnalyticsWatermark.name == name)).first()
+    if exists is None:
+        connection.execute(insert(AnalyticsWatermark.__table__).values({
+            AnalyticsWatermark.name.name: name, AnalyticsWatermark.last_log_id.name: 0}))
+
+
+def binary_search_gram(connection):
+    """
+    MySQL 上已有的 part_search_gram 表片段列改为 utf8mb4_bin,新建的表按模型创建时已是二进制排序规则;
+    sqlite 默认就按二进制比较
+    """
+    if connection.dialect.name != 'mysql':
+        return
+    table = PartSearchGram.__table__
+    column = table.c[PartSearchGram.gram.name]
+    existing = next(item for item in inspect(connection).get_columns(table.name) if item['name'] == column.name)
+    if getattr(existing['type'], 'collation', None) == 'utf8mb4_bin':
+        return
+    preparer = connection.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f'ALTER TABLE {preparer.format_table(table)} '
+                            f'MODIFY {preparer.quote(column.name)} {column_type} NOT NULL'))
+
+
+# (版本号, 说明, 升级函数),版本号只增不改,新步骤加在末尾
+MIGRATIONS = [
+    (1, '创建库存表和操作日志表', create_base_tables),
+    (2, '库存表增加版本列', add_version_column),
+    (3, '库存表按产品名称、库存数量、上次更改日期的索引', create_part_indexes),
+    (4, '操作日志按产品图号和时间的组合索引', create_log_index),
+    (5, '操作日志主键改为序号', fix_log_primary_key),
+    (6, '零件搜索索引表', create_search_index),
+    (7, '库存变动汇总表', create_analytics_tables),
+    (8, '零件变更记录表', create_change_feed),
+    (9, '操作日志去掉图号外键', drop_log_foreign_key),
+    (10, '库存变动汇总的日志空缺表', create_analytics_gap_table),
+    (11, '库存变动汇总的水位行', create_analytics_watermark),
+    (12, '零件搜索索引片段列改为二进制排序规则', binary_search_gram),
+]
+
+
+def applied_versions(engine=None):
+    engine = engine or data_dao.get_engine()
+    with engine.connect() as connection:
+        if not inspect(connection).has_table(_version_table.name):
+            return {}
+        return dict(connection.execute(select(SchemaVersion.version, SchemaVersion.applied_time)).all())
+
+
+def pending(engine=None):
+    applied = applied_versions(engine)
+    return [(version, description) for version, description, _ in MIGRATIONS if version not in applied]
+
+
+@contextmanager
+def _database_lock(engine):
+    """
+    MySQL 上用一个单独的连接持有命名锁,其他终端的 upgrade 等到锁释放后再读取已执行的版本;
+    sqlite 没有命名锁,依赖进程内的锁和各步骤执行前的结构检查
+    """
+    if engine.dialect.name != 'mysql':
+        yield
+        return
+    with engine.connect() as connection:
+        acquired = connection.execute(text('SELECT GET_LOCK(:name, :timeout)'),
+                                      {'name': UPGRADE_LOCK_NAME, 'timeout': UPGRADE_LOCK_TIMEOUT}).scalar()
+        if acquired != 1:
+            raise TimeoutError(f'{UPGRADE_LOCK_TIMEOUT} 秒内没有等到其他终端完成数据库升级')
+        try:
+            yield
+        finally:
+            # 命名锁属于连接,归还连接池前必须释放
+            connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': UPGRADE_LOCK_NAME})
+
+
+def upgrade(engine=None):
+    """
+    按版本号顺序执行尚未执行的升级步骤,每个步骤和它的版本记录在同一个事务中提交。
+    已执行的版本在取得数据库锁之后读取,等锁期间其他终端完成的步骤不会重复执行
+    :return: 本次执行的 [(版本号, 说明)]
+    :raises TimeoutError: MySQL 上等待其他终端的升级超时
+    """
+    engine = engine or data_dao.get_engine()
+    with _upgrade_lock, _database_lock(engine):
+        _version_table.create(engine, checkfirst=True)
+        applied = applied_versions(engine)
+        executed = []
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            try:
+                with engine.begin() as connection:
+                    migrate(connection)
+                    connection.execute(insert(_version_table).values({
+                        SchemaVersion.version.name: version,
+                        SchemaVersion.description.name: description,
+                        SchemaVersion.applied_time.name: datetime.now(),
+                    }))
+            except IntegrityError:
+                # 其他终端同时升级并先记录了该版本,步骤本身可以重复执行
+                continue
+            executed.append((version, description))
+        return executed
+
+
+def _main_queries(session, part_columns):
+    """
+    主要查询路径: (名称, 查询),查询由 DAO 的查询构造方法生成,与程序实际执行的语句一致;
+    零件查询只选取数据库中已有的列(升级前可能还没有版本列),不影响执行计划
+    """
+    parts = data_dao.PartDAO()
+    logs = data_dao.OperationLogDAO()
+    today = date.today()
+
+    def condition(*args, **kwargs):
+        return parts._condition_query(*args, **kwargs).with_entities(*part_columns)
+    return [
+        ('按日期范围查询零件', condition(session, start_time=today - timedelta(days=30), end_time=today)),
+        ('按图号子串查询零件', condition(session, drawing_number='A12-0')),
+        ('按产品名称子串查询零件', condition(session, name='轴承')),
+        ('按产品名称排序分页', parts._sorted_query(condition(session), 'name').limit(data_dao.PAGE_SIZE)),
+        ('按库存数量排序分页', parts._sorted_query(condition(session), 'inventory_quantity').limit(data_dao.PAGE_SIZE)),
+        ('按上次更改日期倒序分页',
+         parts._sorted_query(condition(session), 'update_time', descending=True).limit(data_dao.PAGE_SIZE)),
+        ('零件的操作日志', logs._log_query(session, drawing_number='A12-000001').limit(data_dao.PAGE_SIZE)),
+    ]
+
+
+def _plan_lines(connection, statement):
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {statement}'))]
+    return [', '.join(f'{key}={value}' for key, value in row._mapping.items() if value is not None)
+            for row in connection.execute(text(f'EXPLAIN {statement}'))]
+
+
+def explain(engine=None):
+    """
+    主要查询的执行计划
+    :return: {查询名称: [执行计划各行]},查询涉及的表还不存在时为错误信息
+    """
+    engine = engine or data_dao.get_engine()
+    plans = {}
+    with engine.connect() as connection:
+        session = Session(bind=connection)
+        existing = {column['name'] for column in inspect(connection).get_columns(Part.__tablename__)} \
+            if inspect(connection).has_table(Part.__tablename__) else set()
+        part_columns = [column for column in Part.__table__.columns if column.name in existing] or [Part]
+        for name, query in _main_queries(session, part_columns):
+            statement = query.statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+            try:
+                plans[name] = _plan_lines(connection, statement)
+            except Exception as e:
+                connection.rollback()
+                plans[name] = [f'无法执行: {str(e).splitlines()[0]}']
+    return plans
+
+
+def plan_report(before, after=None):
+    lines = []
+    for name, plan in before.items():
+        lines.append(f'{name}:')
+        if after is None:
+            lines.extend(f'    {line}' for line in plan)
+            continue
+        lines.append('  升级前:')
+        lines.extend(f'    {line}' for line in plan)
+        lines.append('  升级后:')
+        lines.extend(f'    {line}' for line in after.get(name, []))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='数据库升级')
+    parser.add_argument('--status', action='store_true', help='显示各版本是否已执行')
+    parser.add_argument('--explain', action='store_true', help='只显示主要查询当前的执行计划,不升级')
+    args = parser.parse_args()
+    if args.status:
+        applied = applied_versions()
+        for version, description, _ in MIGRATIONS:
+            state = f'已执行 {applied[version]:%Y-%m-%d %H:%M}' if version in applied else '未执行'
+            print(f'{version:3d}  {state:20s}  {description}')
+    elif args.explain:
+        print(plan_report(explain()))
+    elif not pending():
+        print('数据库已是最新版本')
+    else:
+        before = explain()
+        for version, description in upgrade():
+            print(f'已执行 {version}: {description}')
+        print()
+        print(plan_report(before, explain()))
+    data_dao.shutdown()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+from data_model import Part
+
+# 缓存的零件字段
+_ATTRIBUTES = [column.key for column in Part.__mapper__.column_attrs]
+
+
+class PartCache:
+    """
+    按图号缓存零件的 LRU 缓存,线程安全。
+    缓存中保存字段值快照,每次取出时生成新的 Part 对象,调用方修改取出的对象不会影响缓存;
+    条目超过 ttl 秒后视为过期,避免长时间看不到其他终端的修改
+    """
+
+    def __init__(self, max_size=5000, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # 图号 -> (写入时间, 字段值)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, drawing_number):
+        with self._lock:
+            item = self._items.get(drawing_number)
+            if item is not None and self.ttl and time.monotonic() - item[0] > self.ttl:
+                del self._items[drawing_number]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(drawing_number)
+            self.hits += 1
+            return Part(**item[1])
+
+    def put(self, part):
+        self.put_many([part])
+
+    def put_many(self, parts):
+        if not self.max_size:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for part in parts:
+                drawing_number = part.product_drawing_number
+                self._items[drawing_number] = (now, {name: getattr(part, name) for name in _ATTRIBUTES})
+                self._items.move_to_end(drawing_number)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, drawing_numbers):
+        with self._lock:
+            for drawing_number in drawing_numbers:
+                if self._items.pop(drawing_number, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def statistics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
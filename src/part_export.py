@@ -0,0 +1,122 @@
+"""
+把零件查询或操作日志查询的结果流式导出为 CSV 或 XLSX。
+
+数据通过 PartDAO.iter_parts / OperationLogDAO.iter_logs 的服务端游标分批读取,每批写入文件后即丢弃;
+XLSX 使用 openpyxl 的只写模式,行直接写入临时文件,内存占用与导出行数无关。
+导出的零件表头与 part_import 使用的列名一致,导出的文件可以直接再导入。
+
+用法: python part_export.py parts.xlsx [--drawing-number 图号] [--name 名称]
+      python part_export.py logs.csv --logs [--drawing-number 图号]
+"""
+import argparse
+import csv
+import time
+
+from data_model import Part, OperationLog
+
+EXPORT_CHUNK_SIZE = 1000
+
+# 导出的 (列名, 属性名),版本号不导出
+PART_COLUMNS = [(attribute.columns[0].name, attribute.key) for attribute in Part.__mapper__.column_attrs
+                if attribute.key != 'version']
+LOG_COLUMNS = [(getattr(OperationLog, key).name, key) for key in
+               ('time', 'product_drawing_number', 'operator_type', 'operator_fields', 'value_before_change',
+                'changed_value')]
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        # utf-8-sig 让 Excel 直接打开时正确识别中文
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._sheet.append(row)
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+def _open_writer(path):
+    return _XlsxWriter(path) if path.lower().endswith('.xlsx') else _CsvWriter(path)
+
+
+def export_rows(path, columns, chunks, progress=None):
+    """
+    把分批产出的对象写入文件
+    :param columns: [(表头, 属性名)]
+    :param chunks: 每次产出一批对象的迭代器
+    :param progress: 每写入一批后以已导出行数回调
+    :return: 统计信息: 导出行数、耗时秒数、每秒行数
+    """
+    started = time.perf_counter()
+    writer = _open_writer(path)
+    count = 0
+    try:
+        writer.write_rows([[title for title, _ in columns]])
+        for chunk in chunks:
+            writer.write_rows([[getattr(item, key) for _, key in columns] for item in chunk])
+            count += len(chunk)
+            if progress is not None:
+                progress(count)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    return {'rows': count, 'seconds': elapsed, 'rows_per_second': count / elapsed if elapsed else 0.0,
+            'path': path}
+
+
+def export_parts(path, progress=None, chunk_size=EXPORT_CHUNK_SIZE, part_dao=None, **conditions):
+    """
+    导出 query_data_by_condition 条件下的全部零件
+    :param conditions: drawing_number, name, start_time, end_time, 以及排序 sort, descending
+    """
+    if part_dao is None:
+        from data_dao import PartDAO
+        part_dao = PartDAO()
+    return export_rows(path, PART_COLUMNS, part_dao.iter_parts(chunk_size, **conditions), progress)
+
+
+def export_logs(path, progress=None, chunk_size=EXPORT_CHUNK_SIZE, log_dao=None, **conditions):
+    """
+    按时间倒序导出操作日志
+    :param conditions: drawing_number, start_time, end_time, operator_types
+    """
+    if log_dao is None:
+        from data_dao import OperationLogDAO
+        log_dao = OperationLogDAO()
+    return export_rows(path, LOG_COLUMNS, log_dao.iter_logs(chunk_size, **conditions), progress)
+
+
+def describe(statistics):
+    return (f"导出 {statistics['rows']} 行到 {statistics['path']},耗时 {statistics['seconds']:.1f} 秒 "
+            f"({statistics['rows_per_second']:.0f} 行/秒)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='导出零件或操作日志')
+    parser.add_argument('path', help='CSV 或 XLSX 文件')
+    parser.add_argument('--logs', action='store_true', help='导出操作日志')
+    parser.add_argument('--drawing-number', help='图号')
+    parser.add_argument('--name', help='产品名称,仅导出零件时有效')
+    args = parser.parse_args()
+    if args.logs:
+        result = export_logs(args.path, drawing_number=args.drawing_number)
+    else:
+        result = export_parts(args.path, drawing_number=args.drawing_number, name=args.name)
+    print(describe(result))
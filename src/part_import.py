@@ -0,0 +1,267 @@
+"""
+从 CSV/XLSX 批量导入零件。
+
+逐行读取文件(xlsx 使用只读模式),校验后按 chunk_size 分批写入,每批一个事务、一条多行 upsert 语句,
+内存占用只与批大小有关。表头可以使用库存表列名(产品图号、产品名称...)或 Part 属性名,未知的列忽略;
+图号已存在的零件只更新文件中出现、且这一行不为空的列,空白单元格保留原值。校验失败的行写入拒绝报告,不影响其他行。
+
+用法: python part_import.py parts.xlsx [--chunk-size 500] [--rejects rejected.csv]
+"""
+import argparse
+import csv
+import os
+import random
+import string
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import Integer, String, Date
+
+from data_model import Part
+
+IMPORT_CHUNK_SIZE = 500
+
+_DRAWING_NUMBER = Part.product_drawing_number.name
+_NAME = Part.name.name
+_ID = Part.id.name
+_UPDATE_TIME = Part.update_time.name
+# 可导入的列: 列名 -> Column,版本号由数据库维护
+IMPORT_COLUMNS = OrderedDict((column.name, column) for column in Part.__table__.columns
+                             if column.name != Part.version.name)
+# 表头别名: Part 属性名 -> 列名
+_ATTRIBUTE_COLUMNS = {attribute.key: attribute.columns[0].name for attribute in Part.__mapper__.column_attrs}
+# 不能为负数的列
+NON_NEGATIVE_COLUMNS = {Part.inventory_quantity.name, Part.a_group_total.name, Part.b_group_total.name,
+                        Part.quantity_per_carton.name}
+# 新零件未提供时的默认值
+_DEFAULTS = {Part.a_group_total.name: 0, Part.b_group_total.name: 0}
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        yield header
+        for line_number, values in enumerate(reader, start=2):
+            yield line_number, values
+
+
+def _read_xlsx(path):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, ())
+        yield ['' if value is None else str(value) for value in header]
+        for line_number, values in enumerate(rows, start=2):
+            yield line_number, values
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """
+    逐行读取文件,第一次产出表头,之后产出 (行号, 值列表),空行跳过
+    """
+    reader = _read_xlsx(path) if path.lower().endswith(('.xlsx', '.xlsm')) else _read_csv(path)
+    yield next(reader)
+    for line_number, values in reader:
+        if any(value not in (None, '') for value in values):
+            yield line_number, values
+
+
+def map_header(header):
+    """
+    :return: [列名或 None],与表头位置一一对应
+    """
+    columns = []
+    for title in header:
+        title = (title or '').strip()
+        column = title if title in IMPORT_COLUMNS else _ATTRIBUTE_COLUMNS.get(title)
+        columns.append(column if column in IMPORT_COLUMNS else None)
+    if _DRAWING_NUMBER not in columns:
+        raise ValueError(f'文件缺少 {_DRAWING_NUMBER} 列')
+    return columns
+
+
+def _parse(column, value):
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ''):
+        return None
+    if isinstance(column.type, Integer):
+        if isinstance(value, float):
+            if not value.is_integer():
+                raise ValueError(f'{column.name} 必须是整数: {value}')
+            value = int(value)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{column.name} 必须是整数: {value}')
+        if value < 0 and column.name in NON_NEGATIVE_COLUMNS:
+            raise ValueError(f'{column.name} 不能为负数: {value}')
+        return value
+    if isinstance(column.type, Date):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        try:
+            return date.fromisoformat(str(value)[:10])
+        except ValueError:
+            raise ValueError(f'{column.name} 日期格式应为 yyyy-MM-dd: {value}')
+    # xlsx 中的数字图号读出来是 float
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value)
+    if isinstance(column.type, String) and column.type.length and len(value) > column.type.length:
+        raise ValueError(f'{column.name} 超过 {column.type.length} 个字符: {value}')
+    return value
+
+
+def validate(columns, values, today):
+    """
+    把一行原始值转换为 {列名: 值},未提供或为空的列填入新零件的默认值
+    :return: (行, 文件中有这一列但单元格为空的列名集合),已有零件不更新这些列
+    :raises ValueError: 校验失败
+    """
+    row = {}
+    for column, value in zip(columns, values):
+        if column is not None:
+            row[column] = _parse(IMPORT_COLUMNS[column], value)
+    blank = frozenset(column for column, value in row.items() if value is None)
+    if not row.get(_DRAWING_NUMBER):
+        raise ValueError(f'{_DRAWING_NUMBER} 不能为空')
+    for column in IMPORT_COLUMNS:
+        if row.get(column) is None:
+            row[column] = _DEFAULTS.get(column)
+    if row[_UPDATE_TIME] is None:
+        row[_UPDATE_TIME] = today
+    if row[_ID] is None:
+        row[_ID] = ''.join(random.choices(string.ascii_lowercase + string.digits, k=35))
+    return row, blank
+
+
+class _RejectReport:
+    """
+    拒绝报告,第一次写入时才创建文件
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self._file = None
+        self._writer = None
+
+    def write(self, line_number, reason, values):
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8-sig')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['行号', '原因'] + list(self.header))
+        self._writer.writerow([line_number, reason] + ['' if value is None else value for value in values])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def import_parts(path, chunk_size=IMPORT_CHUNK_SIZE, rejects_path=None, progress=None, part_dao=None):
+    """
+    流式导入零件
+    :param rejects_path: 拒绝报告路径,默认在导入文件旁生成 <文件名>_rejected.csv,没有被拒绝的行时不生成
+    :param progress: 每写入一批后以统计信息 dict 回调
+    :return: 统计信息: 读取行数、新增数、更新数、拒绝数、批数、耗时秒数、每秒行数、拒绝报告路径
+    """
+    if part_dao is None:
+        from data_dao import PartDAO
+        part_dao = PartDAO()
+    if rejects_path is None:
+        rejects_path = os.path.splitext(path)[0] + '_rejected.csv'
+    started = time.perf_counter()
+    statistics = {'rows': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'chunks': 0, 'seconds': 0.0,
+                  'rows_per_second': 0.0, 'rejects_path': None}
+    rows = read_rows(path)
+    header = next(rows, [])
+    columns = map_header(header)
+    update_columns = [column for column in dict.fromkeys(columns) if column not in (None, _DRAWING_NUMBER)]
+    report = _RejectReport(rejects_path, header)
+    today = date.today()
+    chunk = OrderedDict()  # 图号 -> (行号, 原始值, 校验后的行, 空白列),同一批中重复的图号以最后一行为准
+
+    def reject(line_number, reason, values):
+        statistics['rejected'] += 1
+        report.write(line_number, reason, values)
+
+    def flush():
+        if not chunk:
+            return
+        # 空白列不同的行要更新的列不同,分别写入;从完整导出的文件导入时只有一组
+        groups = OrderedDict()
+        for item in chunk.values():
+            groups.setdefault(item[3], []).append(item)
+        for blank, items in groups.items():
+            try:
+                inserted, updated = part_dao.upsert_parts(
+                    [item[2] for item in items], [column for column in update_columns if column not in blank])
+            except Exception as e:
+                for line_number, values, _, _ in items:
+                    reject(line_number, f'写入失败: {e}', values)
+            else:
+                statistics['inserted'] += inserted
+                statistics['updated'] += updated
+        statistics['chunks'] += 1
+        chunk.clear()
+        elapsed = time.perf_counter() - started
+        statistics['seconds'] = elapsed
+        statistics['rows_per_second'] = statistics['rows'] / elapsed if elapsed else 0.0
+        if progress is not None:
+            progress(dict(statistics))
+
+    try:
+        for line_number, values in rows:
+            statistics['rows'] += 1
+            values = list(values)
+            try:
+                row, blank = validate(columns, values, today)
+            except ValueError as e:
+                reject(line_number, str(e), values)
+                continue
+            drawing_number = row[_DRAWING_NUMBER]
+            if drawing_number in chunk:
+                previous_line, previous_values, _, _ = chunk.pop(drawing_number)
+                reject(previous_line, f'图号重复,以第 {line_number} 行为准', previous_values)
+            chunk[drawing_number] = (line_number, values, row, blank)
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+    finally:
+        report.close()
+    elapsed = time.perf_counter() - started
+    statistics['seconds'] = elapsed
+    statistics['rows_per_second'] = statistics['rows'] / elapsed if elapsed else 0.0
+    if statistics['rejected']:
+        statistics['rejects_path'] = rejects_path
+    return statistics
+
+
+def describe(statistics):
+    text = (f"读取 {statistics['rows']} 行,新增 {statistics['inserted']},更新 {statistics['updated']},"
+            f"拒绝 {statistics['rejected']},耗时 {statistics['seconds']:.1f} 秒 "
+            f"({statistics['rows_per_second']:.0f} 行/秒)")
+    if statistics['rejects_path']:
+        text += f",拒绝原因见 {statistics['rejects_path']}"
+    return text
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='从 CSV/XLSX 批量导入零件')
+    parser.add_argument('path', help='CSV 或 XLSX 文件')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='每个事务写入的行数')
+    parser.add_argument('--rejects', help='拒绝报告路径')
+    args = parser.parse_args()
+    result = import_parts(args.path, args.chunk_size, args.rejects,
+                          progress=lambda s: print(f"已处理 {s['rows']} 行 ({s['rows_per_second']:.0f} 行/秒)"))
+    print(describe(result))
+    from data_dao import shutdown
+    shutdown()
@@ -0,0 +1,229 @@
+"""
+SQL 语句统计: 通过 SQLAlchemy 事件记录每条语句的耗时,按"操作"(DAO 方法或界面操作)汇总语句数量,
+识别同一操作中反复执行同一形状查询的 N+1 模式,慢语句写入滚动日志文件。
+
+语句按"形状"汇总: 合并空白,IN 列表和多行 VALUES 折叠为一项,参数不同的同一查询计为同一形状。
+"""
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+
+logger = logging.getLogger('slow_query')
+
+_WHITESPACE = re.compile(r'\s+')
+# (?, ?, ?) / (%s, %s) 等参数列表
+_PARAMETER_LIST = re.compile(r'\((?:\?|%s|%\(\w+\)s)(?:,\s*(?:\?|%s|%\(\w+\)s))+\)')
+# 多行 VALUES (...), (...), ...
+_REPEATED_GROUPS = re.compile(r'(\([^()]*\))(?:,\s*\([^()]*\))+')
+# SQLAlchemy 展开 IN 列表时生成的编号参数
+_EXPANDED_PARAMETERS = re.compile(r'__\[POSTCOMPILE_\w+\]')
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(statement):
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _EXPANDED_PARAMETERS.sub('?', shape)
+    shape = _PARAMETER_LIST.sub('(?...)', shape)
+    return _REPEATED_GROUPS.sub(r'\1, ...', shape)
+
+
+class _ActionFrame:
+    """
+    一次操作期间执行的语句
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.statements = 0
+        self.sql_time = 0.0
+        self.shapes = {}
+
+    def record(self, shape, elapsed):
+        self.statements += 1
+        self.sql_time += elapsed
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+
+class QueryProfiler:
+    """
+    :param slow_threshold: 耗时超过该秒数的语句记为慢语句
+    :param n_plus_one_threshold: 一次操作中同一形状的查询执行超过该次数时记为 N+1
+    """
+
+    def __init__(self, slow_threshold=0.2, n_plus_one_threshold=10):
+        self.slow_threshold = slow_threshold
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._statements = {}  # 形状 -> [次数, 总耗时, 最长耗时]
+        self._actions = {}  # 操作名 -> [次数, 语句数, SQL 总耗时, 单次最多语句数]
+        self._slow = 0
+        self._n_plus_one = {}  # (操作名, 形状) -> 最多重复次数
+        self._listeners = []
+
+    # ---- 配置
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+
+    def log_to_file(self, path, max_bytes=1024 * 1024, backup_count=5):
+        """
+        慢语句和 N+1 警告写入按大小滚动的日志文件
+        """
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8',
+                                      delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    def add_listener(self, callback):
+        """
+        慢语句和 N+1 警告同时以文本回调,回调可能在后台线程中执行
+        """
+        self._listeners.append(callback)
+
+    # ---- 操作
+    @contextmanager
+    def action(self, name):
+        stack = self._stack()
+        frame = _ActionFrame(name)
+        stack.append(frame)
+        try:
+            yield frame
+        finally:
+            stack.pop()
+            self._finish(frame)
+
+    def profiled(self, name=None):
+        """
+        装饰器: 函数的每次调用作为一次操作统计,生成器函数不统计(执行时已离开调用位置)
+        """
+        def decorator(fn):
+            if inspect.isgeneratorfunction(fn):
+                return fn
+            action_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.action(action_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument(self, cls):
+        """
+        把类的所有公开方法包装为操作,操作名为 类名.方法名
+        """
+        for attribute, value in list(vars(cls).items()):
+            if not attribute.startswith('_') and inspect.isfunction(value):
+                setattr(cls, attribute, self.profiled(f'{cls.__name__}.{attribute}')(value))
+        return cls
+
+    # ---- 统计
+    def statistics(self):
+        with self._lock:
+            return {
+                'statements': {shape: {'count': count, 'total': total, 'max': longest}
+                               for shape, (count, total, longest) in self._statements.items()},
+                'actions': {name: {'calls': calls, 'statements': statements, 'sql_time': sql_time,
+                                   'max_statements': most}
+                            for name, (calls, statements, sql_time, most) in self._actions.items()},
+                'slow': self._slow,
+                'n_plus_one': {f'{name}: {shape}': repeats for (name, shape), repeats in self._n_plus_one.items()},
+            }
+
+    def report(self, top=10):
+        """
+        耗时最多的语句、语句最多的操作和 N+1 模式的文字汇总
+        """
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            actions = sorted(self._actions.items(), key=lambda item: item[1][2], reverse=True)[:top]
+            n_plus_one = sorted(self._n_plus_one.items(), key=lambda item: item[1], reverse=True)[:top]
+            slow = self._slow
+        lines = [f'慢语句 {slow} 条(超过 {self.slow_threshold * 1000:.0f} ms)', '', '耗时最多的语句:']
+        for shape, (count, total, longest) in statements:
+            lines.append(f'  {total * 1000:10.1f} ms  {count:6d} 次  最长 {longest * 1000:8.1f} ms  {shape[:200]}')
+        lines += ['', 'SQL 耗时最多的操作:']
+        for name, (calls, statement_count, sql_time, most) in actions:
+            lines.append(f'  {sql_time * 1000:10.1f} ms  {calls:6d} 次  语句 {statement_count:6d} 条  '
+                         f'单次最多 {most:4d} 条  {name}')
+        if n_plus_one:
+            lines += ['', 'N+1 模式:']
+            for (name, shape), repeats in n_plus_one:
+                lines.append(f'  {name} 中同一查询执行 {repeats} 次: {shape[:200]}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._actions.clear()
+            self._n_plus_one.clear()
+            self._slow = 0
+
+    # ---- 事件
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('profiler_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        shape = statement_shape(statement)
+        with self._lock:
+            stats = self._statements.get(shape)
+            if stats is None:
+                stats = self._statements[shape] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            if elapsed >= self.slow_threshold:
+                self._slow += 1
+        for frame in self._stack():
+            frame.record(shape, elapsed)
+        if elapsed >= self.slow_threshold:
+            action = self._stack()[-1].name if self._stack() else '-'
+            self._warn(f'慢语句 {elapsed * 1000:.1f} ms [{action}] {shape} 参数: {repr(parameters)[:200]}')
+
+    def _on_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('profiler_started'):
+            connection.info['profiler_started'].pop()
+
+    def _finish(self, frame):
+        repeated = [(shape, count) for shape, count in frame.shapes.items()
+                    if count > self.n_plus_one_threshold and shape.upper().startswith('SELECT')]
+        with self._lock:
+            stats = self._actions.get(frame.name)
+            if stats is None:
+                stats = self._actions[frame.name] = [0, 0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += frame.statements
+            stats[2] += frame.sql_time
+            stats[3] = max(stats[3], frame.statements)
+            for shape, count in repeated:
+                key = (frame.name, shape)
+                self._n_plus_one[key] = max(self._n_plus_one.get(key, 0), count)
+        for shape, count in repeated:
+            self._warn(f'N+1 [{frame.name}] 同一查询执行 {count} 次: {shape}')
+
+    def _warn(self, message):
+        logger.warning(message)
+        for callback in self._listeners:
+            callback(message)
@@ -0,0 +1,264 @@
+"""
+通过库存服务(inventory_service)访问数据的 DAO,方法与 PartDAO、OperationLogDAO、ChangeFeedDAO 相同,
+配置 [Service] url 后界面改用这些类,终端不再直接连接数据库。
+
+每个线程使用自己的 HTTP 保持连接;库存异常和 ValueError 与直接调用 DAO 时相同,
+无法连接服务时抛出 ServiceUnavailableError。修改数据的调用在等待响应时连接断开不会重发(服务端可能已经执行),
+直接抛出 ServiceUnavailableError。流式查询(iter_parts、iter_logs)按键集分页逐批请求。
+
+用法: python remote_dao.py http://127.0.0.1:8765 [--token 令牌]    显示服务状态
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+import service_protocol
+from data_dao import PAGE_SIZE, STREAM_CHUNK_SIZE, FEED_BATCH_SIZE, MAX_MOVE_ATTEMPTS
+from data_model import Part
+from service_protocol import ServiceError, ServiceUnavailableError, TOKEN_HEADER, READ_ONLY_METHODS
+
+_ATTRIBUTES = [attribute.key for attribute in Part.__mapper__.column_attrs]
+
+
+class ServiceClient:
+    """
+    :param timeout: 每个请求等待服务响应的秒数
+    :param idle_timeout: 保持连接空闲超过该秒数后重新连接,应小于服务端关闭空闲连接的时间
+    """
+
+    def __init__(self, url, token=None, timeout=30.0, idle_timeout=50.0):
+        parsed = urlsplit(url)
+        if parsed.scheme != 'http' or not parsed.hostname:
+            raise ValueError(f'库存服务地址应为 http://主机:端口,而不是 {url}')
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path.rstrip('/')
+        self.token = token or None
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._local = threading.local()
+
+    def call(self, dao, method, *args, **kwargs):
+        response = self._request('POST', '/call', {'dao': dao, 'method': method, 'args': args, 'kwargs': kwargs},
+                                 retry=method in READ_ONLY_METHODS.get(dao, ()))
+        if 'error' in response:
+            raise service_protocol.error_from_json(response['error'])
+        return response['result']
+
+    def batch(self, calls):
+        """
+        一次往返按顺序执行多个调用,每个调用单独提交
+        :param calls: [(DAO 名称, 方法名, args, kwargs)]
+        :return: 与 calls 一一对应的返回值,失败的调用对应异常对象(不抛出)
+        """
+        calls = list(calls)
+        response = self._request('POST', '/batch', {'calls': [
+            {'dao': dao, 'method': method, 'args': args, 'kwargs': kwargs} for dao, method, args, kwargs in calls]},
+            retry=all(method in READ_ONLY_METHODS.get(dao, ()) for dao, method, _, _ in calls))
+        return [service_protocol.error_from_json(item['error']) if 'error' in item else item['result']
+                for item in response['results']]
+
+    def health(self):
+        return self._request('GET', '/health', retry=True)
+
+    def close(self):
+        """
+        关闭当前线程的连接
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _request(self, verb, path, body=None, retry=False):
+        """
+        :param retry: 请求可以重复执行(只读)。复用的连接在发送请求时断开说明服务端已关闭空闲连接,
+                      请求没有到达服务端,总是重新连接再发送一次;等待响应时断开则只有 retry 为 True 时重发
+        """
+        data = service_protocol.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is not None and time.monotonic() - getattr(self._local, 'used', 0) > self.idle_timeout:
+                # 服务端可能已关闭空闲连接,不在这个连接上发送修改数据的请求
+                self.close()
+                connection = None
+            reused = connection is not None
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port,
+                                                                                  timeout=self.timeout)
+            sent = False
+            try:
+                connection.request(verb, self.path + path, body=data, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                payload = response.read()
+            except (ConnectionResetError, BrokenPipeError) as e:
+                self.close()
+                if reused and attempt == 0 and (not sent or retry):
+                    continue
+                raise ServiceUnavailableError(f'无法连接库存服务 {self.url}: {e}') from e
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                raise ServiceUnavailableError(f'无法连接库存服务 {self.url}: {e}') from e
+            self._local.used = time.monotonic()
+            if response.will_close:
+                self.close()
+            if response.status != 200:
+                try:
+                    message = service_protocol.loads(payload).get('message')
+                except ValueError:
+                    message = payload[:200].decode('utf-8', 'replace')
+                raise ServiceError(f'库存服务返回 {response.status}: {message}')
+            return service_protocol.loads(payload)
+
+
+class RemotePartDAO:
+    def __init__(self, client):
+        self.client = client
+
+    def _call(self, method, *args, **kwargs):
+        return self.client.call('parts', method, *args, **kwargs)
+
+    def add_part(self, part):
+        # 与 PartDAO 相同,传入的零件带上数据库生成的默认值(版本号等)
+        saved = self._call('add_part', part)
+        for key in _ATTRIBUTES:
+            setattr(part, key, getattr(saved, key))
+        return part
+
+    def get_parts_by_drawing_numbers(self, drawing_numbers):
+        return self._call('get_parts_by_drawing_numbers', list(drawing_numbers))
+
+    def get_part_by_drawing_number(self, drawing_number):
+        return self._call('get_part_by_drawing_number', drawing_number)
+
+    def query_data_by_condition(self, drawing_number=None, name=None, start_time=None, end_time=None,
+                                log_callback=None):
+        return self._call('query_data_by_condition', drawing_number, name, start_time, end_time)
+
+    def search(self, term, field='d', prefix=False, limit=PAGE_SIZE):
+        return self._call('search', term, field, prefix, limit)
+
+    def query_page(self, page, page_size=PAGE_SIZE, **conditions):
+        return self._call('query_page', page, page_size, **conditions)
+
+    def query_after(self, after=None, limit=PAGE_SIZE, **conditions):
+        return self._call('query_after', after, limit, **conditions)
+
+    def iter_parts(self, chunk_size=STREAM_CHUNK_SIZE, sort=None, descending=False, **conditions):
+        """
+        按键集分页逐批请求,每批最多 chunk_size 个零件
+        """
+        after = None
+        while True:
+            chunk = self.query_after(after, chunk_size, sort=sort, descending=descending, **conditions)
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last = chunk[-1]
+            after = last.product_drawing_number if sort in (None, 'product_drawing_number') else \
+                (getattr(last, sort), last.product_drawing_number)
+
+    def update_part_quantity(self, drawing_number, new_quantity):
+        return self._call('update_part_quantity', drawing_number, new_quantity)
+
+    def move_stock(self, drawing_number, delta, max_attempts=MAX_MOVE_ATTEMPTS):
+        return tuple(self._call('move_stock', drawing_number, delta, max_attempts))
+
+    def adjust_quantities(self, deltas):
+        return self._call('adjust_quantities', deltas) if deltas else {}
+
+    def upsert_parts(self, rows, update_columns):
+        return tuple(self._call('upsert_parts', rows, update_columns))
+
+    def delete_part_by_drawing_number(self, drawing_number, expected_version=None):
+        self._call('delete_part_by_drawing_number', drawing_number, expected_version)
+
+    def query_all_data(self):
+        return self._call('query_all_data')
+
+    def batch_delete(self, drawing_numbers, log_callback):
+        self._call('batch_delete', list(drawing_numbers))
+        if log_callback:
+            log_callback(f'Deleting parts with drawing numbers: {drawing_numbers}')
+
+    def update_part(self, part, expected_version=None):
+        return self._call('update_part', part, expected_version)
+
+
+class RemoteOperationLogDAO:
+    def __init__(self, client):
+        self.client = client
+
+    def _call(self, method, *args, **kwargs):
+        return self.client.call('logs', method, *args, **kwargs)
+
+    def add_operation_log(self, log):
+        self._call('add_operation_log', log)
+
+    def query_logs(self, drawing_number=None, start_time=None, end_time=None, operator_types=None, after=None,
+                   limit=PAGE_SIZE):
+        return self._call('query_logs', drawing_number, start_time, end_time, operator_types, after, limit)
+
+    def iter_logs(self, chunk_size=STREAM_CHUNK_SIZE, drawing_number=None, start_time=None, end_time=None,
+                  operator_types=None):
+        """
+        按 (时间, 序号) 键集倒序分页逐批请求
+        """
+        after = None
+        while True:
+            chunk = self.query_logs(drawing_number, start_time, end_time, operator_types, after, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            after = (chunk[-1].time, chunk[-1].id)
+
+    def get_logs_by_drawing_number(self, drawing_number, limit=PAGE_SIZE):
+        return self._call('get_logs_by_drawing_number', drawing_number, limit)
+
+    def delete_logs_by_drawing_number(self, drawing_number):
+        self._call('delete_logs_by_drawing_number', drawing_number)
+
+
+class RemoteChangeFeedDAO:
+    def __init__(self, client):
+        self.client = client
+
+    def latest_seq(self):
+        return self.client.call('feed', 'latest_seq')
+
+    def changes_after(self, after, gaps=(), limit=FEED_BATCH_SIZE):
+        return [tuple(row) for row in self.client.call('feed', 'changes_after', after, list(gaps), limit)]
+
+    def prune(self, before):
+        return self.client.call('feed', 'prune', before)
+
+
+def from_config(config):
+    """
+    按 [Service] 配置创建服务客户端,没有配置 url 时返回 None
+    """
+    url = config.get('Service', 'url', fallback='')
+    if not url:
+        return None
+    return ServiceClient(url, config.get('Service', 'token', fallback=None),
+                         config.getfloat('Service', 'timeout', fallback=30.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='库存服务状态')
+    parser.add_argument('url', help='库存服务地址,例如 http://127.0.0.1:8765')
+    parser.add_argument('--token', help='服务配置的令牌')
+    args = parser.parse_args()
+    for key, value in ServiceClient(args.url, args.token).health().items():
+        print(f'{key}: {value}')
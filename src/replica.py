@@ -0,0 +1,559 @@
+"""
+本地副本: 与主库之间网络较慢的终端把库存表复制到本地 sqlite 文件,零件查询都在本地完成;
+写操作先改本地数据,同时在同一个本地事务中写入待同步队列,由后台线程按顺序同步到主库,
+主库短暂无法连接时界面照常工作,恢复后继续同步。
+
+- 拉取: 按 (上次更改日期, 图号) 键集分批读取上次更改日期不早于水位的零件,版本号与本地不同的才写入本地。
+  上次更改日期只精确到天,水位当天的零件每次都会重新读取,靠版本号跳过没有变化的行;
+  删除零件不留下记录,每隔 reconcile_interval 秒与主库核对一次全部图号和版本号。
+- 推送: 修改和删除带着本地修改前的版本号,主库的版本号不同说明期间被其他终端改过,记为冲突;
+  出入库是增量,不检查版本号,库存不足时记为冲突。冲突的操作不再重试,本地零件恢复为主库的值。
+  主库连接失败时停止本轮推送,剩余的操作留在队列中下一轮重试。
+- 有待同步操作的零件拉取时保留本地的值。
+
+写入主库通过 PartDAO 完成,操作日志、搜索索引和缓存与直接连接主库时相同;
+批量导入(upsert_parts)仍直接写入主库,导入的零件在下一次拉取时进入本地。
+
+用法: python replica.py replica.db [--sync] [--reconcile]    显示副本状态,可先同步或全量核对
+"""
+import argparse
+import atexit
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, event, func, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+import audit_log
+import search_index
+from data_dao import (PartDAO, StockError, PartNotFoundError, InsufficientStockError, VersionConflictError,
+                      STREAM_CHUNK_SIZE, PAGE_SIZE)
+from data_model import Part, ReplicaOutbox, ReplicaWatermark
+
+logger = logging.getLogger(__name__)
+
+# 待同步操作
+OPERATION_ADD = audit_log.OPERATION_ADD
+OPERATION_UPDATE = audit_log.OPERATION_UPDATE
+OPERATION_MOVE = '出入库'
+OPERATION_DELETE = audit_log.OPERATION_DELETE
+# 待同步操作的状态
+STATE_PENDING = '待同步'
+STATE_CONFLICT = '冲突'
+# 主库暂时无法连接(断网、超时、连接池等待超时),稍后重试
+OFFLINE_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError)
+
+_table = Part.__table__
+_DRAWING_NUMBER = Part.product_drawing_number.name
+_VERSION = Part.version.name
+# 列名 -> Part 属性名
+_ATTRIBUTES = {attribute.columns[0].name: attribute.key for attribute in Part.__mapper__.column_attrs}
+_WATERMARK_NAME = _table.name
+# 冲突的零件在本地标记为该版本号,之后的拉取和核对一定会用主库的值覆盖
+_STALE_VERSION = -1
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+
+def _row(part):
+    return {column: getattr(part, attribute) for column, attribute in _ATTRIBUTES.items()}
+
+
+def _payload(part):
+    """
+    零件各列的值(不含版本号,版本号由主库维护),日期转为文本后保存为 JSON
+    """
+    values = {column: value.isoformat() if isinstance(value, date) else value
+              for column, value in _row(part).items() if column != _VERSION}
+    return json.dumps(values, ensure_ascii=False)
+
+
+def _part(payload, version):
+    values = json.loads(payload)
+    update_time = Part.update_time.name
+    if values.get(update_time):
+        values[update_time] = date.fromisoformat(values[update_time])
+    return Part(version=version, **{_ATTRIBUTES[column]: value for column, value in values.items()})
+
+
+class Replica:
+    """
+    :param path: 本地副本 sqlite 文件路径
+    :param primary_dao: 读写主库使用的 PartDAO
+    :param sync_interval: 后台同步的间隔秒数
+    :param reconcile_interval: 与主库全量核对图号和版本号的间隔秒数
+    :param chunk_size: 拉取和核对时每批读取的零件数
+    """
+
+    def __init__(self, path, primary_dao=None, sync_interval=5.0, reconcile_interval=600.0,
+                 chunk_size=STREAM_CHUNK_SIZE):
+        self.path = path
+        self.primary_dao = primary_dao or PartDAO()
+        self.sync_interval = sync_interval
+        self.reconcile_interval = reconcile_interval
+        self.chunk_size = chunk_size
+        self.engine = create_engine(f'sqlite:///{path}')
+        event.listen(self.engine, 'connect', _enable_wal)
+        for table in (_table, ReplicaOutbox.__table__, ReplicaWatermark.__table__):
+            table.create(self.engine, checkfirst=True)
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.online = None  # 最近一次同步时主库能否连接,尚未同步时为 None
+        self.last_sync = None  # 最近一次成功同步的时间
+        self._write_lock = threading.RLock()  # 本地的读-改-写和拉取依次进行
+        self._sync_lock = threading.Lock()
+        self._listeners = []
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+
+    # ---- 本地会话
+    @contextmanager
+    def session_scope(self, write=False):
+        """
+        本地数据库会话,结束时提交;write 为 True 时与其他本地写入依次进行
+        """
+        if write:
+            self._write_lock.acquire()
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            if write:
+                self._write_lock.release()
+
+    def enqueue(self, session, drawing_number, operation, payload=None, base_version=None):
+        """
+        在本地写入的同一个事务中记录待同步的操作,提交后尽快同步
+        """
+        session.add(ReplicaOutbox(product_drawing_number=drawing_number, operation=operation, payload=payload,
+                                  base_version=base_version, state=STATE_PENDING, created_time=datetime.now()))
+        self._wake.set()
+
+    def outbox(self, state=None):
+        """
+        :param state: STATE_PENDING 或 STATE_CONFLICT,为空时返回全部
+        :return: 按序号排列的待同步操作
+        """
+        with self.session_scope() as session:
+            query = session.query(ReplicaOutbox)
+            if state is not None:
+                query = query.filter(ReplicaOutbox.state == state)
+            return query.order_by(ReplicaOutbox.id).all()
+
+    def discard(self, entry_ids):
+        """
+        删除已处理的冲突操作
+        """
+        with self.session_scope(write=True) as session:
+            session.execute(delete(ReplicaOutbox).where(ReplicaOutbox.id.in_(list(entry_ids))))
+
+    def initialized(self):
+        """
+        是否已经与主库完整同步过(拉取并核对全部零件)
+        """
+        return self._watermark().reconciled_time is not None
+
+    def add_listener(self, callback):
+        """
+        冲突和主库连接状态变化以文本回调,回调在同步线程中执行
+        """
+        self._listeners.append(callback)
+
+    # ---- 同步
+    def sync(self):
+        """
+        推送待同步的操作,再拉取主库的变化,到了核对时间时全量核对
+        :return: 主库能否连接
+        """
+        with self._sync_lock:
+            try:
+                self.push()
+                self.pull()
+                reconciled = self._watermark().reconciled_time
+                if reconciled is None or (datetime.now() - reconciled).total_seconds() >= self.reconcile_interval:
+                    self.reconcile()
+            except OFFLINE_ERRORS as e:
+                self._set_online(False, e)
+                return False
+            self._set_online(True)
+            self.last_sync = datetime.now()
+            return True
+
+    def push(self):
+        """
+        按序号把待同步的操作写入主库,主库无法连接时抛出异常,已写入的操作不会重复写入
+        :return: (写入数, 冲突数)
+        """
+        written, conflicts = 0, set()
+        for entry in self.outbox(STATE_PENDING):
+            try:
+                self._push_entry(entry)
+            except OFFLINE_ERRORS:
+                raise
+            except (StockError, DBAPIError) as e:
+                message = str(e).splitlines()[0]
+                with self.session_scope(write=True) as session:
+                    session.query(ReplicaOutbox).filter(ReplicaOutbox.id == entry.id).update(
+                        {ReplicaOutbox.state: STATE_CONFLICT,
+                         ReplicaOutbox.error: message[:ReplicaOutbox.error.type.length]})
+                    session.query(Part).filter(Part.product_drawing_number == entry.product_drawing_number).update(
+                        {Part.version: _STALE_VERSION})
+                conflicts.add(entry.product_drawing_number)
+                self._notify(f'同步冲突: {entry.operation} {entry.product_drawing_number},{message}')
+                continue
+            with self.session_scope(write=True) as session:
+                session.query(ReplicaOutbox).filter(ReplicaOutbox.id == entry.id).delete()
+            written += 1
+        if conflicts:
+            self._refresh(conflicts)
+        return written, len(conflicts)
+
+    def _push_entry(self, entry):
+        dao = self.primary_dao
+        if entry.operation == OPERATION_ADD:
+            dao.add_part(_part(entry.payload, 0))
+        elif entry.operation == OPERATION_UPDATE:
+            dao.update_part(_part(entry.payload, entry.base_version), expected_version=entry.base_version)
+        elif entry.operation == OPERATION_MOVE:
+            dao.move_stock(entry.product_drawing_number, json.loads(entry.payload)['delta'])
+        elif entry.operation == OPERATION_DELETE:
+            dao.delete_part_by_drawing_number(entry.product_drawing_number, expected_version=entry.base_version)
+        else:
+            raise ValueError(f'未知的操作: {entry.operation}')
+
+    def pull(self):
+        """
+        拉取上次更改日期不早于水位的零件
+        :return: 写入本地的零件数
+        """
+        start_time = self._watermark().last_update_time
+        latest = start_time
+        after = None
+        count = 0
+        while True:
+            parts = self.primary_dao.query_after(after, self.chunk_size, start_time=start_time, sort='update_time')
+            if not parts:
+                break
+            count += self._apply(parts)
+            last = parts[-1]
+            after = (last.update_time, last.product_drawing_number)
+            if last.update_time is not None:
+                latest = last.update_time
+        with self.session_scope(write=True) as session:
+            session.merge(ReplicaWatermark(name=_WATERMARK_NAME, last_update_time=latest))
+        return count
+
+    def reconcile(self):
+        """
+        与主库核对全部图号和版本号: 删除主库中已不存在的零件,重新读取版本号不同的零件
+        :return: (删除数, 更新数)
+        """
+        remote = {}
+        for rows in self.primary_dao.iter_versions(self.chunk_size * 10):
+            remote.update(rows)
+        with self.session_scope() as session:
+            local = dict(session.query(Part.product_drawing_number, Part.version).all())
+            pending = self._pending_drawing_numbers(session)
+        deleted = [drawing_number for drawing_number in local
+                   if drawing_number not in remote and drawing_number not in pending]
+        changed = [drawing_number for drawing_number, version in remote.items()
+                   if local.get(drawing_number, _STALE_VERSION) != version and drawing_number not in pending]
+        with self.session_scope(write=True) as session:
+            for start in range(0, len(deleted), self.chunk_size):
+                session.query(Part).filter(Part.product_drawing_number.in_(deleted[start:start + self.chunk_size])
+                                           ).delete(synchronize_session=False)
+        updated = 0
+        for start in range(0, len(changed), self.chunk_size):
+            updated += self._apply(self.primary_dao.get_parts_by_drawing_numbers(changed[start:start + self.chunk_size]))
+        with self.session_scope(write=True) as session:
+            watermark = session.get(ReplicaWatermark, _WATERMARK_NAME) or ReplicaWatermark(name=_WATERMARK_NAME)
+            watermark.reconciled_time = datetime.now()
+            session.merge(watermark)
+        return len(deleted), updated
+
+    def statistics(self):
+        with self.session_scope() as session:
+            counts = dict(session.query(ReplicaOutbox.state, func.count()).group_by(ReplicaOutbox.state).all())
+            parts = session.query(func.count()).select_from(Part).scalar()
+        watermark = self._watermark()
+        return {
+            'parts': parts,
+            'pending': counts.get(STATE_PENDING, 0),
+            'conflicts': counts.get(STATE_CONFLICT, 0),
+            'online': self.online,
+            'last_sync': self.last_sync,
+            'watermark': watermark.last_update_time,
+            'reconciled': watermark.reconciled_time,
+        }
+
+    # ---- 后台线程
+    def start(self):
+        """
+        启动后台同步线程,立即同步一次,之后每 sync_interval 秒或有新的写操作时同步
+        """
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='replica-sync', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def request_sync(self):
+        self._wake.set()
+
+    def close(self, timeout=10.0):
+        """
+        停止后台线程,待同步的操作保存在本地,下次启动后继续同步
+        """
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            thread.join(timeout)
+            atexit.unregister(self.close)
+        self.engine.dispose()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('同步本地副本失败')
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+
+    # ---- 内部
+    def _watermark(self):
+        with self.session_scope() as session:
+            return session.get(ReplicaWatermark, _WATERMARK_NAME) or ReplicaWatermark(name=_WATERMARK_NAME)
+
+    def _pending_drawing_numbers(self, session, drawing_numbers=None):
+        query = session.query(ReplicaOutbox.product_drawing_number).filter(ReplicaOutbox.state == STATE_PENDING)
+        if drawing_numbers is not None:
+            query = query.filter(ReplicaOutbox.product_drawing_number.in_(list(drawing_numbers)))
+        return {drawing_number for drawing_number, in query.distinct()}
+
+    def _apply(self, parts):
+        """
+        把主库的零件写入本地,跳过版本号相同和有待同步操作的零件
+        :return: 写入的零件数
+        """
+        rows = [_row(part) for part in parts]
+        drawing_numbers = [row[_DRAWING_NUMBER] for row in rows]
+        with self.session_scope(write=True) as session:
+            pending = self._pending_drawing_numbers(session, drawing_numbers)
+            local = dict(session.query(Part.product_drawing_number, Part.version).filter(
+                Part.product_drawing_number.in_(drawing_numbers)).all())
+            changed = [row for row in rows if row[_DRAWING_NUMBER] not in pending
+                       and local.get(row[_DRAWING_NUMBER], _STALE_VERSION) != row[_VERSION]]
+            if changed:
+                statement = sqlite_insert(_table)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[_DRAWING_NUMBER],
+                    set_={column: statement.excluded[column] for column in _ATTRIBUTES if column != _DRAWING_NUMBER})
+                session.execute(statement, changed)
+        return len(changed)
+
+    def _refresh(self, drawing_numbers):
+        """
+        冲突的零件恢复为主库的值,主库中已不存在的从本地删除
+        """
+        drawing_numbers = list(drawing_numbers)
+        parts = self.primary_dao.get_parts_by_drawing_numbers(drawing_numbers)
+        self._apply(parts)
+        found = {part.product_drawing_number for part in parts}
+        with self.session_scope(write=True) as session:
+            pending = self._pending_drawing_numbers(session, drawing_numbers)
+            missing = [drawing_number for drawing_number in drawing_numbers
+                       if drawing_number not in found and drawing_number not in pending]
+            if missing:
+                session.query(Part).filter(Part.product_drawing_number.in_(missing)).delete(synchronize_session=False)
+
+    def _set_online(self, online, error=None):
+        if online and self.online is False:
+            self._notify('主库连接已恢复,继续同步本地副本')
+        elif not online and self.online is not False:
+            self._notify(f'主库无法连接,暂时使用本地副本: {str(error).splitlines()[0]}')
+        self.online = online
+
+    def _notify(self, message):
+        logger.warning(message)
+        for callback in self._listeners:
+            callback(message)
+
+
+class ReplicaPartDAO(PartDAO):
+    """
+    查询本地副本、写入本地并放入待同步队列的 PartDAO,接口和返回值与 PartDAO 相同。
+    图号、产品名称的子串查询在本地用 LIKE 完成(不区分大小写),本地没有搜索索引表
+    """
+
+    def __init__(self, replica):
+        self.replica = replica
+
+    def _read_scope(self):
+        return self.replica.session_scope()
+
+    def _condition_query(self, session, drawing_number=None, name=None, start_time=None, end_time=None):
+        query = session.query(Part)
+        for column, term in ((Part.product_drawing_number, drawing_number), (Part.name, name)):
+            if search_index.normalize(term):
+                query = query.filter(self._like(column, term))
+        if start_time:
+            query = query.filter(Part.update_time >= start_time)
+        if end_time:
+            query = query.filter(Part.update_time <= end_time)
+        return query
+
+    @staticmethod
+    def _like(column, term, prefix=False):
+        pattern = f'{search_index.escape_like(search_index.normalize(term))}%'
+        return func.lower(column).like(pattern if prefix else f'%{pattern}', escape='\\')
+
+    def search(self, term, field='d', prefix=False, limit=PAGE_SIZE):
+        column = getattr(Part, search_index.FIELD_ATTRIBUTES[field])
+        with self._read_scope() as session:
+            return session.query(Part).filter(self._like(column, term, prefix)).order_by(
+                Part.product_drawing_number).limit(limit).all()
+
+    def get_part_by_drawing_number(self, drawing_number):
+        with self._read_scope() as session:
+            return session.get(Part, drawing_number)
+
+    def get_parts_by_drawing_numbers(self, drawing_numbers):
+        with self._read_scope() as session:
+            return session.query(Part).filter(Part.product_drawing_number.in_(list(drawing_numbers))).all()
+
+    def add_part(self, part):
+        with self.replica.session_scope(write=True) as session:
+            part.version = part.version or 0
+            session.add(part)
+            session.flush()
+            self.replica.enqueue(session, part.product_drawing_number, OPERATION_ADD, _payload(part))
+        return part
+
+    def update_part_quantity(self, drawing_number, new_quantity):
+        with self.replica.session_scope(write=True) as session:
+            part = session.get(Part, drawing_number)
+            if part:
+                base_version = part.version or 0
+                part.inventory_quantity = new_quantity
+                self._touch(part)
+                self.replica.enqueue(session, drawing_number, OPERATION_UPDATE, _payload(part), base_version)
+            return part
+
+    def update_part(self, part, expected_version=None):
+        with self.replica.session_scope(write=True) as session:
+            existing = session.get(Part, part.product_drawing_number)
+            base_version = (existing.version or 0) if existing else None
+            if expected_version is not None and base_version != expected_version:
+                raise VersionConflictError(part.product_drawing_number, expected_version, base_version)
+            merged = session.merge(part)
+            merged.version = base_version or 0
+            self._touch(merged)
+            self.replica.enqueue(session, merged.product_drawing_number, OPERATION_UPDATE, _payload(merged),
+                                 base_version)
+        return merged
+
+    def move_stock(self, drawing_number, delta, max_attempts=None):
+        with self.replica.session_scope(write=True) as session:
+            quantity, new_quantity = self._move(session, drawing_number, delta)
+        return quantity, new_quantity
+
+    def adjust_quantities(self, deltas):
+        """
+        所有零件在同一个本地事务中调整,任一零件库存不足或不存在时整体回滚;同步到主库时每个零件是一次出入库
+        """
+        result = {}
+        with self.replica.session_scope(write=True) as session:
+            for drawing_number, delta in deltas.items():
+                result[drawing_number] = self._move(session, drawing_number, delta)[1]
+        return result
+
+    def delete_part_by_drawing_number(self, drawing_number, expected_version=None):
+        with self.replica.session_scope(write=True) as session:
+            self._delete(session, drawing_number, expected_version)
+
+    def batch_delete(self, drawing_numbers, log_callback):
+        with self.replica.session_scope(write=True) as session:
+            for drawing_number in drawing_numbers:
+                self._delete(session, drawing_number)
+        if log_callback:
+            log_callback(f'Deleting parts with drawing numbers: {drawing_numbers}')
+
+    def _move(self, session, drawing_number, delta):
+        part = session.get(Part, drawing_number)
+        if part is None:
+            raise PartNotFoundError(drawing_number)
+        quantity = part.inventory_quantity or 0
+        new_quantity = quantity + delta
+        if new_quantity < 0:
+            raise InsufficientStockError(drawing_number, quantity, delta)
+        base_version = part.version or 0
+        part.inventory_quantity = new_quantity
+        self._touch(part)
+        self.replica.enqueue(session, drawing_number, OPERATION_MOVE, json.dumps({'delta': delta}), base_version)
+        return quantity, new_quantity
+
+    def _delete(self, session, drawing_number, expected_version=None):
+        part = session.get(Part, drawing_number)
+        if part is None:
+            return
+        base_version = part.version or 0
+        if expected_version is not None and base_version != expected_version:
+            raise VersionConflictError(drawing_number, expected_version, base_version)
+        # 本地没有操作日志表,不能经由关系删除零件对象
+        session.query(Part).filter(Part.product_drawing_number == drawing_number).delete(synchronize_session=False)
+        self.replica.enqueue(session, drawing_number, OPERATION_DELETE, base_version=base_version)
+
+    @staticmethod
+    def _touch(part):
+        # 与主库的修改规则一致: 更改日期为当天,版本号加 1,同步后本地与主库的版本号相同
+        part.update_time = date.today()
+        part.version = (part.version or 0) + 1
+
+
+def from_config(config):
+    """
+    按 [Replica] 配置创建本地副本,未启用时返回 None
+    """
+    if not config.getboolean('Replica', 'enabled', fallback=False):
+        return None
+    return Replica(config.get('Replica', 'path', fallback='replica.db'),
+                   sync_interval=config.getfloat('Replica', 'sync_interval', fallback=5.0),
+                   reconcile_interval=config.getfloat('Replica', 'reconcile_interval', fallback=600.0),
+                   chunk_size=config.getint('Replica', 'chunk_size', fallback=STREAM_CHUNK_SIZE))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地副本维护')
+    parser.add_argument('path', help='本地副本 sqlite 文件')
+    parser.add_argument('--sync', action='store_true', help='推送待同步的操作并拉取主库的变化')
+    parser.add_argument('--reconcile', action='store_true', help='与主库全量核对图号和版本号')
+    args = parser.parse_args()
+    local = Replica(args.path)
+    local.add_listener(print)
+    if args.reconcile:
+        print('删除 {} 个、更新 {} 个零件'.format(*local.reconcile()))
+    if args.sync:
+        print('同步完成' if local.sync() else '主库无法连接')
+    for key, value in local.statistics().items():
+        print(f'{key}: {value}')
+    for entry in local.outbox(STATE_CONFLICT):
+        print(f'冲突 {entry.id}: {entry.operation} {entry.product_drawing_number} {entry.error}')
+    local.close()
+    from data_dao import shutdown
+    shutdown()
@@ -0,0 +1,160 @@
+"""
+零件图号和产品名称的子串搜索索引。
+
+每个字段从每个字符开始截取最多 GRAM_SIZE 个字符作为片段存入 part_search_gram 表,
+字段长度为 n 时只产生 n 条记录。查询时:
+    - 关键字不超过 GRAM_SIZE 个字符: 片段以关键字开头即命中,是索引上的前缀范围查询;
+    - 关键字更长: 关键字的所有 GRAM_SIZE 字片段都要命中,再用 LIKE 在候选零件中确认连续出现。
+零件新增、修改、删除时由 PartDAO 在同一事务中维护索引。
+
+用法: python search_index.py --rebuild    根据库存表重建索引
+"""
+import argparse
+
+from sqlalchemy import func, select, delete, insert, true
+
+from data_model import Part, PartSearchGram
+
+GRAM_SIZE = 3
+# 索引字段代码 -> Part 属性
+FIELD_ATTRIBUTES = {
+    'd': 'product_drawing_number',
+    'n': 'name',
+}
+# 重建索引时每批处理的零件数
+REBUILD_CHUNK_SIZE = 2000
+
+_table = PartSearchGram.__table__
+# 批量插入使用数据库列名
+_FIELD_KEY = PartSearchGram.field.name
+_GRAM_KEY = PartSearchGram.gram.name
+_DRAWING_NUMBER_KEY = PartSearchGram.product_drawing_number.name
+
+
+def normalize(text):
+    return (text or '').strip().lower()
+
+
+def grams(text):
+    """
+    返回从每个字符开始截取的片段集合,末尾不足 GRAM_SIZE 的片段保留
+    """
+    text = normalize(text)
+    return {text[i:i + GRAM_SIZE] for i in range(len(text))}
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def gram_rows(part):
+    rows = []
+    for field, attribute in FIELD_ATTRIBUTES.items():
+        for gram in grams(getattr(part, attribute)):
+            rows.append({_FIELD_KEY: field, _GRAM_KEY: gram, _DRAWING_NUMBER_KEY: part.product_drawing_number})
+    return rows
+
+
+def _insert_rows(session, rows):
+    if rows:
+        session.execute(insert(_table), rows)
+
+
+def index_parts(session, parts, replace=True):
+    """
+    重新写入这些零件的索引片段
+    :param replace: 为 False 时表示零件是新增的,不需要先删除旧片段
+    """
+    parts = [part for part in parts if part.product_drawing_number]
+    if not parts:
+        return
+    if replace:
+        remove_parts(session, [part.product_drawing_number for part in parts])
+    rows = []
+    for part in parts:
+        rows.extend(gram_rows(part))
+    _insert_rows(session, rows)
+
+
+def remove_parts(session, drawing_numbers):
+    drawing_numbers = list(drawing_numbers)
+    if drawing_numbers:
+        session.execute(delete(_table).where(PartSearchGram.product_drawing_number.in_(drawing_numbers)))
+
+
+def matching_drawing_numbers(field, term):
+    """
+    返回字段中包含 term 的零件图号子查询
+    """
+    term = normalize(term)
+    if len(term) <= GRAM_SIZE:
+        # 以 term 开头的片段写成 [term, term 的后继) 范围条件,sqlite 的 LIKE 不会走索引
+        successor = term[:-1] + chr(ord(term[-1]) + 1)
+        return (select(PartSearchGram.product_drawing_number)
+                .where(PartSearchGram.field == field)
+                .where(PartSearchGram.gram >= term)
+                .where(PartSearchGram.gram < successor)
+                .distinct())
+    term_grams = sorted({term[i:i + GRAM_SIZE] for i in range(len(term) - GRAM_SIZE + 1)})
+    return (select(PartSearchGram.product_drawing_number)
+            .where(PartSearchGram.field == field)
+            .where(PartSearchGram.gram.in_(term_grams))
+            .group_by(PartSearchGram.product_drawing_number)
+            .having(func.count(func.distinct(PartSearchGram.gram)) == len(term_grams)))
+
+
+def substring_filter(field, term):
+    """
+    子串查询条件: 先用索引定位候选零件,关键字超过 GRAM_SIZE 时再确认片段连续出现
+    """
+    if not normalize(term):
+        return true()
+    column = getattr(Part, FIELD_ATTRIBUTES[field])
+    condition = Part.product_drawing_number.in_(matching_drawing_numbers(field, term))
+    if len(normalize(term)) > GRAM_SIZE:
+        condition = condition & column.like(f'%{escape_like(term.strip())}%', escape='\\')
+    return condition
+
+
+def prefix_filter(field, term):
+    """
+    前缀查询条件,直接使用字段本身的索引
+    """
+    column = getattr(Part, FIELD_ATTRIBUTES[field])
+    return column.like(f'{escape_like(term.strip())}%', escape='\\')
+
+
+def rebuild(session, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    清空并根据库存表重建索引,返回处理的零件数。
+    按图号键集分批读取,读取和写入不会在同一连接上交错使用流式游标
+    """
+    session.execute(delete(_table))
+    count = 0
+    after = None
+    while True:
+        query = session.query(Part.product_drawing_number, Part.name)
+        if after is not None:
+            query = query.filter(Part.product_drawing_number > after)
+        parts = query.order_by(Part.product_drawing_number).limit(chunk_size).all()
+        if not parts:
+            return count
+        rows = []
+        for part in parts:
+            rows.extend(gram_rows(part))
+        _insert_rows(session, rows)
+        count += len(parts)
+        after = parts[-1].product_drawing_number
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='零件搜索索引维护')
+    parser.add_argument('--rebuild', action='store_true', help='根据库存表重建索引')
+    args = parser.parse_args()
+    if args.rebuild:
+        from data_dao import get_engine, unit_of_work
+        _table.create(get_engine(), checkfirst=True)
+        with unit_of_work() as session:
+            print(f'已重建 {rebuild(session)} 个零件的搜索索引')
+    else:
+        parser.print_help()
@@ -0,0 +1,122 @@
+"""
+库存服务的 HTTP/JSON 协议,服务端(inventory_service)和客户端(remote_dao)共用。
+
+- POST /call   {"dao": "parts", "method": "move_stock", "args": [...], "kwargs": {...}}
+               -> {"result": 返回值} 或 {"error": {"type": 异常类名, "message": 说明, "args": 异常参数}}
+- POST /batch  {"calls": [调用, ...]} -> {"results": [{"result": ...} 或 {"error": ...}, ...]}
+               一次往返按顺序执行多个调用,每个调用单独提交,某个调用失败不影响其他调用
+- GET  /health 服务状态、连接池和请求统计
+
+日期、零件、操作日志等 JSON 不能直接表示的值编码为只有一个键的对象 {"$类型": 值};
+配置了令牌时每个请求都要带 X-Inventory-Token 请求头。
+"""
+import json
+from datetime import date, datetime
+
+from sqlalchemy import inspect
+
+from data_dao import (StockError, PartNotFoundError, InsufficientStockError, ConcurrentUpdateError,
+                      VersionConflictError)
+from data_model import Part, OperationLog
+
+DEFAULT_PORT = 8765
+TOKEN_HEADER = 'X-Inventory-Token'
+
+# 服务提供的 DAO 和方法,只有这里列出的方法可以远程调用
+METHODS = {
+    'parts': {'add_part', 'get_parts_by_drawing_numbers', 'get_part_by_drawing_number', 'query_data_by_condition',
+              'search', 'query_page', 'query_after', 'update_part_quantity', 'move_stock', 'adjust_quantities',
+              'upsert_parts', 'delete_part_by_drawing_number', 'query_all_data', 'batch_delete', 'update_part'},
+    'logs': {'add_operation_log', 'query_logs', 'get_logs_by_drawing_number', 'delete_logs_by_drawing_number'},
+    'feed': {'latest_seq', 'changes_after', 'prune'},
+}
+
+# 只读的方法: 连接在等待响应时断开,客户端可以重新发送;其他方法可能已经执行,不能重发
+READ_ONLY_METHODS = {
+    'parts': {'get_parts_by_drawing_numbers', 'get_part_by_drawing_number', 'query_data_by_condition', 'search',
+              'query_page', 'query_after', 'query_all_data'},
+    'logs': {'query_logs', 'get_logs_by_drawing_number'},
+    'feed': {'latest_seq', 'changes_after'},
+}
+
+_MODELS = {'$part': Part, '$log': OperationLog}
+_ATTRIBUTES = {model: {attribute.key for attribute in model.__mapper__.column_attrs} for model in _MODELS.values()}
+# 库存异常及重建异常所需的属性,按构造参数的顺序
+_ERROR_FIELDS = {
+    PartNotFoundError: ('drawing_number',),
+    InsufficientStockError: ('drawing_number', 'quantity', 'delta'),
+    ConcurrentUpdateError: ('drawing_number', 'attempts'),
+    VersionConflictError: ('drawing_number', 'expected', 'actual'),
+}
+
+
+class ServiceError(Exception):
+    """
+    库存服务返回了意外的错误
+    """
+
+
+class ServiceUnavailableError(ServiceError):
+    """
+    无法连接库存服务
+    """
+
+
+def encode(value):
+    """
+    把返回值或参数转换为可以 JSON 序列化的值
+    """
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    for tag, model in _MODELS.items():
+        if isinstance(value, model):
+            # 只传已赋值的属性,未赋值的列在服务端插入时仍使用默认值
+            attributes = _ATTRIBUTES[model]
+            return {tag: {key: encode(item) for key, item in inspect(value).dict.items() if key in attributes}}
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [encode(item) for item in value]
+    return value
+
+
+def _decode_object(obj):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag == '$datetime':
+            return datetime.fromisoformat(value)
+        if tag == '$date':
+            return date.fromisoformat(value)
+        if tag in _MODELS:
+            return _MODELS[tag](**value)
+    return obj
+
+
+def dumps(value):
+    return json.dumps(encode(value), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode_object)
+
+
+def error_to_json(error):
+    fields = _ERROR_FIELDS.get(type(error))
+    return {'type': type(error).__name__, 'message': str(error),
+            'args': [getattr(error, field) for field in fields] if fields else None}
+
+
+def error_from_json(error):
+    """
+    按服务端的异常类型重建异常,库存异常和 ValueError 与直接调用 DAO 时相同,其他异常为 ServiceError
+    """
+    for cls, fields in _ERROR_FIELDS.items():
+        if cls.__name__ == error['type'] and error.get('args') is not None:
+            return cls(*error['args'])
+    if error['type'] == StockError.__name__:
+        return StockError(error['message'])
+    if error['type'] == ValueError.__name__:
+        return ValueError(error['message'])
+    return ServiceError(f"{error['type']}: {error['message']}")
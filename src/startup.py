@@ -0,0 +1,78 @@
+"""
+启动耗时统计: 记录从进程启动到导入模块、窗口首次绘制、数据库预热完成、第一页数据显示的各阶段耗时,
+窗口首次绘制超过 [Startup] budget_ms 时在报告中给出警告。
+"""
+import time
+
+from PySide6.QtCore import QObject, QEvent
+
+# 窗口首次绘制的默认预算(毫秒)
+DEFAULT_BUDGET_MS = 1500
+# 阶段名称
+FIRST_PAINT = '窗口首次绘制'
+DATABASE_READY = '数据库预热完成'
+FIRST_PAGE = '第一页数据显示'
+
+
+class StartupTimer:
+    """
+    :param started: 计时起点(time.perf_counter),默认为创建对象的时间
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.marks = []  # [(阶段, 距起点秒数)]
+
+    def mark(self, stage):
+        """
+        记录阶段完成的时间,同一阶段只记录第一次
+        :return: 距起点秒数
+        """
+        for name, elapsed in self.marks:
+            if name == stage:
+                return elapsed
+        elapsed = time.perf_counter() - self.started
+        self.marks.append((stage, elapsed))
+        return elapsed
+
+    def elapsed(self, stage):
+        for name, elapsed in self.marks:
+            if name == stage:
+                return elapsed
+        return None
+
+    def over_budget(self, budget_ms=DEFAULT_BUDGET_MS):
+        first_paint = self.elapsed(FIRST_PAINT)
+        return first_paint is not None and first_paint * 1000 > budget_ms
+
+    def report(self, budget_ms=DEFAULT_BUDGET_MS):
+        lines = ['启动耗时:']
+        previous = 0.0
+        for stage, elapsed in sorted(self.marks, key=lambda mark: mark[1]):
+            lines.append(f'  {elapsed * 1000:8.0f} ms  (+{(elapsed - previous) * 1000:6.0f} ms)  {stage}')
+            previous = elapsed
+        first_paint = self.elapsed(FIRST_PAINT)
+        if first_paint is not None:
+            state = '超出预算' if self.over_budget(budget_ms) else '在预算内'
+            lines.append(f'{FIRST_PAINT} {first_paint * 1000:.0f} ms,预算 {budget_ms} ms,{state}')
+        return '\n'.join(lines)
+
+
+class FirstPaintWatcher(QObject):
+    """
+    窗口第一次收到绘制事件时记录到 StartupTimer,之后不再监听
+    """
+
+    def __init__(self, widget, timer, callback=None):
+        super().__init__(widget)
+        self.timer = timer
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            watched.removeEventFilter(self)
+            self.timer.mark(FIRST_PAINT)
+            if self.callback is not None:
+                self.callback()
+        return False
@@ -1,16 +1,105 @@
 # src/ui_controller.py
+import logging
 import string
 import random
+import time
 
 from data_model import Part, OperationLog
-from data_dao import PartDAO, OperationLogDAO
+import data_dao
+from data_dao import (PartDAO, OperationLogDAO, StockError, PartNotFoundError, PAGE_SIZE, config, query_profiler,
+                      part_cache)
+import audit_log
+from widgets.table_models import PartTableModel, LogTableModel, FrameTableModel
+from workers import QueryRunner, ProgressReporter
+import part_import
+import part_export
+import startup
+import migrations
+import replica
+import change_feed
+import remote_dao
 from PySide6.QtGui import QShortcut
 from PySide6.QtWidgets import (QMenu, QInputDialog, QMessageBox,
-                               QTableWidgetItem, QTableWidget, QFormLayout, QLineEdit, QVBoxLayout, QDialog,
-                               QSizePolicy, QDialogButtonBox, QTableWidgetSelectionRange, QCheckBox, QLabel,
-                               QHeaderView)
-from PySide6.QtCore import Qt
-from datetime import datetime
+                               QTableView, QFormLayout, QLineEdit, QVBoxLayout, QDialog,
+                               QSizePolicy, QDialogButtonBox, QLabel,
+                               QHeaderView, QDateEdit, QComboBox, QCheckBox, QHBoxLayout, QPushButton,
+                               QFileDialog, QPlainTextEdit)
+from PySide6.QtCore import Qt, QItemSelectionModel, QTimer
+from datetime import datetime, timedelta
+from search_index import normalize
+
+# 停止输入多少毫秒后筛选零件
+FILTER_DEBOUNCE_MS = 250
+# 表格正在查询时,其他终端的变更延后多少毫秒再应用
+FEED_RETRY_MS = 200
+
+
+def _covers(loaded, conditions):
+    """
+    loaded 条件查到的零件是否包含 conditions 条件下的全部零件: 图号、名称的关键字包含原关键字,
+    日期范围在原范围之内
+    """
+    for key in ('drawing_number', 'name'):
+        if normalize(loaded.get(key)) not in normalize(conditions.get(key)):
+            return False
+    start, end = loaded.get('start_time'), loaded.get('end_time')
+    if start is not None and (conditions.get('start_time') is None or conditions['start_time'] < start):
+        return False
+    return end is None or (conditions.get('end_time') is not None and conditions['end_time'] <= end)
+
+
+def _matches(part, conditions):
+    """
+    零件是否符合数据库查询条件,与 PartDAO.query_data_by_condition 的条件一致
+    """
+    if normalize(conditions.get('drawing_number')) not in normalize(part.product_drawing_number) or \
+            normalize(conditions.get('name')) not in normalize(part.name):
+        return False
+    start, end = conditions.get('start_time'), conditions.get('end_time')
+    if start is None and end is None:
+        return True
+    return part.update_time is not None and (start is None or start <= part.update_time) and \
+        (end is None or part.update_time <= end)
+
+
+def _prepare_database(poller):
+    """
+    建立第一个数据库连接,按 [Database] auto_migrate 配置执行尚未执行的数据库升级。
+    启用本地副本([Replica] enabled)时打开本地副本并启动后台同步,主库暂时无法连接时用本地数据启动;
+    连接主库时清理 [ChangeFeed] retention_days 天之前的变更记录,从最新的变更开始轮询其他终端的修改。
+    配置了库存服务([Service] url)时只检查服务是否可用,数据库升级和变更记录清理由服务完成
+    :return: (连接耗时秒数,主库无法连接时为 None, 本次执行的升级步骤, 没有自动执行的升级步骤,
+              本地副本,未启用时为 None, 库存服务客户端,未配置时为 None)
+    """
+    client = remote_dao.from_config(data_dao.load_config())
+    if client is not None:
+        start = time.perf_counter()
+        client.health()
+        seconds = time.perf_counter() - start
+        # 轮询定时器在返回之后才启动,此时修改轮询使用的 DAO 不会与轮询同时进行
+        poller.feed_dao = remote_dao.RemoteChangeFeedDAO(client)
+        poller.part_dao = remote_dao.RemotePartDAO(client)
+        poller.reset()
+        return seconds, [], [], None, client
+    data_dao.init()
+    local = replica.from_config(config)
+    try:
+        seconds = data_dao.warm_up()
+        if config.getboolean('Database', 'auto_migrate', fallback=False):
+            executed, waiting = migrations.upgrade(), []
+        else:
+            executed, waiting = [], migrations.pending()
+        poller.reset(config.getint('ChangeFeed', 'retention_days', fallback=7))
+    except replica.OFFLINE_ERRORS:
+        if local is None:
+            raise
+        seconds, executed, waiting = None, [], []
+    if local is not None:
+        # 第一次使用本地副本时先完整拉取一次,之后由后台线程同步
+        if seconds is not None and not local.initialized():
+            local.sync()
+        local.start()
+    return seconds, executed, waiting, local, None
 
 
 class UIController:
@@ -20,27 +109,50 @@ class UIController:
         self.part_dao = PartDAO()  # 创建 PartDAO 实例
         self.log_dao = OperationLogDAO()
         self.widget = widget
-        self.widget.tableWidget.setSelectionBehavior(QTableWidget.SelectRows)
+        # 查询在线程池中执行,表格只显示最后一次查询的结果
+        self.query_runner = QueryRunner(self.widget)
+        self.query_runner.busy_changed.connect(self.widget.busy_indicator.setVisible)
+        # 定时在后台读取其他终端的修改,不显示忙碌状态
+        self.change_poller = change_feed.ChangePoller()
+        self.feed_runner = QueryRunner(self.widget)
+        self.feed_timer = QTimer(self.widget)
+        self.feed_timer.timeout.connect(self.poll_changes)
+        self.feed_failed = False
+        self.widget.tableView.setSelectionBehavior(QTableView.SelectRows)
         self.sort_order = {}  # 初始化排序顺序字典
 
-        self.widget.tableWidget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.widget.tableWidget.customContextMenuRequested.connect(self.create_context_menu)
+        # 零件表格和操作日志表格的数据模型,单元格由视图按需绘制
+        self.part_model = PartTableModel(self.widget.tableView)
+        self.log_model = LogTableModel(self.widget.tableView)
+        self.part_model.dataChanged.connect(self.on_part_data_changed)
+        self.widget.tableView.setModel(self.part_model)
+        self.setup_part_header()
+
+        self.widget.tableView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.widget.tableView.customContextMenuRequested.connect(self.create_context_menu)
 
         # 操作绑定
         self.widget.shortcut.activated.connect(self.on_ctrl_f_pressed)  # 快捷键触发时执行 on_ctrl_f_pressed 函数
-        self.widget.drawing_number_input.returnPressed.connect(self.find_part())  # 图号输入框回车时执行 find 函数
+        self.widget.drawing_number_input.returnPressed.connect(self.find_part)  # 图号输入框回车时执行 find 函数
+        # 输入图号、名称时停止输入一段时间后筛选零件,能在已加载的零件中筛选时不查询数据库
+        self.filter_timer = QTimer(self.widget)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DEBOUNCE_MS)
+        self.filter_timer.timeout.connect(self.live_filter)
+        self.widget.drawing_number_input.textChanged.connect(lambda text: self.filter_timer.start())
+        self.widget.name_input.textChanged.connect(lambda text: self.filter_timer.start())
         self.ctrl_s_shortcut = QShortcut('Ctrl+S', self.widget)
         self.ctrl_s_shortcut.activated.connect(self.commit_edit)
-        self.widget.tableWidget.itemDoubleClicked.connect(self.edit_item)  # 双击表格项时执行 edit_item 函数
+        self.widget.tableView.doubleClicked.connect(self.edit_item)  # 双击表格项时执行 edit_item 函数
 
         # ---- 按钮操作事件
         self.widget.get_stock_b.clicked.connect(self.get_stock)  # 将获取库存按钮点击事件连接到 get_stock 函数
         # self.change_stock_b.clicked.connect(self.change_stock)
-        self.widget.tableWidget.horizontalHeader().sectionClicked.connect(
+        self.widget.tableView.horizontalHeader().sectionClicked.connect(
             self.sort_column)  # 将表格组件水平表头点击事件连接到 sort_column 函数
         self.widget.find_b.clicked.connect(self.find_part)  # 将查找按钮点击事件连接到 find 函数
         # 将表格右击事件连接到 show_context_menu 函数
-        self.widget.tableWidget.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.widget.tableView.setContextMenuPolicy(Qt.CustomContextMenu)
         # 将新增零件按钮点击事件连接到 add_part_dialog 函数
         self.widget.add_button.clicked.connect(self.add_part_dialog)
 
@@ -49,6 +161,164 @@ class UIController:
         self.widget.batch_delete_button.clicked.connect(self.batch_delete)  # 将批量删除按钮绑定到batch_delete函数
         self.widget.batch_storage_button.clicked.connect(self.batch_storage)  # 将批量入库按钮绑定到batch_storage函数
         self.widget.batch_exit_button.clicked.connect(self.batch_out_storage)  # 将批量出库按钮绑定到batch_out_storage函数
+        self.widget.check_all_button.clicked.connect(self.check_all)  # 将全选按钮绑定到check_all函数
+        self.widget.invert_check_button.clicked.connect(self.invert_check)  # 将反选按钮绑定到invert_check函数
+        self.widget.report_button.clicked.connect(self.report_dialog)  # 将统计报表按钮绑定到report_dialog函数
+        self.widget.import_button.clicked.connect(self.import_parts)  # 将批量导入按钮绑定到import_parts函数
+        # 后台导入时每写入一批汇报一次进度
+        self.import_progress = ProgressReporter(self.widget)
+        self.import_progress.progress.connect(
+            lambda statistics: self.add_log(f"导入中: {part_import.describe(statistics)}"))
+        self.widget.export_button.clicked.connect(self.export_table)  # 将导出按钮绑定到export_table函数
+        self.export_progress = ProgressReporter(self.widget)
+        self.export_progress.progress.connect(lambda count: self.add_log(f"导出中: 已写入 {count} 行"))
+        self.widget.profiler_button.clicked.connect(self.profiler_dialog)  # 将SQL统计按钮绑定到profiler_dialog函数
+        self.profiler_warnings = None
+        self.replica = None
+        self.replica_messages = None
+        self.service = None
+        # 表格当前显示内容的查询条件,导出时按同样的条件重新流式查询
+        self.part_conditions = {}
+        # 已加载的零件对应的数据库查询条件,没有加载过时为 None
+        self.loaded_conditions = None
+        self.log_conditions = {}
+        self.reports = None
+
+    def start(self, timer=None, on_ready=None):
+        """
+        窗口显示后调用: 在后台读取配置、连接数据库,完成后加载第一页零件
+        :param timer: StartupTimer,记录数据库预热和第一页数据显示的时间
+        :param on_ready: 第一页数据显示后(或连接失败后)回调
+        """
+        def finish():
+            if on_ready is not None:
+                on_ready()
+
+        def on_first_page(parts):
+            if timer is not None:
+                timer.mark(startup.FIRST_PAGE)
+            self.add_log(f"已加载{len(parts)}条零件数据{'(滚动到底部继续加载)' if self.part_model.has_more() else ''}")
+            finish()
+
+        def on_result(result):
+            seconds, executed, waiting, local, client = result
+            if timer is not None:
+                timer.mark(startup.DATABASE_READY)
+            self.configure_log_panel()
+            if client is not None:
+                self.use_service(client)
+                self.add_log(f"库存服务 {client.url} 连接就绪,耗时 {seconds * 1000:.0f} ms")
+            elif seconds is None:
+                self.add_log("主库无法连接,使用本地副本中的数据,恢复连接后自动同步", logging.WARNING)
+            else:
+                self.add_log(f"数据库连接就绪,耗时 {seconds * 1000:.0f} ms")
+            if local is not None:
+                self.use_replica(local)
+            for version, description in executed:
+                self.add_log(f"已执行数据库升级 {version}: {description}")
+            if waiting:
+                self.add_log(f"数据库有 {len(waiting)} 个升级步骤尚未执行,请执行 python migrations.py: "
+                             + ', '.join(f'{version} {description}' for version, description in waiting),
+                             logging.WARNING)
+            self.on_database_ready()
+            self.load_parts(on_first_page)
+            self.start_change_feed(seconds is not None)
+
+        def on_error(error):
+            self.configure_log_panel()
+            self.add_log(f"连接或升级数据库失败: {error}", logging.ERROR)
+            finish()
+
+        self.query_runner.submit('startup', _prepare_database, self.change_poller, on_result=on_result,
+                                 on_error=on_error)
+
+    def configure_log_panel(self):
+        # 日志窗口参数可在 [LogPanel] 中配置,读取配置前的日志在配置日志文件时补写
+        log_panel = self.widget.log_panel
+        log_panel.set_max_blocks(config.getint('LogPanel', 'max_blocks', fallback=5000))
+        log_panel.set_flush_interval(config.getint('LogPanel', 'flush_interval_ms', fallback=100))
+        log_file = config.get('LogPanel', 'log_file', fallback='inventory.log')
+        if log_file:
+            log_panel.persist_to(log_file, config.getint('LogPanel', 'log_max_bytes', fallback=1024 * 1024),
+                                 config.getint('LogPanel', 'log_backup_count', fallback=5))
+
+    def use_service(self, client):
+        # 零件和操作日志的查询、修改都通过库存服务,不直接连接数据库
+        self.service = client
+        self.part_dao = remote_dao.RemotePartDAO(client)
+        self.log_dao = remote_dao.RemoteOperationLogDAO(client)
+
+    def use_replica(self, local):
+        # 零件的查询和修改改为使用本地副本,同步冲突和主库连接状态的变化来自同步线程,通过信号显示在日志窗口
+        self.replica = local
+        self.part_dao = replica.ReplicaPartDAO(local)
+        self.replica_messages = ProgressReporter(self.widget)
+        self.replica_messages.progress.connect(lambda message: self.add_log(message, logging.WARNING))
+        local.add_listener(self.replica_messages.progress.emit)
+        statistics = local.statistics()
+        self.add_log(f"使用本地副本 {local.path}: {statistics['parts']} 个零件,"
+                     f"待同步 {statistics['pending']} 条,冲突 {statistics['conflicts']} 条")
+
+    def start_change_feed(self, online):
+        # 使用本地副本时由副本的同步线程拉取其他终端的修改
+        interval = config.getint('ChangeFeed', 'poll_interval_ms', fallback=2000)
+        if online and interval > 0 and self.replica is None:
+            self.feed_timer.start(interval)
+
+    def poll_changes(self):
+        """
+        在后台读取上次轮询之后其他终端的修改,上一次轮询还没有完成时跳过
+        """
+        if not self.feed_runner.is_busy_channel('feed'):
+            self.feed_runner.submit('feed', self.change_poller.poll, on_result=self.apply_changes,
+                                    on_error=self.on_poll_failed)
+
+    def on_poll_failed(self, error):
+        # 连接中断时每次轮询都会失败,只在第一次失败时记录
+        if not self.feed_failed:
+            self.feed_failed = True
+            self.add_log(f"读取其他终端的修改失败: {error}", logging.WARNING)
+
+    def apply_changes(self, changes):
+        """
+        把其他终端的修改应用到零件表格: 只更新、插入或删除变化的行,不重新查询;
+        变更记录不连续时按当前条件重新查询
+        """
+        self.feed_failed = False
+        if not (changes.parts or changes.deleted or changes.reload):
+            return
+        if self.query_runner.is_busy_channel('table'):
+            # 表格正在重新查询,等查询结果显示后再应用,否则修改会被查询结果覆盖或被新查询的结果取代
+            QTimer.singleShot(FEED_RETRY_MS, lambda: self.apply_changes(changes))
+            return
+        if changes.reload:
+            if self.widget.tableView.model() is self.part_model and self.loaded_conditions is not None:
+                self.load_parts(**self.part_conditions)
+            return
+        model = self.part_model
+        conditions = self.loaded_conditions or {}
+        removed = list(changes.deleted)
+        updated = []
+        for part in changes.parts:
+            matched = _matches(part, conditions)
+            if model.contains(part.product_drawing_number):
+                if matched:
+                    updated.append(part)
+                else:
+                    removed.append(part.product_drawing_number)
+            elif matched:
+                model.insert_part(part)
+        if removed:
+            model.remove_parts(removed)
+        if updated:
+            model.update_parts(updated)
+
+    def on_database_ready(self):
+        # 慢语句和 N+1 警告可配置为同时输出到日志窗口,警告可能来自后台线程,通过信号回到主线程
+        if self.profiler_warnings is None and config.getboolean('Profiling', 'log_panel', fallback=False):
+            self.profiler_warnings = ProgressReporter(self.widget)
+            self.profiler_warnings.progress.connect(lambda message: self.add_log(message, logging.WARNING))
+            query_profiler.add_listener(self.profiler_warnings.progress.emit)
 
     def add_part(self, part_data):
         # 处理添加零件的逻辑
@@ -57,7 +327,7 @@ class UIController:
 
     def update_part_quantity(self, drawing_number, new_quantity):
         # 处理更新零件数量的逻辑
-        self.part_dao.update_part_quantity(drawing_number, new_quantity)
+        return self.part_dao.update_part_quantity(drawing_number, new_quantity)
 
     def add_operation_log(self, log_data):
         # 处理添加操作记录的逻辑
@@ -74,74 +344,113 @@ class UIController:
 
     # 清理日志函数
     def clear_log(self):
-        self.widget.log_editor.clear()
+        self.widget.log_panel.clear()
 
-    def add_log(self, message):
-        """将日志信息添加到日志编辑器中。"""
-        self.widget.log_editor.appendPlainText(message)
+    def add_log(self, message, level=logging.INFO):
+        """将日志信息添加到日志窗口中,日志窗口定时批量显示。"""
+        self.widget.log_panel.add(message, level)
 
     # 表格数据填充函数
-    def render_table(self, parts):
-        self.clear_table()
-        # 设置表格固定列名为: 物料编号、产品图号、产品名称、库存数量、每箱数量、最后更改时间
-        column_names = ["", "物料编号", "产品图号", "产品名称", "库存数量", "每箱数量", "上次更改日期"]  # 列名列表
-        self.widget.tableWidget.setColumnCount(len(column_names))
-        self.widget.tableWidget.setHorizontalHeaderLabels(column_names)  # 设置表格列名
-
-        header = self.widget.tableWidget.horizontalHeader()  # 获取表格的水平表头
+    def render_table(self, parts, fetch_next=None, sort=None, descending=False):
+        # 切换回零件模型,行由模型按需分批暴露给视图
+        if self.widget.tableView.model() is not self.part_model:
+            self.widget.tableView.setModel(self.part_model)
+            self.setup_part_header()
+        if sort is None:
+            self.widget.tableView.horizontalHeader().setSortIndicatorShown(False)
+        self.part_model.set_parts(parts, fetch_next, sort, descending)
+
+    def load_parts(self, on_first_page=None, **conditions):
+        """
+        键集分页加载零件: 先在后台取第一页并立即显示,滚动到底部时再取下一页。
+        conditions 中可以带 sort/descending,由数据库按该列排序分页
+        """
+        self.part_conditions = conditions
+
+        def fetch_next(after, generation):
+            self.query_runner.submit(
+                'page', self.part_dao.query_after, after, PAGE_SIZE, **conditions,
+                on_result=lambda parts: self.part_model.append_page(parts, generation, len(parts) == PAGE_SIZE),
+                on_error=lambda error: (self.part_model.cancel_fetch(generation), self.on_query_failed(error)))
+
+        def on_result(parts):
+            self.loaded_conditions = conditions
+            self.render_table(parts, fetch_next if len(parts) == PAGE_SIZE else None, conditions.get('sort'),
+                              conditions.get('descending', False))
+            if on_first_page is not None:
+                on_first_page(parts)
+
+        self.query_runner.submit('table', self.part_dao.query_after, None, PAGE_SIZE, **conditions,
+                                 on_result=on_result, on_error=self.on_query_failed)
+
+    def setup_part_header(self):
+        header = self.widget.tableView.horizontalHeader()  # 获取表格的水平表头
         header.setSectionResizeMode(0, QHeaderView.Fixed)  # 设置第一列的宽度模式为固定
-        header.resizeSection(0, 20)  # 设置第一列的宽度为50
-        for i in range(1, len(column_names) - 1):
+        header.resizeSection(0, 20)  # 设置第一列的宽度为20
+        for i in range(1, self.part_model.columnCount() - 1):
             header.setSectionResizeMode(i, QHeaderView.Stretch)
             # header.setSectionResizeMode(i, QHeaderView.Interactive)  # 设置其他列的宽度模式为可手动拖动
-        self.widget.tableWidget.setRowCount(len(parts) + 1)
-        for i, part in enumerate(parts):
-            checkbox = QCheckBox()
-            # 复选框设置为未选中状态
-            checkbox.setCheckState(Qt.Unchecked)
-            # 复选框状态改变时触发 select_row 函数
-            checkbox.stateChanged.connect(lambda state, row=i: self.select_row(state, row))
-            # 将复选框添加到表格中
-            self.widget.tableWidget.setCellWidget(i, 0, checkbox)
-
-            self.widget.tableWidget.setItem(i, 1, QTableWidgetItem(str(part.no)))
-            self.widget.tableWidget.setItem(i, 2, QTableWidgetItem(part.product_drawing_number))
-            self.widget.tableWidget.setItem(i, 3, QTableWidgetItem(part.name))
-            self.widget.tableWidget.setItem(i, 4, QTableWidgetItem(str(part.inventory_quantity)))
-            self.widget.tableWidget.setItem(i, 5, QTableWidgetItem(str(part.quantity_per_carton)))
-            self.widget.tableWidget.setItem(i, 6, QTableWidgetItem(part.update_time.strftime("%Y-%m-%d")))
-
-    def render_log_table(self, log):
-        self.clear_table()
-        # 重新设置表格列名
-        self.widget.tableWidget.setHorizontalHeaderLabels(
-            ["时间", "产品图号", "操作类型", "操作字段", "更改前值", "更改后值"])
-        # 重新设置第一列宽度为自适应
-        self.widget.tableWidget.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
-        # 设置表格行数
-        self.widget.tableWidget.setRowCount(len(log))
-
-        for i, log in enumerate(log):
-            self.widget.tableWidget.setItem(i, 0, QTableWidgetItem(str(log.time)))
-            self.widget.tableWidget.setItem(i, 1, QTableWidgetItem(log.product_drawing_number))
-            self.widget.tableWidget.setItem(i, 2, QTableWidgetItem(log.operator_type))
-            self.widget.tableWidget.setItem(i, 3, QTableWidgetItem(log.operator_fields))
-            self.widget.tableWidget.setItem(i, 4, QTableWidgetItem(log.value_before_change))
-            self.widget.tableWidget.setItem(i, 5, QTableWidgetItem(log.changed_value))
-
-    def select_row(self, state, row):
-        if state == Qt.Checked:
-            self.widget.tableWidget.selectRow(row)
-        else:
-            self.widget.tableWidget.setRangeSelected(
-                QTableWidgetSelectionRange(row, 0, row, self.widget.tableWidget.columnCount() - 1), False)
+
+    def render_log_table(self, log, fetch_next=None):
+        self.log_model.set_logs(log, fetch_next)
+        if self.widget.tableView.model() is not self.log_model:
+            self.widget.tableView.setModel(self.log_model)
+            # 重新设置第一列宽度为自适应
+            header = self.widget.tableView.horizontalHeader()
+            header.setSectionResizeMode(0, QHeaderView.ResizeToContents)
+            for i in range(1, self.log_model.columnCount()):
+                header.setSectionResizeMode(i, QHeaderView.Stretch)
+
+    def on_part_data_changed(self, top_left, bottom_right, roles):
+        # 单个复选框勾选时同时选中该行,取消勾选时取消选中; 全选/反选等批量变化不逐行同步选中状态
+        if Qt.CheckStateRole not in roles or top_left.column() != 0 or top_left.row() != bottom_right.row():
+            return
+        row = top_left.row()
+        self.select_row(self.part_model.is_checked(row), row)
+
+    def check_all(self):
+        # 已全部勾选时再次点击则取消全选
+        self.part_model.set_all_checked(not self.part_model.all_checked())
+
+    def invert_check(self):
+        self.part_model.invert_checked()
+
+    def check_selected_rows(self, checked):
+        # 勾选或取消勾选表格中选中的连续行
+        rows = sorted(index.row() for index in self.widget.tableView.selectionModel().selectedRows())
+        if not rows:
+            return
+        first = last = rows[0]
+        for row in rows[1:] + [None]:
+            if row is not None and row == last + 1:
+                last = row
+                continue
+            self.part_model.set_range_checked(first, last, checked)
+            if row is not None:
+                first = last = row
+
+    def select_row(self, checked, row):
+        flag = QItemSelectionModel.Select if checked else QItemSelectionModel.Deselect
+        self.widget.tableView.selectionModel().select(self.part_model.index(row, 0),
+                                                      flag | QItemSelectionModel.Rows)
+
+    def selected_part(self):
+        """
+        返回当前选中行对应的零件,未选中或当前显示的不是零件表格时返回 None
+        """
+        if self.widget.tableView.model() is not self.part_model:
+            return None
+        rows = self.widget.tableView.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.part_model.part_at(rows[0].row())
 
     def context_menu(self, event):
         self.create_context_menu(event)
 
     def create_context_menu(self, position):
 
-        self.context_menu = QMenu(self.widget.tableWidget)  # 创建右键菜单
+        self.context_menu = QMenu(self.widget.tableView)  # 创建右键菜单
 
         # 创建菜单项
         out_stock_action = self.context_menu.addAction("出库")
@@ -149,6 +458,8 @@ class UIController:
         edit_action = self.context_menu.addAction("编辑")
         delete_action = self.context_menu.addAction("删除")
         add_action = self.context_menu.addAction("查询操作日志")
+        check_action = self.context_menu.addAction("勾选选中行")
+        uncheck_action = self.context_menu.addAction("取消勾选选中行")
 
         # 连接菜单项的触发信号到相应的槽函数
         out_stock_action.triggered.connect(self.out_stock)
@@ -156,6 +467,8 @@ class UIController:
         edit_action.triggered.connect(self.edit_part)
         delete_action.triggered.connect(self.delete_part)
         add_action.triggered.connect(self.query_operate_log)
+        check_action.triggered.connect(lambda: self.check_selected_rows(True))
+        uncheck_action.triggered.connect(lambda: self.check_selected_rows(False))
 
         # 将菜单项添加到右键菜单
         self.context_menu.addAction(out_stock_action)
@@ -163,9 +476,11 @@ class UIController:
         self.context_menu.addAction(edit_action)
         self.context_menu.addAction(delete_action)
         self.context_menu.addAction(add_action)
+        self.context_menu.addAction(check_action)
+        self.context_menu.addAction(uncheck_action)
 
         # 在鼠标点击的位置显示右键菜单
-        self.context_menu.exec_(self.widget.tableWidget.viewport().mapToGlobal(position))
+        self.context_menu.exec_(self.widget.tableView.viewport().mapToGlobal(position))
 
     def query_operate_log(self):
         """
@@ -173,79 +488,114 @@ class UIController:
         :return:
         """
         # 1、获取当前选中行的图号
-        selected_rows = self.widget.tableWidget.selectedItems()
-        if len(selected_rows) == 0:
+        selected_part = self.selected_part()
+        if selected_part is None:
             QMessageBox.warning(self.widget, "警告", "请先选择要查询的零件")
             return
-        drawing_number = selected_rows[1].text()
-        # 2、获取该图号的操作日志
-        logs = self.get_logs_by_drawing_number(drawing_number)
-        # 3、将操作日志重新渲染在表格组件当中,重写render_table函数
-        self.render_log_table(logs)
+        drawing_number = selected_part.product_drawing_number
+        # 2、选择时间范围和操作类型
+        dialog = LogQueryDialog(drawing_number, self.widget)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        start_time, end_time, operator_types = dialog.get_condition()
+        # 3、在后台倒序分页获取该图号的操作日志,并渲染在表格组件当中
+        self.load_logs(drawing_number=drawing_number, start_time=start_time, end_time=end_time,
+                       operator_types=operator_types)
+
+    def load_logs(self, **conditions):
+        """
+        按时间倒序分页加载操作日志: 先显示最新的一页,滚动到底部时再取更早的一页
+        """
+        self.log_conditions = conditions
+
+        def fetch_next(after, generation):
+            self.query_runner.submit(
+                'page', self.log_dao.query_logs, after=after, limit=PAGE_SIZE, **conditions,
+                on_result=lambda logs: self.log_model.append_page(logs, generation, len(logs) == PAGE_SIZE),
+                on_error=lambda error: (self.log_model.cancel_fetch(generation), self.on_query_failed(error)))
+
+        def on_result(logs):
+            self.render_log_table(logs, fetch_next if len(logs) == PAGE_SIZE else None)
+            more = "(滚动到底部继续加载)" if self.log_model.has_more() else ""
+            self.add_log(f"查询了{conditions.get('drawing_number')}的操作日志,已加载{len(logs)}条{more}")
+
+        self.query_runner.submit('table', self.log_dao.query_logs, limit=PAGE_SIZE, **conditions,
+                                 on_result=on_result, on_error=self.on_query_failed)
 
+    @query_profiler.profiled('界面.出库')
     def out_stock(self):
         # 出库操作
         # 点击出库按钮时,获取表格当前行所有数据,弹出输入框,输入出库数量
-        selected_rows = self.widget.tableWidget.selectedItems()
-        if len(selected_rows) == 0:
+        selected_part = self.selected_part()
+        if selected_part is None:
             QMessageBox.warning(self.widget, "警告", "请先选择要出库的零件")
             return
-        drawing_number = selected_rows[1].text()
-        before_part = self.part_dao.get_part_by_drawing_number(drawing_number)
+        drawing_number = selected_part.product_drawing_number
         quantity = QInputDialog.getInt(self.widget, "出库", f"请输入{drawing_number}出库数量")
         if quantity[1]:
-            # 出库操作为减少库存数量
-            self.update_part_quantity(drawing_number, before_part.inventory_quantity - quantity[0])
-            self.add_log(f"出库了{quantity[0]}个{before_part.name}零件")
-            self.find_part()
+            # 出库操作为减少库存数量,以数据库中的最新库存为准
+            if self.move_stock(drawing_number, -quantity[0]):
+                self.add_log(f"出库了{quantity[0]}个{selected_part.name}零件")
 
+    @query_profiler.profiled('界面.入库')
     def in_stock(self):
         # 入库操作
         # 点击入库按钮时，获取当前选中的行,并获取选中行的图号,弹出输入框,输入入库数量
         # 选择这一行所有的值
-        selected_rows = self.widget.tableWidget.selectedItems()
-        if len(selected_rows) == 0:
+        selected_part = self.selected_part()
+        if selected_part is None:
             QMessageBox.warning(self.widget, "警告", "请先选择要入库的零件")
             return
-        drawing_number = selected_rows[1].text()
-        name = selected_rows[2].text()
-        old_quantity = int(selected_rows[3].text())
+        drawing_number = selected_part.product_drawing_number
+        name = selected_part.name
         quantity = QInputDialog.getInt(self.widget, "入库", f"请输入{drawing_number}入库数量")
         if quantity[1]:
-            self.update_part_quantity(drawing_number, old_quantity + quantity[0])
-            self.add_log(f"入库了{quantity[0]}个{name}零件")
-            self.find_part()
+            if self.move_stock(drawing_number, quantity[0]):
+                self.add_log(f"入库了{quantity[0]}个{name}零件")
+
+    def move_stock(self, drawing_number, delta):
+        """
+        单件出入库并刷新该行,失败时弹出提示并返回 False
+        """
+        try:
+            _, new_quantity = self.part_dao.move_stock(drawing_number, delta)
+        except StockError as e:
+            QMessageBox.warning(self.widget, "警告", str(e))
+            return False
+        self.part_model.update_quantities({drawing_number: new_quantity})
+        return True
 
     def edit_part(self):
         # 弹出新对话框, 新对话框中显示选中行的数据,并可以修改
-        selected_rows = self.widget.tableWidget.selectedItems()
-        if len(selected_rows) == 0:
+        selected_part = self.selected_part()
+        if selected_part is None:
             QMessageBox.warning(self.widget, "警告", "请先选择要编辑的零件")
             return
-        drawing_number = selected_rows[1].text()
+        drawing_number = selected_part.product_drawing_number
         # 根据图号获取零件信息
         part = self.part_dao.get_part_by_drawing_number(drawing_number)
         q_dialog = EditPartDialog(part, self.widget, self)
         # 展示对话框
         q_dialog.exec_()
 
-    def edit_item(self, item):
-        # 单元格编辑操作
-        item.setFlags(item.flags() | Qt.ItemIsEditable)
-        index = self.widget.tableWidget.indexFromItem(item)
-        self.widget.tableWidget.edit(index)
+    def edit_item(self, index):
+        # 单元格编辑操作,只有模型标记为可编辑的列才会进入编辑状态
+        if index.flags() & Qt.ItemIsEditable:
+            self.widget.tableView.edit(index)
 
     def commit_edit(self):
-        item = self.widget.tableWidget.currentItem()
-        self.update_item(item)
+        index = self.widget.tableView.currentIndex()
+        if index.isValid() and self.widget.tableView.model() is self.part_model:
+            self.update_item(index)
 
-    def update_item(self, item):
-        row = item.row()
-        column = item.column()
-        new_value = item.text()
+    @query_profiler.profiled('界面.表格编辑')
+    def update_item(self, index):
+        row = index.row()
+        column = index.column()
+        new_value = index.data(Qt.EditRole)
 
         # 获取需要更新的零件的图号
-        drawing_number = self.widget.tableWidget.item(row, 2).text()
+        drawing_number = self.part_model.part_at(row).product_drawing_number
         # 根据列号确定需要更新的字段
         if column == 3:  # 假设名称在第4列
             field = 'name'
@@ -257,19 +607,47 @@ class UIController:
             return  # 如果不是这些列，不进行更新
 
         # 更新数据库
-        part = self.part_dao.get_part_by_drawing_number(drawing_number)
-        if part:
+        try:
+            part = self.part_dao.get_part_by_drawing_number(drawing_number)
+            if part is None:
+                # 其他终端已删除该零件
+                self.part_model.remove_parts([drawing_number])
+                QMessageBox.warning(self.widget, "警告", f"零件 {drawing_number} 已被删除")
+                return
             setattr(part, field, new_value)
-            self.part_dao.update_part(part)
-            self.add_log(f"更新了{drawing_number}零件的{field}为{new_value}")
+            updated = self.part_dao.update_part(part)
+        except Exception as e:
+            self.add_log(f"更新{drawing_number}零件失败: {e}", logging.ERROR)
+            QMessageBox.warning(self.widget, "警告", f"更新零件失败: {e}")
+            self.restore_row(drawing_number)
+            return
+        self.part_model.update_parts([updated])
+        self.add_log(f"更新了{drawing_number}零件的{field}为{new_value}")
 
+    def restore_row(self, drawing_number):
+        """
+        表格编辑没有保存时,表格中已修改的行恢复为数据库中的值
+        """
+        # 缓存中的零件可能就是刚才修改过的对象
+        part_cache.invalidate([drawing_number])
+        try:
+            part = self.part_dao.get_part_by_drawing_number(drawing_number)
+        except Exception as e:
+            self.add_log(f"重新读取{drawing_number}零件失败,表格中的值未保存: {e}", logging.ERROR)
+            return
+        if part is None:
+            self.part_model.remove_parts([drawing_number])
+        else:
+            self.part_model.update_parts([part])
+
+    @query_profiler.profiled('界面.删除')
     def delete_part(self):
         # 处理删除零件的逻辑
-        selected_rows = self.widget.tableWidget.selectedItems()
-        if len(selected_rows) == 0:
+        selected_part = self.selected_part()
+        if selected_part is None:
             QMessageBox.warning(self.widget, "警告", "请先选择要编辑的零件")
             return
-        drawing_number = selected_rows[1].text()
+        drawing_number = selected_part.product_drawing_number
         # 根据图号获取零件信息
         part = self.part_dao.get_part_by_drawing_number(drawing_number)
         # 弹出是否确认删除的对话框
@@ -277,8 +655,13 @@ class UIController:
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
             self.add_log(f'删除图号为: {drawing_number},name: {part.name}')
-            self.part_dao.delete_part_by_drawing_number(drawing_number)
-            self.find_part()
+            try:
+                self.part_dao.delete_part_by_drawing_number(drawing_number)
+            except Exception as e:
+                self.add_log(f"删除失败: {e}", logging.ERROR)
+                QMessageBox.warning(self.widget, "警告", f"删除失败: {e}")
+                return
+            self.part_model.remove_parts([drawing_number])
         else:
             return
 
@@ -288,24 +671,33 @@ class UIController:
 
     # 表格数据清空函数
     def clear_table(self):
-        self.widget.tableWidget.setRowCount(0)
+        self.part_model.clear()
 
     # 获取所有数据函数
     def get_stock(self):
-        # 关联data_dao内的query_all_data函数，并将查询到的数据渲染到表格中
-        parts = self.part_dao.query_all_data()
-        self.render_table(parts)
+        # 分页加载全部零件,并将查询到的数据渲染到表格中
+        self.load_parts()
 
     def find_part(self):
         """
         查找函数,支持根据图号,产品名称查找数据
         :return:
         """
+        self.filter_timer.stop()
         drawing_number, name, start_time, end_time = self.get_query_condition()
-        parts = self.part_dao.query_data_by_condition(drawing_number, name, start_time, end_time, self.add_log)
-        self.add_log(
-            f"查询了图号为{drawing_number},名称为{name}的零件,起止时间为{start_time}到{end_time}的零件信息,共{len(parts)}条数据")
-        self.render_table(parts)
+
+        def on_first_page(parts):
+            more = "(滚动到底部继续加载)" if self.part_model.has_more() else ""
+            self.add_log(
+                f"查询了图号为{drawing_number},名称为{name}的零件,起止时间为{start_time}到{end_time}的零件信息,"
+                f"已加载{len(parts)}条数据{more}")
+
+        # 查询在后台线程执行,先显示第一页
+        self.load_parts(on_first_page, drawing_number=drawing_number, name=name, start_time=start_time,
+                        end_time=end_time)
+
+    def on_query_failed(self, error):
+        self.add_log(f"查询失败: {error}", logging.ERROR)
 
     def on_ctrl_f_pressed(self):
         # 获取光标并清除内容
@@ -315,14 +707,50 @@ class UIController:
     # 字段排序函数
     def sort_column(self, index):
         # 获取当前列引用
-        header = self.widget.tableWidget.horizontalHeaderItem(index).text()
+        model = self.widget.tableView.model()
+        header = model.headerData(index, Qt.Horizontal)
+
+        # 点击复选框列表头时全选/取消全选
+        if model is self.part_model and index == 0:
+            self.check_all()
+            return
 
         # 获取排序顺序
         sort_order = self.sort_order.get(header, Qt.AscendingOrder)
         self.sort_order[header] = Qt.DescendingOrder if sort_order == Qt.AscendingOrder else Qt.AscendingOrder
 
-        # 排序数据
-        self.widget.tableWidget.sortItems(index, self.sort_order[header])
+        order = self.sort_order[header]
+        self.widget.tableView.horizontalHeader().setSortIndicatorShown(True)
+        self.widget.tableView.horizontalHeader().setSortIndicator(index, order)
+        if model is self.part_model:
+            sort = {'sort': self.part_model.FIELDS[index], 'descending': order == Qt.DescendingOrder}
+            if self.part_model.has_more():
+                # 只取回了部分零件,由数据库按该列排序后重新分页加载
+                self.load_parts(**dict(self.part_conditions, **sort))
+                return
+            # 导出时按表格当前的顺序
+            self.part_conditions = dict(self.part_conditions, **sort)
+
+        # 全部数据已取回,按列的类型在内存中排序
+        model.sort(index, order)
+
+    def live_filter(self):
+        """
+        图号、名称输入变化后筛选零件: 已加载的零件已全部取回,且新条件只是在加载时的条件上进一步缩小时,
+        直接在内存中筛选;条件放宽到已加载的范围之外时才重新查询数据库
+        """
+        if self.widget.tableView.model() is not self.part_model:
+            return
+        drawing_number, name, start_time, end_time = self.get_query_condition()
+        conditions = {'drawing_number': drawing_number, 'name': name, 'start_time': start_time,
+                      'end_time': end_time}
+        if self.loaded_conditions is None or self.part_model.has_more() \
+                or self.query_runner.is_busy_channel('table') or not _covers(self.loaded_conditions, conditions):
+            self.find_part()
+            return
+        self.part_model.set_filter(**conditions)
+        sort, descending = self.part_model.sort_state()
+        self.part_conditions = dict(conditions, sort=sort, descending=descending)
 
     # 条件查询函数
     def get_query_condition(self):
@@ -333,18 +761,14 @@ class UIController:
         return drawing_number, name, start_time, end_time
 
     # 批量删除函数
+    @query_profiler.profiled('界面.批量删除')
     def batch_delete(self):
         """
         批量删除函数,根据用户选择的行删除数据
         :return:
         """
         # 获取选中的行的图号
-        drawing_numbers = set()
-        for i in range(self.widget.tableWidget.rowCount()):
-            checkbox = self.widget.tableWidget.cellWidget(i, 0)
-            if checkbox is not None and checkbox.isChecked():
-                drawing_number = self.widget.tableWidget.item(i, 2).text()
-                drawing_numbers.add(drawing_number)
+        drawing_numbers = self.part_model.checked_keys()
 
         if not drawing_numbers:
             # 弹出警告框
@@ -352,70 +776,166 @@ class UIController:
             return
 
         # 弹出确认框
-        reply = QMessageBox.question(self.widget, "警告", "是否删除选中的零件?", QMessageBox.Yes | QMessageBox.No)
+        listed = sorted(drawing_numbers)
+        text = '、'.join(listed[:10]) + (" 等" if len(listed) > 10 else "")
+        reply = QMessageBox.question(self.widget, "警告", f"是否删除选中的 {len(listed)} 个零件: {text}?",
+                                     QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.No:
             return
 
         # 删除选中的行
-        self.part_dao.batch_delete(drawing_numbers, self.add_log)
-        self.find_part()
+        try:
+            self.part_dao.batch_delete(drawing_numbers, self.add_log)
+        except Exception as e:
+            self.add_log(f"批量删除失败: {e}", logging.ERROR)
+            QMessageBox.warning(self.widget, "警告", f"批量删除失败: {e}")
+            return
+        self.part_model.remove_parts(drawing_numbers)
 
     # 弹出新增零件对话框,对话框包括产品图号,产品名称,库存数量,每箱数量
+    def import_parts(self):
+        """
+        从 CSV/XLSX 批量导入零件,导入在后台线程执行,完成后重新加载表格
+        """
+        if self.query_runner.is_busy_channel('import'):
+            QMessageBox.warning(self.widget, "警告", "正在导入,请等待当前导入完成")
+            return
+        path, _ = QFileDialog.getOpenFileName(self.widget, "批量导入", "", "零件表格 (*.xlsx *.csv)")
+        if not path:
+            return
+        self.add_log(f"开始导入 {path}")
+
+        def on_result(statistics):
+            self.add_log(f"导入完成: {part_import.describe(statistics)}")
+            self.get_stock()
+
+        self.query_runner.submit('import', part_import.import_parts, path, part_dao=self.part_dao,
+                                 progress=self.import_progress.progress.emit,
+                                 on_result=on_result, on_error=lambda error: self.add_log(f"导入失败: {error}", logging.ERROR))
+
+    def export_table(self):
+        """
+        按表格当前显示内容的查询条件导出全部结果(不只是已加载的行),导出在后台线程执行
+        """
+        if self.query_runner.is_busy_channel('export'):
+            QMessageBox.warning(self.widget, "警告", "正在导出,请等待当前导出完成")
+            return
+        showing_logs = self.widget.tableView.model() is self.log_model
+        path, _ = QFileDialog.getSaveFileName(self.widget, "导出", "操作日志.xlsx" if showing_logs else "库存.xlsx",
+                                              "Excel 文件 (*.xlsx);;CSV 文件 (*.csv)")
+        if not path:
+            return
+        if showing_logs:
+            export, conditions = part_export.export_logs, dict(self.log_conditions, log_dao=self.log_dao)
+        else:
+            export, conditions = part_export.export_parts, dict(self.part_conditions, part_dao=self.part_dao)
+        self.add_log(f"开始导出到 {path}")
+        self.query_runner.submit('export', export, path, self.export_progress.progress.emit, **conditions,
+                                 on_result=lambda statistics: self.add_log(part_export.describe(statistics)),
+                                 on_error=lambda error: self.add_log(f"导出失败: {error}", logging.ERROR))
+
+    def profiler_dialog(self):
+        ProfilerDialog(self.widget).exec_()
+
+    def report_dialog(self):
+        # 统计报表直接读取数据库,通过库存服务访问数据时不可用
+        if self.service is not None:
+            QMessageBox.warning(self.widget, "警告", "通过库存服务访问数据时不能使用统计报表")
+            return
+        # 统计报表依赖 numpy 和 pandas,未安装时提示
+        try:
+            import analytics  # noqa: F401
+        except ImportError:
+            QMessageBox.warning(self.widget, "警告", "统计报表需要安装 numpy 和 pandas")
+            return
+        if self.reports is None:
+            self.reports = ReportDialog(self.widget)
+            self.reports.drawing_number_input.setText(self.widget.drawing_number_input.text())
+        self.reports.show()
+        self.reports.raise_()
+
     def add_part_dialog(self):
         q_dialog = AddPartDialog(self.widget, self)
         q_dialog.exec_()
 
+    @query_profiler.profiled('界面.批量入库')
     def batch_storage(self):
-        # 获取选中的行的图号
-        drawing_numbers = set()
-        for i in range(self.widget.tableWidget.rowCount()):
-            checkbox = self.widget.tableWidget.cellWidget(i, 0)
-            if checkbox is not None and checkbox.isChecked():
-                drawing_number = self.widget.tableWidget.item(i, 2).text()
-                drawing_numbers.add(drawing_number)
+        # 对话框只需要零件名称,直接使用表格中已加载并勾选的零件
+        parts = self.part_model.checked_parts()
 
-        if not drawing_numbers:
+        if not parts:
             # 弹出警告框
             QMessageBox.warning(self.widget, "警告", "请先选择要批量入库的零件")
             return
 
-        parts = [self.part_dao.get_part_by_drawing_number(drawing_number) for drawing_number in drawing_numbers]
-
         dialog = BatchStorageDialog(parts, self.widget)
         if dialog.exec_() == QDialog.Accepted:
-            quantities = dialog.get_values()
-            for part, quantity in zip(parts, quantities):
-                self.update_part_quantity(part.product_drawing_number, part.inventory_quantity + int(quantity))
-                self.add_log(f"入库了 {quantity} 个 {part.product_drawing_number} 零件")
-            self.find_part()
-
+            deltas = self.collect_deltas(parts, dialog.get_values(), 1)
+            if deltas is None:
+                return
+            # 所有零件在同一个事务中按增量更新
+            if not self.adjust_quantities(deltas):
+                return
+            for drawing_number, delta in deltas.items():
+                self.add_log(f"入库了 {delta} 个 {drawing_number} 零件")
+
+    @query_profiler.profiled('界面.批量出库')
     def batch_out_storage(self):
         """
         批量出库
         :return:
         """
-        # 获取选中的行的图号
-        drawing_numbers = set()
-        for i in range(self.widget.tableWidget.rowCount()):
-            checkbox = self.widget.tableWidget.cellWidget(i, 0)
-            if checkbox is not None and checkbox.isChecked():
-                drawing_number = self.widget.tableWidget.item(i, 2).text()
-                drawing_numbers.add(drawing_number)
+        # 对话框只需要零件名称,直接使用表格中已加载并勾选的零件
+        parts = self.part_model.checked_parts()
 
-        if not drawing_numbers:
+        if not parts:
             # 弹出警告框
             QMessageBox.warning(self.widget, "警告", "请先选择要批量出库的零件")
             return
 
-        parts = [self.part_dao.get_part_by_drawing_number(drawing_number) for drawing_number in drawing_numbers]
-
         dialog = BatchOutStorageDialog(parts, self.widget)
         if dialog.exec_() == QDialog.Accepted:
-            quantities = dialog.get_values()
-            for part, quantity in zip(parts, quantities):
-                self.update_part_quantity(part.product_drawing_number, part.inventory_quantity - int(quantity))
-                self.add_log(f"出库了 {quantity} 个 {part.product_drawing_number} 零件")
-            self.find_part()
+            deltas = self.collect_deltas(parts, dialog.get_values(), -1)
+            if deltas is None:
+                return
+            # 所有零件在同一个事务中按增量更新
+            if not self.adjust_quantities(deltas):
+                return
+            for drawing_number, delta in deltas.items():
+                self.add_log(f"出库了 {-delta} 个 {drawing_number} 零件")
+
+    def adjust_quantities(self, deltas):
+        """
+        批量出入库并刷新这些行,任一零件库存不足或已被删除时整体不生效,弹出提示并返回 False
+        """
+        try:
+            quantities = self.part_dao.adjust_quantities(deltas)
+        except PartNotFoundError as e:
+            # 其他终端删除了勾选的零件,从表格中移除后由用户重新操作
+            self.part_model.remove_parts([e.drawing_number])
+            self.add_log(f"批量出入库未执行: {e}", logging.WARNING)
+            QMessageBox.warning(self.widget, "警告", f"{e},已从表格中移除,本次批量出入库未执行")
+            return False
+        except StockError as e:
+            QMessageBox.warning(self.widget, "警告", str(e))
+            return False
+        self.part_model.update_quantities(quantities)
+        return True
+
+    def collect_deltas(self, parts, quantities, sign):
+        """
+        将批量对话框中输入的数量转换为 {图号: 增减数量},未填写的零件跳过,输入不是整数时提示并返回 None
+        """
+        deltas = {}
+        for part, quantity in zip(parts, quantities):
+            if not quantity.strip():
+                continue
+            try:
+                deltas[part.product_drawing_number] = sign * int(quantity)
+            except ValueError:
+                QMessageBox.warning(self.widget, "警告", f"{part.name} 的数量必须是整数")
+                return None
+        return deltas
 
 
 class EditPartDialog(QDialog, UIController):
@@ -423,7 +943,8 @@ class EditPartDialog(QDialog, UIController):
         super().__init__(parent)
         self.widget = parent
         self.ui_controller = ui_controller
-        self.part_dao = PartDAO()  # 创建 PartDAO 实例
+        # 使用主窗口当前的 DAO,启用本地副本或库存服务时修改也经过它们
+        self.part_dao = ui_controller.part_dao
 
         self.setWindowTitle("编辑零件")
 
@@ -464,12 +985,19 @@ class EditPartDialog(QDialog, UIController):
     def update_part(self):
         updated_part = self.get_updated_part()
         part = Part(**updated_part)
-        self.part_dao.update_part(part)
+        try:
+            updated = self.part_dao.update_part(part)
+        except Exception as e:
+            # 库存服务不可用或零件已被删除时对话框保持打开
+            self.ui_controller.add_log(f"更新零件失败: {e}", logging.ERROR)
+            QMessageBox.warning(self, "警告", f"更新零件失败: {e}")
+            return
         # 日志输出更改信息,包括图号,名称,库存数量,每箱数量,原来的数据和更新后的数据
-        self.add_log(f"更新了{part.name}零件,更新后数据为{part.__str__()}")
+        self.ui_controller.add_log(f"更新了{part.name}零件,更新后数据为{part.__str__()}")
         # 添加更新日期，图号，操作类型，更改字段，更改前值，更改后值
 
-        self.find_part()
+        # 只刷新被编辑的行
+        self.ui_controller.part_model.update_parts([updated])
         # 关闭对话框
         self.close()
 
@@ -488,8 +1016,9 @@ class AddPartDialog(QDialog, UIController):
         super().__init__(parent)
         self.widget = parent
         self.ui_controller = ui_controller
-        self.part_dao = PartDAO()  # 创建 PartDAO 实例
-        self.log_dao = OperationLogDAO()
+        # 使用主窗口当前的 DAO,启用本地副本或库存服务时修改也经过它们
+        self.part_dao = ui_controller.part_dao
+        self.log_dao = ui_controller.log_dao
 
         self.setWindowTitle("新增零件")
 
@@ -528,10 +1057,17 @@ class AddPartDialog(QDialog, UIController):
     def add_part(self):
         new_part = self.get_new_part()
         part = Part(**new_part)
-        self.part_dao.add_part(part)
+        try:
+            self.part_dao.add_part(part)
+        except Exception as e:
+            # 库存服务不可用或图号已存在时对话框保持打开
+            self.ui_controller.add_log(f"新增零件失败: {e}", logging.ERROR)
+            QMessageBox.warning(self, "警告", f"新增零件失败: {e}")
+            return
         # 日志输出新增信息,包括图号,名称,库存数量,每箱数量
-        self.add_log(f"新增了{new_part['name']}零件,数据为{new_part}")
-        self.find_part()
+        self.ui_controller.add_log(f"新增了{new_part['name']}零件,数据为{new_part}")
+        # 按当前排序插入新行
+        self.ui_controller.part_model.insert_part(part)
         # 关闭对话框
         self.close()
 
@@ -547,12 +1083,190 @@ class AddPartDialog(QDialog, UIController):
             # 2组固定值为0
             "b_group_total": 0,
             # 上次更改日期默认为当前日期
-            "update_time": datetime.now().strftime("%Y-%m-%d"),
+            "update_time": datetime.now().date(),
             # id:00001c1f41af455d92c8fe2ced77a106359 随机生成35数字小写字母混合
             "id": ''.join(random.choices(string.ascii_lowercase + string.digits, k=35))
         }
 
 
+class LogQueryDialog(QDialog):
+    """
+    操作日志查询条件: 时间范围和操作类型
+    """
+    OPERATION_TYPES = [audit_log.OPERATION_IN_STOCK, audit_log.OPERATION_OUT_STOCK, audit_log.OPERATION_UPDATE,
+                       audit_log.OPERATION_ADD, audit_log.OPERATION_DELETE]
+
+    def __init__(self, drawing_number, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"查询 {drawing_number} 的操作日志")
+
+        self.layout = QVBoxLayout(self)
+        self.form_layout = QFormLayout()
+        self.layout.addLayout(self.form_layout)
+
+        # 默认不限时间,取消勾选后按日期范围查询
+        self.all_time_input = QCheckBox("全部时间")
+        self.all_time_input.setChecked(True)
+        self.form_layout.addRow(self.all_time_input)
+
+        self.start_time_input = QDateEdit()
+        self.start_time_input.setCalendarPopup(True)
+        self.start_time_input.setDisplayFormat("yyyy-MM-dd")
+        self.start_time_input.setDate((datetime.now() - timedelta(days=30)).date())
+        self.form_layout.addRow("开始日期", self.start_time_input)
+
+        self.end_time_input = QDateEdit()
+        self.end_time_input.setCalendarPopup(True)
+        self.end_time_input.setDisplayFormat("yyyy-MM-dd")
+        self.end_time_input.setDate(datetime.now().date())
+        self.form_layout.addRow("结束日期", self.end_time_input)
+
+        self.all_time_input.toggled.connect(self.start_time_input.setDisabled)
+        self.all_time_input.toggled.connect(self.end_time_input.setDisabled)
+        self.start_time_input.setDisabled(True)
+        self.end_time_input.setDisabled(True)
+
+        self.operator_type_input = QComboBox()
+        self.operator_type_input.addItem("全部")
+        self.operator_type_input.addItems(self.OPERATION_TYPES)
+        self.form_layout.addRow("操作类型", self.operator_type_input)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.layout.addWidget(self.button_box)
+
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+    def get_condition(self):
+        """
+        :return: (开始日期, 结束日期, 操作类型列表),不限时为 None
+        """
+        if self.all_time_input.isChecked():
+            start_time = end_time = None
+        else:
+            start_time = self.start_time_input.date().toPython()
+            end_time = self.end_time_input.date().toPython()
+        index = self.operator_type_input.currentIndex()
+        operator_types = [self.OPERATION_TYPES[index - 1]] if index > 0 else None
+        return start_time, end_time, operator_types
+
+
+def build_report(report, start_time, end_time, drawing_number):
+    """
+    在后台线程中先汇总新的操作日志,再生成报表
+    """
+    import analytics
+    analytics.refresh()
+    if report == "库存变化趋势":
+        return analytics.stock_over_time(start_time, end_time, drawing_number)
+    if report == "每日出入库":
+        return analytics.daily_movements(start_time, end_time, drawing_number)
+    if report == "周转率":
+        frame = analytics.turnover(start_time, end_time)
+        return frame.loc[[drawing_number]] if drawing_number in frame.index else frame
+    frame = analytics.group_split()
+    return frame.loc[['合计', drawing_number]] if drawing_number in frame.index else frame
+
+
+class ReportDialog(QDialog):
+    """
+    统计报表: 库存变化趋势、每日出入库、周转率、1组/2组占比
+    """
+    REPORTS = ["库存变化趋势", "每日出入库", "周转率", "分组占比"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("统计报表")
+        self.resize(900, 600)
+        self.query_runner = QueryRunner(self)
+
+        self.layout = QVBoxLayout(self)
+        self.condition_layout = QHBoxLayout()
+        self.layout.addLayout(self.condition_layout)
+
+        self.report_input = QComboBox()
+        self.report_input.addItems(self.REPORTS)
+        self.drawing_number_input = QLineEdit()
+        self.drawing_number_input.setPlaceholderText("为空时统计全部零件")
+        self.start_time_input = QDateEdit()
+        self.start_time_input.setCalendarPopup(True)
+        self.start_time_input.setDisplayFormat("yyyy-MM-dd")
+        self.start_time_input.setDate((datetime.now() - timedelta(days=30)).date())
+        self.end_time_input = QDateEdit()
+        self.end_time_input.setCalendarPopup(True)
+        self.end_time_input.setDisplayFormat("yyyy-MM-dd")
+        self.end_time_input.setDate(datetime.now().date())
+        self.query_button = QPushButton("生成")
+
+        self.condition_layout.addWidget(self.report_input)
+        self.condition_layout.addWidget(QLabel("图号:"))
+        self.condition_layout.addWidget(self.drawing_number_input)
+        self.condition_layout.addWidget(QLabel("日期:"))
+        self.condition_layout.addWidget(self.start_time_input)
+        self.condition_layout.addWidget(self.end_time_input)
+        self.condition_layout.addWidget(self.query_button)
+
+        self.table_view = QTableView()
+        self.table_view.setSortingEnabled(True)
+        self.model = FrameTableModel(self.table_view)
+        self.table_view.setModel(self.model)
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.layout.addWidget(self.table_view)
+        self.status_label = QLabel()
+        self.layout.addWidget(self.status_label)
+
+        self.query_button.clicked.connect(self.generate)
+        self.report_input.currentIndexChanged.connect(self.generate)
+
+    def generate(self):
+        report = self.report_input.currentText()
+        start_time = self.start_time_input.date().toPython()
+        end_time = self.end_time_input.date().toPython()
+        if start_time > end_time:
+            QMessageBox.warning(self, "警告", "开始日期不能晚于结束日期")
+            return
+        drawing_number = self.drawing_number_input.text().strip() or None
+        self.status_label.setText("正在生成...")
+        self.query_runner.submit('report', build_report, report, start_time, end_time, drawing_number,
+                                 on_result=lambda frame: self.show_report(report, frame),
+                                 on_error=lambda error: self.status_label.setText(f"生成失败: {error}"))
+
+    def show_report(self, report, frame):
+        self.model.set_frame(frame)
+        self.status_label.setText(f"{report}: {len(frame)} 行")
+
+
+class ProfilerDialog(QDialog):
+    """
+    SQL 统计: 耗时最多的语句、语句最多的操作和 N+1 模式
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("SQL统计")
+        self.resize(1000, 600)
+
+        self.layout = QVBoxLayout(self)
+        self.report_editor = QPlainTextEdit()
+        self.report_editor.setReadOnly(True)
+        self.report_editor.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.layout.addWidget(self.report_editor)
+
+        self.button_layout = QHBoxLayout()
+        self.refresh_button = QPushButton("刷新")
+        self.reset_button = QPushButton("清零")
+        self.button_layout.addWidget(self.refresh_button)
+        self.button_layout.addWidget(self.reset_button)
+        self.layout.addLayout(self.button_layout)
+
+        self.refresh_button.clicked.connect(self.refresh)
+        self.reset_button.clicked.connect(lambda: (query_profiler.reset(), self.refresh()))
+        self.refresh()
+
+    def refresh(self):
+        self.report_editor.setPlainText(query_profiler.report(top=20))
+
+
 class BatchStorageDialog(QDialog):
     def __init__(self, parts, parent=None):
         super().__init__(parent)
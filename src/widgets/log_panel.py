@@ -0,0 +1,151 @@
+import logging
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QWidget, QPlainTextEdit, QVBoxLayout, QHBoxLayout, QComboBox, QLineEdit
+
+# 日志级别显示名称
+LEVEL_NAMES = {
+    logging.DEBUG: '调试',
+    logging.INFO: '信息',
+    logging.WARNING: '警告',
+    logging.ERROR: '错误',
+}
+# 级别筛选: (显示名称, 最低级别)
+LEVEL_FILTERS = [('全部', logging.DEBUG), ('信息及以上', logging.INFO), ('警告及以上', logging.WARNING),
+                 ('错误', logging.ERROR)]
+
+logger = logging.getLogger('inventory')
+
+
+def format_entry(entry):
+    created, level, message = entry
+    return f"{created:%H:%M:%S} [{LEVEL_NAMES.get(level, level)}] {message}"
+
+
+class LogPanel(QWidget):
+    """
+    日志窗口: 消息先放入待显示队列,由定时器每 flush_interval 毫秒合并为一次追加;
+    窗口和内存中只保留最近 max_blocks 条,按级别和关键字筛选显示。
+    配置日志文件后每条消息同时写入按大小滚动的文件,清除窗口不影响文件
+    """
+
+    def __init__(self, max_blocks=5000, flush_interval=100, parent=None):
+        super().__init__(parent)
+        self.editor = QPlainTextEdit()
+        self.editor.setReadOnly(True)  # 设置只读
+        self.editor.setUndoRedoEnabled(False)
+        self.editor.setPlaceholderText("日志输出:")
+        self.level_filter = QComboBox()
+        for title, level in LEVEL_FILTERS:
+            self.level_filter.addItem(title, level)
+        self.keyword_filter = QLineEdit()
+        self.keyword_filter.setPlaceholderText('筛选日志')
+        self.keyword_filter.setClearButtonEnabled(True)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.level_filter)
+        filter_layout.addWidget(self.keyword_filter)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.editor)
+
+        self._entries = deque()  # 最近的 (时间, 级别, 消息)
+        self._pending = []  # 等待下一次追加的消息
+        self._unsaved = deque()  # 配置日志文件之前的消息,配置后补写
+        self._file_handler = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self.set_max_blocks(max_blocks)
+        self.set_flush_interval(flush_interval)
+        self.level_filter.currentIndexChanged.connect(self.refresh)
+        self.keyword_filter.textChanged.connect(self.refresh)
+
+    # ---- 配置
+    def set_max_blocks(self, max_blocks):
+        self.max_blocks = max_blocks
+        self.editor.setMaximumBlockCount(max_blocks)
+        self._entries = deque(self._entries, maxlen=max_blocks)
+        self._unsaved = deque(self._unsaved, maxlen=max_blocks)
+
+    def set_flush_interval(self, flush_interval):
+        """
+        :param flush_interval: 毫秒
+        """
+        self._timer.setInterval(flush_interval)
+
+    def persist_to(self, path, max_bytes=1024 * 1024, backup_count=5):
+        """
+        消息同时写入按大小滚动的日志文件,之前显示过的消息先补写
+        """
+        if self._file_handler is not None:
+            logger.removeHandler(self._file_handler)
+            self._file_handler.close()
+        self._file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                 encoding='utf-8', delay=True)
+        self._file_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(self._file_handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        self._write(self._unsaved)
+        self._unsaved.clear()
+
+    # ---- 消息
+    def add(self, message, level=logging.INFO):
+        """
+        添加一条消息,在主线程调用;消息在下一次定时追加时显示
+        """
+        self._pending.append((datetime.now(), level, str(message)))
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """
+        把待显示的消息一次追加到窗口并写入日志文件
+        """
+        self._timer.stop()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._entries.extend(batch)
+        if self._file_handler is not None:
+            self._write(batch)
+        else:
+            self._unsaved.extend(batch)
+        # 多条消息合并为一次追加,一批超过 max_blocks 条时只追加最后的部分,更早的行由编辑器自动删除
+        visible = [format_entry(entry) for entry in batch[-self.max_blocks:] if self._matches(entry)]
+        if visible:
+            self.editor.appendPlainText('\n'.join(visible))
+
+    def refresh(self):
+        """
+        筛选条件变化后按条件重新显示保留的消息
+        """
+        self.flush()
+        self.editor.setPlainText('\n'.join(format_entry(entry) for entry in self._entries if self._matches(entry)))
+        self.editor.verticalScrollBar().setValue(self.editor.verticalScrollBar().maximum())
+
+    def clear(self):
+        """
+        清除窗口和保留的消息,日志文件中的记录不受影响
+        """
+        self.flush()
+        self._entries.clear()
+        self.editor.clear()
+
+    def entries(self):
+        return list(self._entries)
+
+    def _matches(self, entry):
+        keyword = self.keyword_filter.text()
+        return entry[1] >= self.level_filter.currentData() and (not keyword or keyword in entry[2])
+
+    def _write(self, entries):
+        # 一批消息作为一条记录写入,滚动以批为单位
+        if entries:
+            logger.log(max(entry[1] for entry in entries),
+                       '\n'.join(f"{entry[0]:%Y-%m-%d} {format_entry(entry)}" for entry in entries))
@@ -0,0 +1,751 @@
+import bisect
+from datetime import date
+from operator import attrgetter
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from search_index import normalize
+
+# 每次滚动到底部时追加到视图中的行数
+FETCH_BATCH_SIZE = 200
+
+
+def _narrows(previous, terms):
+    """
+    筛选条件 terms 是否只是在 previous 的基础上更严格
+    """
+    if previous[0] not in terms[0] or previous[1] not in terms[1]:
+        return False
+    if previous[2] is not None and (terms[2] is None or terms[2] < previous[2]):
+        return False
+    return previous[3] is None or (terms[3] is not None and terms[3] <= previous[3])
+
+
+class PartTableModel(QAbstractTableModel):
+    """
+    零件表格模型,单元格内容由视图按需通过 data() 获取,不再为每个零件创建 QTableWidgetItem。
+    行通过 canFetchMore/fetchMore 分批暴露给视图,滚动到底部时才继续追加;
+    分页查询时已加载的行用完后再向数据库请求下一页。
+    设置筛选条件后只显示已取回零件中符合条件的行(_parts),全部已取回的零件保留在 _all 中
+    """
+    # 列名: 复选框、物料编号、产品图号、产品名称、库存数量、每箱数量、上次更改日期
+    COLUMNS = ["", "物料编号", "产品图号", "产品名称", "库存数量", "每箱数量", "上次更改日期"]
+    # 列号对应的 Part 字段
+    FIELDS = [None, "no", "product_drawing_number", "name", "inventory_quantity", "quantity_per_carton",
+              "update_time"]
+    # 可以双击编辑的列: 产品名称、库存数量、每箱数量
+    EDITABLE_COLUMNS = (3, 4, 5)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._parts = []  # 显示的零件,没有筛选条件时与 _all 是同一个列表
+        self._all = self._parts  # 已从数据库取回的零件
+        self._all_index = None  # 图号 -> _all 中的位置,筛选时使用,顺序变化后置为 None
+        self._filter = None  # (图号, 名称, 起始日期, 结束日期),图号和名称已规范化
+        self._filter_keys = {}  # id(零件) -> (规范化的图号, 规范化的名称, 上次更改日期)
+        self._loaded = 0  # 已暴露给视图的行数
+        self._fetch_next = None  # 请求下一页的回调,为 None 表示数据库中没有更多数据
+        self._fetching = False  # 是否正在等待下一页
+        self._cursor = None  # 已取回的最后一个图号,作为下一页的起点
+        self._generation = 0  # 每次重置数据加1,用于丢弃上一次查询迟到的分页结果
+        self._row_index = None  # 图号 -> 行号,行顺序变化后置为 None,用到时重建
+        self._sort_column = 2  # 当前排序列,查询结果默认按图号排序
+        self._sort_descending = False
+        self._sort_keys = {}  # 列号 -> 与 _parts 顺序一致的排序键数组,数据变化时清空
+        # 勾选状态按图号记录: _inverted 为 False 时 _toggled 中的图号为勾选,为 True 时 _toggled 中的图号为未勾选,
+        # 这样全选和反选只需翻转标志位,不需要逐行修改
+        self._toggled = set()
+        self._inverted = False
+
+    # ---- 数据源
+    def set_parts(self, parts, fetch_next=None, sort_field=None, descending=False):
+        """
+        :param parts: 全部零件,或分页查询的第一页
+        :param fetch_next: 还有后续页时传入,滚动到底部时以 fetch_next(最后一个零件的键, generation) 请求下一页,
+                           结果通过 append_page 追加
+        :param sort_field: 查询结果的排序字段,默认按图号;最后一个零件的键与 PartDAO.query_after 的 after 一致
+        """
+        self.beginResetModel()
+        self._parts = self._all = list(parts)
+        self._loaded = min(FETCH_BATCH_SIZE, len(self._parts))
+        self._fetch_next = fetch_next if self._parts else None
+        self._fetching = False
+        self._generation += 1
+        self._row_index = None
+        self._all_index = None
+        self._filter = None
+        self._filter_keys = {}
+        self._sort_keys = {}
+        self._sort_column = self.FIELDS.index(sort_field or "product_drawing_number")
+        self._sort_descending = descending
+        self._cursor = self._cursor_of(self._parts[-1]) if self._parts else None
+        self._toggled = set()
+        self._inverted = False
+        self.endResetModel()
+
+    def append_page(self, parts, generation, has_more):
+        """
+        追加分页查询的下一页,generation 与当前数据不一致时说明已经重新查询,直接丢弃
+        """
+        if generation != self._generation:
+            return
+        self._fetching = False
+        if not has_more or not parts:
+            self._fetch_next = None
+        if not parts:
+            return
+        self._cursor = self._cursor_of(parts[-1])
+        self._sort_keys = {}
+        if self._filter is not None:
+            self._all.extend(parts)
+            self._all_index = None
+            parts = [part for part in parts if self._matches_filter(part)]
+            if not parts:
+                return
+        self._parts.extend(parts)
+        self._row_index = None
+        self.beginInsertRows(QModelIndex(), self._loaded, len(self._parts) - 1)
+        self._loaded = len(self._parts)
+        self.endInsertRows()
+
+    def cancel_fetch(self, generation):
+        """
+        下一页请求失败时调用,允许视图稍后重新请求
+        """
+        if generation == self._generation:
+            self._fetching = False
+
+    def has_more(self):
+        """
+        数据库中是否还有未取回的数据
+        """
+        return self._fetch_next is not None
+
+    def clear(self):
+        self.set_parts([])
+
+    def part_at(self, row):
+        if 0 <= row < self._loaded:
+            return self._parts[row]
+        return None
+
+    def total_count(self):
+        return len(self._parts)
+
+    def loaded_count(self):
+        """
+        已取回的零件数,包括不符合筛选条件的
+        """
+        return len(self._all)
+
+    # ---- 筛选
+    def set_filter(self, drawing_number=None, name=None, start_time=None, end_time=None):
+        """
+        在已取回的零件中筛选,不访问数据库。图号和名称按子串匹配,忽略大小写和首尾空白,
+        与 PartDAO.query_data_by_condition 的条件一致;条件都为空时显示全部已取回的零件。
+        原来是全选状态时,只保留当前显示的行的勾选,新显示出来的行不勾选;被筛选隐藏的行取消勾选,
+        批量删除、出入库只作用于看得到的行
+        """
+        terms = (normalize(drawing_number), normalize(name), start_time, end_time)
+        self._fix_checked()
+        self.beginResetModel()
+        if any(terms):
+            # 继续输入关键字时条件只会更严格,只需在当前显示的行中筛选
+            source = self._parts if self._filter is not None and _narrows(self._filter, terms) else self._all
+            self._filter = terms
+            self._parts = self._filtered(source)
+        else:
+            self._filter = None
+            self._parts = self._all
+        if self._toggled:
+            self._toggled &= {part.product_drawing_number for part in self._parts}
+        self._loaded = min(FETCH_BATCH_SIZE, len(self._parts))
+        self._row_index = None
+        self.endResetModel()
+
+    def is_filtered(self):
+        return self._filter is not None
+
+    def _matches_filter(self, part):
+        return bool(self._filtered([part]))
+
+    def _filtered(self, parts):
+        """
+        符合筛选条件的零件,每个零件的规范化图号和名称只计算一次
+        """
+        drawing_number, name, start_time, end_time = self._filter
+        keys = self._filter_keys
+        dated = start_time is not None or end_time is not None
+        start_time, end_time = start_time or date.min, end_time or date.max
+        result = []
+        for part in parts:
+            key = keys.get(id(part))
+            if key is None:
+                key = keys[id(part)] = (normalize(part.product_drawing_number), normalize(part.name),
+                                        part.update_time)
+            if drawing_number in key[0] and name in key[1] and \
+                    (not dated or (key[2] is not None and start_time <= key[2] <= end_time)):
+                result.append(part)
+        return result
+
+    def _forget_filter_keys(self, parts):
+        for part in parts:
+            self._filter_keys.pop(id(part), None)
+
+    def _index_in_all(self, drawing_number):
+        if self._all_index is None:
+            self._all_index = {part.product_drawing_number: i for i, part in enumerate(self._all)}
+        return self._all_index.get(drawing_number)
+
+    def sort_state(self):
+        """
+        :return: (排序字段, 是否降序)
+        """
+        return self.FIELDS[self._sort_column], self._sort_descending
+
+    # ---- 懒加载
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._loaded < len(self._parts) or (self._fetch_next is not None and not self._fetching)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        remainder = len(self._parts) - self._loaded
+        count = min(FETCH_BATCH_SIZE, remainder)
+        if count <= 0:
+            # 已取回的行都已显示,向数据库请求下一页
+            if self._fetch_next is not None and not self._fetching:
+                self._fetching = True
+                self._fetch_next(self._cursor, self._generation)
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    # ---- QAbstractTableModel 接口
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if column == 0:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self.is_checked(row) else Qt.Unchecked
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self._display_value(self._parts[row], column)
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == 0:
+            flags |= Qt.ItemIsUserCheckable
+        elif index.column() in self.EDITABLE_COLUMNS:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        row, column = index.row(), index.column()
+        if column == 0 and role == Qt.CheckStateRole:
+            self._set_checked(self._parts[row].product_drawing_number, Qt.CheckState(value) == Qt.Checked)
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+            return True
+        if role == Qt.EditRole and column in self.EDITABLE_COLUMNS:
+            field = self.FIELDS[column]
+            if field in ("inventory_quantity", "quantity_per_carton"):
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    return False
+            setattr(self._parts[row], field, value)
+            self._sort_keys = {}
+            self._forget_filter_keys([self._parts[row]])
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+            return True
+        return False
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        按列的实际类型排序全部已取回的零件(数量按数值、日期按日期),同值按图号排序。
+        图号和名称按字符编码比较,与 sqlite 默认的 BINARY 排序规则一致,
+        与 MySQL 不区分大小写的排序规则在大小写和全半角上可能不同。
+        每列的 (值, 图号) 预先换算成一个整数排序键并缓存,排序只比较整数数组,
+        重复点击同一列或在几列之间切换时不再读取零件属性
+        """
+        if self.FIELDS[column] is None:
+            return
+        import numpy as np
+        self.layoutAboutToBeChanged.emit()
+        self._sort_column, self._sort_descending = column, order == Qt.DescendingOrder
+        keys = self._column_keys(column)
+        permutation = np.argsort(-keys if self._sort_descending else keys, kind='stable')
+        self._all = [self._all[i] for i in permutation.tolist()]
+        self._parts = [part for part in self._all if self._matches_filter(part)] if self._filter else self._all
+        self._sort_keys = {cached_column: cached_keys[permutation]
+                           for cached_column, cached_keys in self._sort_keys.items()}
+        self._row_index = None
+        self._all_index = None
+        self.layoutChanged.emit()
+
+    # ---- 增量更新,修改数据后只刷新受影响的行
+    def row_of(self, drawing_number):
+        if self._row_index is None:
+            self._row_index = {part.product_drawing_number: row for row, part in enumerate(self._parts)}
+        return self._row_index.get(drawing_number)
+
+    def contains(self, drawing_number):
+        """
+        图号对应的零件是否已取回,包括筛选时不显示的零件
+        """
+        return self.row_of(drawing_number) is not None or \
+            (self._filter is not None and self._index_in_all(drawing_number) is not None)
+
+    def update_parts(self, parts):
+        """
+        用修改后的零件替换表格中图号相同的行
+        """
+        for part in parts:
+            if self._filter is not None:
+                index = self._index_in_all(part.product_drawing_number)
+                if index is not None:
+                    self._forget_filter_keys([self._all[index]])
+                    self._all[index] = part
+            row = self.row_of(part.product_drawing_number)
+            if row is not None:
+                self._forget_filter_keys([self._parts[row]])
+                self._parts[row] = part
+                self._emit_row_changed(row)
+        self._sort_keys = {}
+
+    def update_quantities(self, quantities):
+        """
+        出入库后更新库存数量和上次更改日期
+        :param quantities: {图号: 新库存数量}
+        """
+        today = date.today()
+        for drawing_number, quantity in quantities.items():
+            row = self.row_of(drawing_number)
+            if row is not None:
+                part = self._parts[row]
+            else:
+                # 筛选时不显示的零件也要更新
+                index = self._index_in_all(drawing_number) if self._filter is not None else None
+                if index is None:
+                    continue
+                part = self._all[index]
+            part.inventory_quantity = quantity
+            part.update_time = today
+            self._forget_filter_keys([part])
+            if row is not None:
+                self._emit_row_changed(row)
+        self._sort_keys = {}
+
+    def insert_part(self, part):
+        """
+        按当前排序插入新零件。分页加载时新零件排在未取回的页中的,留给后续分页取回
+        """
+        if self.contains(part.product_drawing_number):
+            self.update_parts([part])
+            return
+        if self._fetch_next is not None and self._all:
+            last = self._sort_key(self._all[-1])
+            if (self._sort_key(part) < last) if self._sort_descending else (self._sort_key(part) > last):
+                return
+        self._sort_keys = {}
+        if self._filter is not None:
+            self._all.insert(self._insert_position(self._all, part), part)
+            self._all_index = None
+            if not self._matches_filter(part):
+                return
+        row = self._insert_position(self._parts, part)
+        visible = row <= self._loaded
+        if visible:
+            self.beginInsertRows(QModelIndex(), row, row)
+        self._parts.insert(row, part)
+        self._row_index = None
+        if visible:
+            self._loaded += 1
+            self.endInsertRows()
+
+    def _insert_position(self, parts, part):
+        key = self._sort_key(part)
+        if self._sort_descending:
+            return next((row for row, item in enumerate(parts) if self._sort_key(item) < key), len(parts))
+        return bisect.bisect_right(parts, key, key=self._sort_key)
+
+    def remove_parts(self, drawing_numbers):
+        """
+        删除图号对应的行
+        """
+        if self._filter is not None:
+            removed = set(drawing_numbers)
+            kept = [part for part in self._all if part.product_drawing_number not in removed]
+            if len(kept) != len(self._all):
+                self._forget_filter_keys([part for part in self._all if part.product_drawing_number in removed])
+                self._all = kept
+                self._all_index = None
+                self._sort_keys = {}
+        rows = sorted((row for row in map(self.row_of, drawing_numbers) if row is not None), reverse=True)
+        if not rows:
+            return
+        self._sort_keys = {}
+        # 从后往前按连续区间删除,每个区间只发一次信号
+        last = first = rows[0]
+        for row in rows[1:] + [None]:
+            if row is not None and row == first - 1:
+                first = row
+                continue
+            self._remove_range(first, last)
+            if row is not None:
+                last = first = row
+        self._row_index = None
+
+    def _remove_range(self, first, last):
+        visible_last = min(last, self._loaded - 1)
+        if first <= visible_last:
+            self.beginRemoveRows(QModelIndex(), first, visible_last)
+        for part in self._parts[first:last + 1]:
+            self._toggled.discard(part.product_drawing_number)
+        self._forget_filter_keys(self._parts[first:last + 1])
+        del self._parts[first:last + 1]
+        if first <= visible_last:
+            self._loaded -= visible_last - first + 1
+            self.endRemoveRows()
+
+    def _emit_row_changed(self, row):
+        if row < self._loaded:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def _sort_key(self, part):
+        return self._typed_key(part, self._sort_column)
+
+    def _typed_key(self, part, column):
+        """
+        (按类型比较的值, 图号): 数量按数值、日期按序数、文本按字符编码比较,空值排在升序的最前面,与数据库 NULL 的顺序一致
+        """
+        value = getattr(part, self.FIELDS[column])
+        if column in (2, 3):
+            value = value or ""
+        elif value is None:
+            value = float("-inf")
+        elif column == 6:
+            value = value.toordinal()
+        return value, part.product_drawing_number
+
+    def _column_keys(self, column):
+        """
+        列的整数排序键: 值的名次 * 行数 + 图号的名次,与 _typed_key 的顺序一致
+        """
+        keys = self._sort_keys.get(column)
+        if keys is not None:
+            return keys
+        drawing_numbers = self._sort_keys.get(2)
+        if drawing_numbers is None:
+            # 图号唯一,名次即图号的排序键
+            drawing_numbers = self._sort_keys[2] = self._ranks(2)
+        if column == 2:
+            return drawing_numbers
+        keys = self._sort_keys[column] = self._ranks(column) * len(self._all) + drawing_numbers
+        return keys
+
+    def _ranks(self, column):
+        """
+        每行的值在该列所有值中的名次,空值最小;文本按字符编码排名(numpy 字符串比较),与 _typed_key 相同
+        """
+        import numpy as np
+        values = list(map(attrgetter(self.FIELDS[column]), self._all))
+        if column in (2, 3):
+            values = np.array([value or "" for value in values], dtype=str)
+        elif column == 6:
+            values = np.array([value.toordinal() if value else 0 for value in values], dtype=np.int64)
+        else:
+            values = np.array(values, dtype=float)  # None 转为 nan
+            values[np.isnan(values)] = -np.inf
+        return np.unique(values, return_inverse=True)[1].reshape(-1).astype(np.int64)
+
+    def _cursor_of(self, part):
+        """
+        分页查询的起点: 按图号排序时为图号,否则为 (排序字段的值, 图号)
+        """
+        if self._sort_column == 2:
+            return part.product_drawing_number
+        return getattr(part, self.FIELDS[self._sort_column]), part.product_drawing_number
+
+    # ---- 复选框
+    def is_checked(self, row):
+        return (self._parts[row].product_drawing_number in self._toggled) != self._inverted
+
+    def set_all_checked(self, checked):
+        """
+        全选或全部取消勾选,包括已取回但尚未滚动显示的行
+        """
+        self._toggled = set()
+        self._inverted = checked
+        self._emit_check_changed(0, self._loaded - 1)
+
+    def all_checked(self):
+        return self._inverted and not self._toggled
+
+    def invert_checked(self):
+        """
+        反选
+        """
+        self._inverted = not self._inverted
+        self._emit_check_changed(0, self._loaded - 1)
+
+    def set_range_checked(self, first, last, checked):
+        """
+        勾选或取消勾选 first 到 last 行(包含两端)
+        """
+        first, last = max(first, 0), min(last, self._loaded - 1)
+        for row in range(first, last + 1):
+            self._set_checked(self._parts[row].product_drawing_number, checked)
+        self._emit_check_changed(first, last)
+
+    def checked_keys(self):
+        """
+        返回所有勾选零件的图号,只包括当前显示(符合筛选条件)的行
+        """
+        if not self._inverted:
+            return set(self._toggled)
+        return {part.product_drawing_number for part in self._parts
+                if part.product_drawing_number not in self._toggled}
+
+    def _fix_checked(self):
+        """
+        全选或反选后把勾选状态换算为勾选的图号集合,筛选条件变化后新显示出来的行不会被勾选
+        """
+        if self._inverted:
+            self._toggled = self.checked_keys()
+            self._inverted = False
+
+    def checked_parts(self):
+        keys = self.checked_keys()
+        return [part for part in self._parts if part.product_drawing_number in keys]
+
+    def _set_checked(self, drawing_number, checked):
+        if checked != self._inverted:
+            self._toggled.add(drawing_number)
+        else:
+            self._toggled.discard(drawing_number)
+
+    def _emit_check_changed(self, first, last):
+        if first > last:
+            return
+        self.dataChanged.emit(self.index(first, 0), self.index(last, 0), [Qt.CheckStateRole])
+
+    def _display_value(self, part, column):
+        value = getattr(part, self.FIELDS[column])
+        if column == 6:
+            return value.strftime("%Y-%m-%d") if value else ""
+        if column == 3 or column == 2:
+            return value or ""
+        return str(value)
+
+
+def _value_key(value):
+    """
+    混合类型值的排序键: 空值在前,其次数字(包括数字字符串)按数值,其余按字符串
+    """
+    if value is None or value == "":
+        return 0, 0, ""
+    if isinstance(value, (int, float)):
+        return 1, value, ""
+    if isinstance(value, str):
+        try:
+            return 1, float(value), ""
+        except ValueError:
+            return 2, 0, value
+    if isinstance(value, date):
+        return 1, value.toordinal(), ""
+    return 2, 0, str(value)
+
+
+class LogTableModel(QAbstractTableModel):
+    """
+    操作日志表格模型
+    """
+    COLUMNS = ["时间", "产品图号", "操作类型", "操作字段", "更改前值", "更改后值"]
+    FIELDS = ["time", "product_drawing_number", "operator_type", "operator_fields", "value_before_change",
+              "changed_value"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._logs = []
+        self._loaded = 0
+        self._fetch_next = None
+        self._fetching = False
+        self._cursor = None
+        self._generation = 0
+
+    def set_logs(self, logs, fetch_next=None):
+        """
+        :param logs: 全部日志,或倒序分页查询的第一页
+        :param fetch_next: 还有更早的日志时传入,滚动到底部时以 fetch_next((时间, 序号), generation) 请求下一页,
+                           结果通过 append_page 追加
+        """
+        self.beginResetModel()
+        self._logs = list(logs)
+        self._loaded = min(FETCH_BATCH_SIZE, len(self._logs))
+        self._fetch_next = fetch_next if self._logs else None
+        self._fetching = False
+        self._cursor = self._log_key(self._logs[-1]) if self._logs else None
+        self._generation += 1
+        self.endResetModel()
+
+    def append_page(self, logs, generation, has_more):
+        """
+        追加下一页更早的日志,generation 与当前数据不一致时说明已经重新查询,直接丢弃
+        """
+        if generation != self._generation:
+            return
+        self._fetching = False
+        if not has_more or not logs:
+            self._fetch_next = None
+        if not logs:
+            return
+        self._cursor = self._log_key(logs[-1])
+        self._logs.extend(logs)
+        self.beginInsertRows(QModelIndex(), self._loaded, len(self._logs) - 1)
+        self._loaded = len(self._logs)
+        self.endInsertRows()
+
+    def cancel_fetch(self, generation):
+        if generation == self._generation:
+            self._fetching = False
+
+    def has_more(self):
+        return self._fetch_next is not None
+
+    def total_count(self):
+        return len(self._logs)
+
+    @staticmethod
+    def _log_key(log):
+        # 倒序分页的游标: 本页最后一条的 (时间, 序号),本地排序后仍按查询顺序翻页
+        return log.time, log.id
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._loaded < len(self._logs) or (self._fetch_next is not None and not self._fetching)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH_SIZE, len(self._logs) - self._loaded)
+        if count <= 0:
+            if self._fetch_next is not None and not self._fetching:
+                self._fetching = True
+                self._fetch_next(self._cursor, self._generation)
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = getattr(self._logs[index.row()], self.FIELDS[index.column()])
+        return "" if value is None else str(value)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        只排序已取回的日志,更改前值和更改后值是数字时按数值排序
+        """
+        field = self.FIELDS[column]
+        self.layoutAboutToBeChanged.emit()
+        self._logs.sort(key=lambda log: _value_key(getattr(log, field)), reverse=order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
+
+class FrameTableModel(QAbstractTableModel):
+    """
+    只读显示 pandas DataFrame 的表格模型,索引作为第一列,用于统计报表
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._frame = None
+        self._columns = []
+        self._values = []
+
+    def set_frame(self, frame):
+        self.beginResetModel()
+        self._frame = frame.reset_index()
+        self._columns = [str(column) for column in self._frame.columns]
+        # 一次性转为按行的 Python 列表,data() 中不再逐格访问 DataFrame
+        self._values = self._frame.to_numpy(dtype=object).tolist()
+        self.endResetModel()
+
+    def frame(self):
+        return self._frame
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._values)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self._columns[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = self._values[index.row()][index.column()]
+        if value is None or value != value:  # NaN
+            return ""
+        if hasattr(value, 'date') and hasattr(value, 'hour'):
+            return str(value.date())
+        return str(value)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self._frame is None:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self._frame = self._frame.sort_values(self._frame.columns[column], ascending=order == Qt.AscendingOrder,
+                                              kind='mergesort', na_position='last')
+        self._values = self._frame.to_numpy(dtype=object).tolist()
+        self.layoutChanged.emit()
@@ -2,9 +2,10 @@ from PySide6.QtGui import QShortcut, QKeySequence
 from PySide6.QtWidgets import (QDateEdit, QLineEdit, QLabel,
                                QPushButton, QVBoxLayout, QWidget,
                                QMenu, QInputDialog, QMessageBox,
-                               QTableWidgetItem, QTableWidget, QPlainTextEdit, QHBoxLayout, QSplitter, QHeaderView,
-                               QCheckBox)
+                               QTableView, QHBoxLayout, QSplitter, QHeaderView,
+                               QCheckBox, QProgressBar)
 from PySide6.QtCore import QDate, Qt
+from widgets.log_panel import LogPanel
 from datetime import datetime, timedelta
 
 
@@ -27,20 +28,19 @@ class Widget(QWidget):
         self.get_stock_b = QPushButton("查询全部")  # 创建按钮“查询全部”
         # ---- 组件创建
 
-        self.tableWidget = QTableWidget()  # 创建表格控件
-        self.tableWidget.verticalHeader().setVisible(False)  # 隐藏表格垂直表头
-        self.tableWidget.horizontalHeader().setHighlightSections(False)  # 取消选中行高亮
-        self.tableWidget.setEditTriggers(QTableWidget.NoEditTriggers)  # 设置表格不可编辑
+        self.tableView = QTableView()  # 创建表格控件
+        self.tableView.verticalHeader().setVisible(False)  # 隐藏表格垂直表头
+        self.tableView.horizontalHeader().setHighlightSections(False)  # 取消选中行高亮
+        self.tableView.setEditTriggers(QTableView.NoEditTriggers)  # 设置表格不可编辑
 
 
-        # 创建一个文本编辑器来显示日志信息
-        self.log_editor = QPlainTextEdit("日志输出:")
-        self.log_editor.setReadOnly(True)  # 设置只读
+        # 创建日志窗口显示日志信息
+        self.log_panel = LogPanel()
 
         # 创建分隔器
         self.splitter = QSplitter(Qt.Horizontal)
-        self.splitter.addWidget(self.tableWidget)
-        self.splitter.addWidget(self.log_editor)
+        self.splitter.addWidget(self.tableView)
+        self.splitter.addWidget(self.log_panel)
 
         # 创建右键菜单
         self.context_menu = QMenu(self)
@@ -66,11 +66,24 @@ class Widget(QWidget):
 
         self.find_b = QPushButton("条件查询")  # 创建按钮“条件查询”
 
+        # 查询进行中显示的忙碌指示器
+        self.busy_indicator = QProgressBar()
+        self.busy_indicator.setRange(0, 0)  # 最小值和最大值都为0时显示为循环滚动的忙碌状态
+        self.busy_indicator.setMaximumWidth(80)
+        self.busy_indicator.setTextVisible(False)
+        self.busy_indicator.setVisible(False)
+
         # ---- 菜单栏按钮创建
         self.add_button = QPushButton("新增零件")
         self.batch_delete_button = QPushButton("批量删除")
         self.batch_storage_button = QPushButton("批量入库")
         self.batch_exit_button = QPushButton("批量出库")
+        self.check_all_button = QPushButton("全选")
+        self.invert_check_button = QPushButton("反选")
+        self.import_button = QPushButton("批量导入")
+        self.export_button = QPushButton("导出")
+        self.report_button = QPushButton("统计报表")
+        self.profiler_button = QPushButton("SQL统计")
         self.clear_button = QPushButton("清除日志")
 
         # ----查询栏按钮添加到查询div中
@@ -85,15 +98,22 @@ class Widget(QWidget):
         self.h_layout.addWidget(self.start_time_input)  # 添加开始日期编辑器到布局
         self.h_layout.addWidget(self.end_time_input)  # 添加结束日期编辑器到布局
         self.h_layout.addWidget(self.find_b)  # 添加“条件查询”按钮到布局
+        self.h_layout.addWidget(self.busy_indicator)  # 添加忙碌指示器到布局
 
         # ----列表明细和日志窗口添加到中间div中
         self.left_right_layout.addWidget(self.splitter)  # 添加分隔器到左右布局
 
         # ----菜单栏按钮添加到底部水平div中
         self.e_layout.addWidget(self.add_button)  # 添加日志清理按钮
+        self.e_layout.addWidget(self.check_all_button)  # 添加全选按钮
+        self.e_layout.addWidget(self.invert_check_button)  # 添加反选按钮
         self.e_layout.addWidget(self.batch_delete_button)  # 添加批量删除按钮
         self.e_layout.addWidget(self.batch_exit_button)  # 添加批量出库按钮
         self.e_layout.addWidget(self.batch_storage_button)  # 添加批量入库按钮
+        self.e_layout.addWidget(self.import_button)  # 添加批量导入按钮
+        self.e_layout.addWidget(self.export_button)  # 添加导出按钮
+        self.e_layout.addWidget(self.report_button)  # 添加统计报表按钮
+        self.e_layout.addWidget(self.profiler_button)  # 添加SQL统计按钮
         self.e_layout.addWidget(self.clear_button)  # 添加日志清楚按钮
 
         # ----整体布局添加到主布局和主窗口
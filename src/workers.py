@@ -0,0 +1,113 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+
+
+class WorkerSignals(QObject):
+    """
+    后台任务完成后通知主线程的信号
+    """
+    finished = Signal(int, object)  # 请求编号, 查询结果
+    failed = Signal(int, str)  # 请求编号, 错误信息
+
+
+class ProgressReporter(QObject):
+    """
+    后台任务汇报进度: 在工作线程中调用 progress.emit,槽函数在主线程执行
+    """
+    progress = Signal(object)
+
+
+class QueryWorker(QRunnable):
+    """
+    在线程池中执行一次数据库查询
+    """
+
+    def __init__(self, request_id, fn, *args, **kwargs):
+        super().__init__()
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, str(e))
+        else:
+            self.signals.finished.emit(self.request_id, result)
+
+
+class QueryRunner(QObject):
+    """
+    把 DAO 查询提交到线程池执行,结果通过信号回到主线程。
+    同一通道(channel)内只保留最新一次请求的结果,用户连续查询时旧请求的结果直接丢弃。
+    """
+    busy_changed = Signal(bool)  # 是否有查询正在执行
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self._next_id = 0
+        self._latest = {}  # 通道 -> 最新请求编号
+        self._pending = {}  # 请求编号 -> (通道, 任务, 成功回调, 失败回调)
+
+    def submit(self, channel, fn, *args, on_result=None, on_error=None, **kwargs):
+        """
+        提交查询任务,返回请求编号
+        :param channel: 通道名,同一通道的新请求会使旧请求作废
+        :param fn: 在后台线程执行的函数
+        :param on_result: 在主线程接收结果的回调
+        :param on_error: 在主线程接收错误信息的回调
+        """
+        self._next_id += 1
+        request_id = self._next_id
+
+        # 旧请求尚未开始执行时直接从线程池中取消
+        superseded = self._latest.get(channel)
+        if superseded in self._pending:
+            worker = self._pending[superseded][1]
+            if self.pool.tryTake(worker):
+                self._discard(superseded)
+
+        worker = QueryWorker(request_id, fn, *args, **kwargs)
+        worker.setAutoDelete(False)
+        worker.signals.finished.connect(self._on_finished)
+        worker.signals.failed.connect(self._on_failed)
+        was_busy = self.is_busy()
+        self._latest[channel] = request_id
+        self._pending[request_id] = (channel, worker, on_result, on_error)
+        self.pool.start(worker)
+        if not was_busy:
+            self.busy_changed.emit(True)
+        return request_id
+
+    def is_busy(self):
+        return bool(self._pending)
+
+    def is_busy_channel(self, channel):
+        return any(entry[0] == channel for entry in self._pending.values())
+
+    def is_current(self, request_id):
+        entry = self._pending.get(request_id)
+        return entry is not None and self._latest.get(entry[0]) == request_id
+
+    @Slot(int, object)
+    def _on_finished(self, request_id, result):
+        current = self.is_current(request_id)
+        entry = self._discard(request_id)
+        if current and entry[2] is not None:
+            entry[2](result)
+
+    @Slot(int, str)
+    def _on_failed(self, request_id, error):
+        current = self.is_current(request_id)
+        entry = self._discard(request_id)
+        if current and entry[3] is not None:
+            entry[3](error)
+
+    def _discard(self, request_id):
+        entry = self._pending.pop(request_id, None)
+        if entry is not None and not self._pending:
+            self.busy_changed.emit(False)
+        return entry
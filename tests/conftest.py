@@ -0,0 +1,24 @@
+"""
+测试共用的主库: 整个测试会话使用临时目录中的一个 sqlite 文件作为主库,关闭零件缓存和 SQL 统计日志
+"""
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+
+@pytest.fixture(scope='session')
+def primary(tmp_path_factory):
+    import data_dao
+    import migrations
+    directory = tmp_path_factory.mktemp('primary')
+    config_path = directory / 'config.ini'
+    config_path.write_text(f'[Database]\ndb_url = sqlite:///{directory / "primary.db"}\n\n'
+                           '[Cache]\ncache_size = 0\n\n[Profiling]\nenabled = false\n', encoding='utf-8')
+    data_dao.init(str(config_path))
+    migrations.upgrade()
+    yield data_dao.PartDAO()
+    data_dao.shutdown()
@@ -0,0 +1,113 @@
+"""
+本地副本与主库之间的推送、拉取、冲突和核对,主库和本地副本是两个 sqlite 文件
+"""
+import itertools
+from datetime import date
+
+import pytest
+
+from data_dao import VersionConflictError
+from data_model import Part
+from replica import Replica, ReplicaPartDAO, STATE_CONFLICT
+
+_numbers = itertools.count(1)
+
+
+def new_part(quantity=10, name='轴承'):
+    # 测试共用一个主库,每个零件使用不同的图号
+    return Part(product_drawing_number=f'R-{next(_numbers):05d}', name=name, no=1, inventory_quantity=quantity,
+                quantity_per_carton=5, a_group_total=0, b_group_total=0, update_time=date.today(),
+                id=f'replica-test-{next(_numbers)}')
+
+
+@pytest.fixture
+def local(primary, tmp_path):
+    replica = Replica(str(tmp_path / 'replica.db'), primary_dao=primary, chunk_size=50)
+    yield replica
+    replica.close()
+
+
+def test_pull_copies_primary_parts(primary, local):
+    part = primary.add_part(new_part(7))
+    assert local.sync()
+    copied = ReplicaPartDAO(local).get_part_by_drawing_number(part.product_drawing_number)
+    assert copied.inventory_quantity == 7
+    assert copied.version == part.version
+    assert local.initialized()
+
+
+def test_local_writes_are_pushed(primary, local):
+    dao = ReplicaPartDAO(local)
+    added = dao.add_part(new_part(3))
+    dao.move_stock(added.product_drawing_number, 4)
+    assert local.statistics()['pending'] == 2
+    # 本地写入不经过主库
+    assert primary.get_part_by_drawing_number(added.product_drawing_number) is None
+    assert local.sync()
+    assert local.statistics()['pending'] == 0
+    pushed = primary.get_part_by_drawing_number(added.product_drawing_number)
+    assert pushed.inventory_quantity == 7
+    # 同步后本地与主库的版本号相同,下一次拉取不再覆盖
+    assert dao.get_part_by_drawing_number(added.product_drawing_number).version == pushed.version
+
+
+def test_remote_changes_are_pulled(primary, local):
+    part = primary.add_part(new_part(5))
+    local.sync()
+    primary.move_stock(part.product_drawing_number, -2)
+    local.sync()
+    assert ReplicaPartDAO(local).get_part_by_drawing_number(part.product_drawing_number).inventory_quantity == 3
+
+
+def test_update_conflict_restores_primary_value(primary, local):
+    part = primary.add_part(new_part(5, name='齿轮'))
+    local.sync()
+    dao = ReplicaPartDAO(local)
+    edited = dao.get_part_by_drawing_number(part.product_drawing_number)
+    edited.name = '本地修改'
+    dao.update_part(edited)
+    # 同步之前其他终端修改了同一个零件
+    remote = primary.get_part_by_drawing_number(part.product_drawing_number)
+    remote.name = '其他终端修改'
+    primary.update_part(remote)
+
+    messages = []
+    local.add_listener(messages.append)
+    assert local.sync()
+    conflicts = local.outbox(STATE_CONFLICT)
+    assert [entry.product_drawing_number for entry in conflicts] == [part.product_drawing_number]
+    assert any('同步冲突' in message for message in messages)
+    # 主库保留其他终端的修改,本地恢复为主库的值
+    assert primary.get_part_by_drawing_number(part.product_drawing_number).name == '其他终端修改'
+    assert dao.get_part_by_drawing_number(part.product_drawing_number).name == '其他终端修改'
+    local.discard([entry.id for entry in conflicts])
+    assert local.statistics()['conflicts'] == 0
+
+
+def test_stale_local_edit_is_rejected_before_queueing(primary, local):
+    part = primary.add_part(new_part())
+    local.sync()
+    dao = ReplicaPartDAO(local)
+    with pytest.raises(VersionConflictError):
+        dao.update_part(dao.get_part_by_drawing_number(part.product_drawing_number),
+                        expected_version=part.version + 1)
+    assert local.statistics()['pending'] == 0
+
+
+def test_reconcile_removes_parts_deleted_on_primary(primary, local):
+    part = primary.add_part(new_part())
+    local.sync()
+    primary.delete_part_by_drawing_number(part.product_drawing_number)
+    # 删除不改变任何零件的上次更改日期,只有核对能发现
+    local.pull()
+    assert ReplicaPartDAO(local).get_part_by_drawing_number(part.product_drawing_number) is not None
+    local.reconcile()
+    assert ReplicaPartDAO(local).get_part_by_drawing_number(part.product_drawing_number) is None
+
+
+def test_local_delete_is_pushed(primary, local):
+    part = primary.add_part(new_part())
+    local.sync()
+    ReplicaPartDAO(local).delete_part_by_drawing_number(part.product_drawing_number)
+    assert local.sync()
+    assert primary.get_part_by_drawing_number(part.product_drawing_number) is None
@@ -0,0 +1,38 @@
+"""
+批量出入库: 库存不足或零件不存在时整体回滚
+"""
+import pytest
+
+from data_dao import PartNotFoundError, InsufficientStockError
+from replica import Replica, ReplicaPartDAO
+from test_replica import new_part
+
+
+def test_adjust_quantities_rolls_back_when_a_part_is_missing(primary):
+    part = primary.add_part(new_part(6))
+    with pytest.raises(PartNotFoundError) as error:
+        primary.adjust_quantities({part.product_drawing_number: 1, 'MISSING-1': 5})
+    assert error.value.drawing_number == 'MISSING-1'
+    assert primary.get_part_by_drawing_number(part.product_drawing_number).inventory_quantity == 6
+
+
+def test_adjust_quantities_rolls_back_on_insufficient_stock(primary):
+    first, second = primary.add_part(new_part(6)), primary.add_part(new_part(1))
+    with pytest.raises(InsufficientStockError):
+        primary.adjust_quantities({first.product_drawing_number: -2, second.product_drawing_number: -2})
+    assert primary.get_part_by_drawing_number(first.product_drawing_number).inventory_quantity == 6
+    assert primary.adjust_quantities({first.product_drawing_number: -2}) == {first.product_drawing_number: 4}
+
+
+def test_replica_adjust_quantities_rolls_back_when_a_part_is_missing(primary, tmp_path):
+    local = Replica(str(tmp_path / 'replica.db'), primary_dao=primary)
+    try:
+        part = primary.add_part(new_part(6))
+        local.sync()
+        dao = ReplicaPartDAO(local)
+        with pytest.raises(PartNotFoundError):
+            dao.adjust_quantities({part.product_drawing_number: 1, 'MISSING-2': 5})
+        assert dao.get_part_by_drawing_number(part.product_drawing_number).inventory_quantity == 6
+        assert local.statistics()['pending'] == 0
+    finally:
+        local.close()